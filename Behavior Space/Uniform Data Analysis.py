@@ -3,12 +3,26 @@ import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
+from matplotlib import cbook
 from mpl_toolkits.mplot3d import Axes3D
+from paired_stats import paired_differences
+from results_store import ResultsStore, DEFAULT_STORE_FILE, METRIC_COLUMNS, PARAMETER_COLUMNS
+from run_data import cell_totals
+
+# Columns of the per-cell totals the statistics are computed from
+CELL_COLUMNS = ['site_selection_mode', 'battle_outcome']
 
 class IrpinDataAnalyzer:
     """Class for analyzing battle data of the Irpin River."""
     
-    def __init__(self, script_dir=None):
+    def __init__(self, script_dir=None, store=None):
+        """Initializes the analyzer.
+
+        Args:
+            script_dir: Directory holding the data folders.
+            store: ResultsStore (or the path of one) to query the run table
+                through instead of reading the CSV file.
+        """
         if script_dir is None:
             self.script_dir = os.path.dirname(os.path.abspath(__file__))
         else:
@@ -23,8 +37,11 @@ class IrpinDataAnalyzer:
             print(f"Current directory: {os.getcwd()}")
             print(f"Available directories: {[d for d in os.listdir(self.script_dir) if os.path.isdir(os.path.join(self.script_dir, d))]}")
         
-        self.data = None
+        self.data = None  # Runs (CSV files only)
+        self.cells = None  # Per-cell totals over CELL_COLUMNS (see run_data.cell_totals)
+        self.table = None  # Table queried from the results store
         self.statistics = {}
+        self.store = ResultsStore(store) if isinstance(store, str) else store
 
     def preprocess_csv_files(self, file1=None):
         if file1 is None:
@@ -47,6 +64,21 @@ class IrpinDataAnalyzer:
                 file1 = os.path.join(self.output_dir, "IrpinModel Vary Site-Selection Artillery Active-table.csv")
                 print(f"No table CSV files found, attempting to use default: {file1}")
         
+        if self.store is not None:
+            # The store always has the required columns, and computes every aggregate itself
+            print(f"Loading cell totals of {file1} from the results store {self.store.path}.")
+            try:
+                if self.store.ingest(file1):
+                    print("Ingested the table into the results store.")
+                self.table = file1
+                self.cells = self.store.totals(CELL_COLUMNS, table=file1)
+            except Exception as e:
+                print(f"Error querying the results store: {e}")
+                return False
+            print("----- Cell Totals (Head) -----")
+            print(self.cells.head())
+            return True
+
         print("Starting CSV file preprocessing.")
         try:
             # Try different skiprows values if needed
@@ -79,14 +111,66 @@ class IrpinDataAnalyzer:
             print("Available columns:", self.data.columns.tolist())
             return False
             
+        self.cells = cell_totals(self.data, CELL_COLUMNS)
         return True
 
+    def available_columns(self):
+        """Columns of the loaded runs (for the results store, of the queried table)."""
+        if self.store is not None:
+            return list(PARAMETER_COLUMNS) + list(METRIC_COLUMNS) + self.store.extra_columns(self.table)
+        return self.data.columns.tolist()
+
+    def _run_values(self, name):
+        """Per-run values of a metric, 'win' (100 for a victory) or 'casualty_pct', from the loaded runs."""
+        if name == 'win':
+            return (self.data['battle_outcome'] == 'Victory').astype(int) * 100
+        if name == 'casualty_pct':
+            return (self.data['total_infantry_casualties_10'] / self.data['total_infantry_used']) * 100
+        return self.data[name]
+
+    def _means(self, name):
+        """Mean of a metric, 'win' or 'casualty_pct' for each site selection mode, modes sorted."""
+        if self.store is not None:
+            means = self.store.means([name], 'site_selection_mode', table=self.table)
+            return means.set_index('site_selection_mode')[name].sort_index()
+        return self._run_values(name).groupby(self.data['site_selection_mode']).mean()
+
+    def _medians(self, name):
+        """Median of a metric for each site selection mode."""
+        if self.store is not None:
+            medians = self.store.quantiles(name, 'site_selection_mode', [0.5], table=self.table)
+            return dict(zip(medians['site_selection_mode'], medians[0.5]))
+        return self.data.groupby('site_selection_mode')[name].median().to_dict()
+
+    def _boxplot(self, ax, name, palette):
+        """Box plot of a metric, 'win' or 'casualty_pct' by site selection mode, from its box statistics."""
+        if self.store is not None:
+            stats = self.store.box_stats(name, 'site_selection_mode', table=self.table)
+        else:
+            values = self._run_values(name)
+            stats = [cbook.boxplot_stats(group.dropna().to_numpy(), labels=[mode])[0]
+                     for mode, group in values.groupby(self.data['site_selection_mode'], sort=False)]
+        # Drawn the way seaborn's boxplot draws them
+        colors = sns.color_palette(palette, len(stats))
+        line = {'color': '0.2'}
+        boxes = ax.bxp(stats, positions=range(len(stats)), widths=0.8, patch_artist=True, boxprops={'edgecolor': '0.2'},
+                       whiskerprops=line, capprops=line, medianprops=line,
+                       flierprops={'marker': 'o', 'markerfacecolor': 'none', 'markeredgecolor': '0.2'})
+        for box, color in zip(boxes['boxes'], colors):
+            box.set_facecolor(sns.desaturate(color, 0.75))
+        ax.grid(False, axis='x')
+
     # Column name mapping dictionary defined as class variable
     COLUMN_NAME_MAPPING = {
         'infantry-casualties': 'total_infantry_casualties_10',
         'infantry-crossed': 'total_infantry_crossed',
         'infantry-used': 'total_infantry_used',
         'pontoons-used': 'total_pontoons_used',
+        # Reporter names as written by BehaviorSpace
+        'total-infantry-casualties / 10': 'total_infantry_casualties_10',
+        'total-infantry-crossed': 'total_infantry_crossed',
+        'total-infantry-used': 'total_infantry_used',
+        'total-pontoons-used': 'total_pontoons_used',
         'site-selection-mode': 'site_selection_mode',
         'battle-outcome': 'battle_outcome'
     }
@@ -163,7 +247,7 @@ class IrpinDataAnalyzer:
     
     def calculate_statistics(self):
         """Calculate basic statistical information (converted from MATLAB code)"""
-        if self.data is None:
+        if self.cells is None:
             print("Data not loaded. Please run preprocess_csv_files() first.")
             return False
             
@@ -173,14 +257,15 @@ class IrpinDataAnalyzer:
         required_columns = ['site_selection_mode', 'battle_outcome', 
                            'total_infantry_casualties_10', 'total_infantry_used']
         
-        missing_columns = [col for col in required_columns if col not in self.data.columns]
+        missing_columns = [col for col in required_columns if col not in self.cells.columns]
         if missing_columns:
             print(f"Error: Missing required columns for statistics calculation: {missing_columns}")
             return False
         
         # Get unique site selection modes and battle outcomes
-        site_modes = self.data['site_selection_mode'].unique()
-        battle_outcomes = self.data['battle_outcome'].unique()
+        site_modes = self.cells['site_selection_mode'].unique()
+        battle_outcomes = self.cells['battle_outcome'].unique()
+        mode_totals = self.cells.groupby('site_selection_mode', sort=False).sum(numeric_only=True)
         
         if len(site_modes) == 0:
             print("Warning: No unique site selection modes found")
@@ -192,20 +277,18 @@ class IrpinDataAnalyzer:
         # Calculate win rate for each site selection mode
         win_rate = {}
         for mode in site_modes:
-            idx = self.data['site_selection_mode'] == mode
-            if idx.sum() > 0:  # Ensure we have data for this mode
-                victories = self.data[idx]['battle_outcome'] == 'Victory'
-                win_rate[mode] = (victories.sum() / idx.sum()) * 100
+            runs = mode_totals.loc[mode, 'runs']
+            if runs > 0:  # Ensure we have data for this mode
+                win_rate[mode] = (mode_totals.loc[mode, 'victories'] / runs) * 100
             else:
                 win_rate[mode] = 0
         
         # Calculate casualty rate for each site selection mode
         casualty_rate = {}
         for mode in site_modes:
-            idx = self.data['site_selection_mode'] == mode
-            if idx.sum() > 0:
-                total_casualties = self.data.loc[idx, 'total_infantry_casualties_10'].sum()
-                total_used = self.data.loc[idx, 'total_infantry_used'].sum()
+            if mode_totals.loc[mode, 'runs'] > 0:
+                total_casualties = mode_totals.loc[mode, 'total_infantry_casualties_10']
+                total_used = mode_totals.loc[mode, 'total_infantry_used']
                 if total_used > 0:
                     casualty_rate[mode] = (total_casualties / total_used) * 100
                 else:
@@ -213,17 +296,21 @@ class IrpinDataAnalyzer:
             else:
                 casualty_rate[mode] = 0
         
-        # Calculate casualty rate for each row
-        row_casualty_rate = (self.data['total_infantry_casualties_10'] / self.data['total_infantry_used']) * 100
+        # Calculate casualty rate for each row (only the CSV file loads the rows)
+        row_casualty_rate = self._run_values('casualty_pct') if self.data is not None else None
         
         # Check if 'ticks' column exists for sorting
-        if 'ticks' in self.data.columns:
-            # Sort by ticks
-            sorted_indices = self.data['ticks'].argsort()
-            sorted_ticks = self.data['ticks'].iloc[sorted_indices]
-            sorted_used = self.data['total_infantry_used'].iloc[sorted_indices]
-            sorted_crossed = self.data['total_infantry_crossed'].iloc[sorted_indices] if 'total_infantry_crossed' in self.data.columns else pd.Series([0] * len(sorted_indices))
-            sorted_casualties = self.data['total_infantry_casualties_10'].iloc[sorted_indices]
+        if 'ticks' in self.cells.columns:
+            # Totals at every tick count, sorted by ticks
+            if self.store is not None:
+                tick_totals = self.store.totals('ticks', table=self.table)
+            else:
+                tick_totals = cell_totals(self.data, 'ticks')
+            tick_totals = tick_totals.sort_values('ticks').reset_index(drop=True)
+            sorted_ticks = tick_totals['ticks']
+            sorted_used = tick_totals['total_infantry_used']
+            sorted_crossed = tick_totals['total_infantry_crossed'] if 'total_infantry_crossed' in tick_totals.columns else pd.Series([0] * len(tick_totals))
+            sorted_casualties = tick_totals['total_infantry_casualties_10']
             
             cum_used = np.cumsum(sorted_used)
             cum_crossed = np.cumsum(sorted_crossed)
@@ -249,20 +336,23 @@ class IrpinDataAnalyzer:
         median_crossed = {}
         mean_casualties = {}
         median_casualties = {}
+        has_crossed = 'total_infantry_crossed' in self.cells.columns
+        medians = {col: self._medians(col) for col in ['total_infantry_used', 'total_infantry_casualties_10']
+                   + (['total_infantry_crossed'] if has_crossed else [])}
         
         for mode in site_modes:
-            idx = self.data['site_selection_mode'] == mode
+            runs = mode_totals.loc[mode, 'runs']
             
-            if idx.sum() > 0:
-                mean_used[mode] = self.data.loc[idx, 'total_infantry_used'].mean()
-                median_used[mode] = self.data.loc[idx, 'total_infantry_used'].median()
+            if runs > 0:
+                mean_used[mode] = mode_totals.loc[mode, 'total_infantry_used'] / runs
+                median_used[mode] = medians['total_infantry_used'][mode]
                 
-                if 'total_infantry_crossed' in self.data.columns:
-                    mean_crossed[mode] = self.data.loc[idx, 'total_infantry_crossed'].mean()
-                    median_crossed[mode] = self.data.loc[idx, 'total_infantry_crossed'].median()
+                if has_crossed:
+                    mean_crossed[mode] = mode_totals.loc[mode, 'total_infantry_crossed'] / runs
+                    median_crossed[mode] = medians['total_infantry_crossed'][mode]
                 
-                mean_casualties[mode] = self.data.loc[idx, 'total_infantry_casualties_10'].mean()
-                median_casualties[mode] = self.data.loc[idx, 'total_infantry_casualties_10'].median()
+                mean_casualties[mode] = mode_totals.loc[mode, 'total_infantry_casualties_10'] / runs
+                median_casualties[mode] = medians['total_infantry_casualties_10'][mode]
             else:
                 mean_used[mode] = median_used[mode] = 0
                 mean_crossed[mode] = median_crossed[mode] = 0
@@ -274,17 +364,15 @@ class IrpinDataAnalyzer:
         sum_casualties = {}
         
         for mode in site_modes:
-            idx = self.data['site_selection_mode'] == mode
-            
-            if idx.sum() > 0:
-                sum_used[mode] = self.data.loc[idx, 'total_infantry_used'].sum()
+            if mode_totals.loc[mode, 'runs'] > 0:
+                sum_used[mode] = mode_totals.loc[mode, 'total_infantry_used']
                 
-                if 'total_infantry_crossed' in self.data.columns:
-                    sum_crossed[mode] = self.data.loc[idx, 'total_infantry_crossed'].sum()
+                if has_crossed:
+                    sum_crossed[mode] = mode_totals.loc[mode, 'total_infantry_crossed']
                 else:
                     sum_crossed[mode] = 0
                     
-                sum_casualties[mode] = self.data.loc[idx, 'total_infantry_casualties_10'].sum()
+                sum_casualties[mode] = mode_totals.loc[mode, 'total_infantry_casualties_10']
             else:
                 sum_used[mode] = sum_crossed[mode] = sum_casualties[mode] = 0
             
@@ -318,33 +406,27 @@ class IrpinDataAnalyzer:
     
     def create_boxplots(self):
         """Create box plots for success ratio and casualty ratio by site selection mode"""
-        if self.data is None or not self.statistics:
+        if self.cells is None or not self.statistics:
             print("Data or statistics not available. Please run preprocess_csv_files and calculate_statistics first.")
             return
             
         print("Creating boxplots for success and casualty ratios...")
         
-        # Calculate row-wise success indicator (1 for Victory, 0 for Retreat)
-        self.data['success'] = (self.data['battle_outcome'] == 'Victory').astype(int) * 100
-        
-        # Calculate row-wise casualty ratio
-        self.data['casualty_ratio'] = (self.data['total_infantry_casualties_10'] / self.data['total_infantry_used']) * 100
-        
         # Set figure style
         plt.style.use('seaborn-v0_8-whitegrid')
         
         # Create figure with two subplots
         fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(20, 8))
         
-        # Box plot for success ratio
-        sns.boxplot(x='site_selection_mode', y='success', data=self.data, ax=ax1, palette='YlGn')
+        # Box plot for success ratio (row-wise: 100 for Victory, 0 for Retreat)
+        self._boxplot(ax1, 'win', 'YlGn')
         ax1.set_title('Success Ratio by Site Selection Mode', fontsize=16, fontweight='bold')
         ax1.set_xlabel('Site Selection Mode', fontsize=14)
         ax1.set_ylabel('Success Ratio (%)', fontsize=14)
         ax1.set_ylim(-5, 105)
         
-        # Box plot for casualty ratio
-        sns.boxplot(x='site_selection_mode', y='casualty_ratio', data=self.data, ax=ax2, palette='YlOrRd')
+        # Box plot for row-wise casualty ratio
+        self._boxplot(ax2, 'casualty_pct', 'YlOrRd')
         ax2.set_title('Casualty Ratio by Site Selection Mode', fontsize=16, fontweight='bold')
         ax2.set_xlabel('Site Selection Mode', fontsize=14)
         ax2.set_ylabel('Casualty Ratio (%)', fontsize=14)
@@ -414,24 +496,23 @@ class IrpinDataAnalyzer:
     
     def create_site_selection_comparison_plots(self):
         """Create bar and box plots for each metric by site selection mode"""
-        if self.data is None:
+        if self.cells is None:
             print("No data. Please run preprocess_csv_files() first.")
             return
 
-        df = self.data.copy()
-        df['win'] = (df['battle_outcome'] == 'Victory').astype(int) * 100
-        df['casualty_pct'] = (df['total_infantry_casualties_10'] / df['total_infantry_used']) * 100
+        # The cell totals carry every metric the runs have
+        columns = self.cells.columns
 
         # Add only existing columns to metrics
         metrics = [
             ('win', 'Win %', 'Win%'),
             ('casualty_pct', 'Casualty %', 'Casualty%'),
         ]
-        if 'total_infantry_used' in df.columns:
+        if 'total_infantry_used' in columns:
             metrics.append(('total_infantry_used', '# Troops Used', 'Troops Used'))
-        if 'total_pontoons_used' in df.columns:
+        if 'total_pontoons_used' in columns:
             metrics.append(('total_pontoons_used', '# Pontoons Used', 'Pontoons Used'))
-        if 'ticks' in df.columns:
+        if 'ticks' in columns:
             metrics.append(('ticks', 'Ticks', 'Ticks'))
 
         import matplotlib.pyplot as plt
@@ -440,7 +521,7 @@ class IrpinDataAnalyzer:
 
         for col, ylabel, title in metrics:
             plt.figure(figsize=(14, 6))
-            means = df.groupby('site_selection_mode')[col].mean()
+            means = self._means(col)
             sns.barplot(x=means.index, y=means.values, palette='viridis')
             plt.ylabel(ylabel, fontsize=14)
             plt.xlabel('Site Selection Mode', fontsize=14)
@@ -453,7 +534,7 @@ class IrpinDataAnalyzer:
             plt.close()
 
             plt.figure(figsize=(14, 6))
-            sns.boxplot(x='site_selection_mode', y=col, data=df, palette='viridis')
+            self._boxplot(plt.gca(), col, 'viridis')
             plt.ylabel(ylabel, fontsize=14)
             plt.xlabel('Site Selection Mode', fontsize=14)
             plt.title(f'Site-Selection vs. {title} (Boxplot)', fontsize=16, fontweight='bold')
@@ -466,23 +547,22 @@ class IrpinDataAnalyzer:
 
     def create_individual_site_selection_plots(self):
         """Create individual bar and box plots for each metric by site selection mode"""
-        if self.data is None:
+        if self.cells is None:
             print("No data. Please run preprocess_csv_files() first.")
             return
 
-        df = self.data.copy()
-        df['win'] = (df['battle_outcome'] == 'Victory').astype(int) * 100
-        df['casualty_pct'] = (df['total_infantry_casualties_10'] / df['total_infantry_used']) * 100
+        # The cell totals carry every metric the runs have
+        columns = self.cells.columns
 
         metrics = [
             ('win', 'Win %', 'Win%'),
             ('casualty_pct', 'Casualty %', 'Casualty%'),
         ]
-        if 'total_infantry_used' in df.columns:
+        if 'total_infantry_used' in columns:
             metrics.append(('total_infantry_used', '# Troops Used', 'Troops Used'))
-        if 'total_pontoons_used' in df.columns:
+        if 'total_pontoons_used' in columns:
             metrics.append(('total_pontoons_used', '# Pontoons Used', 'Pontoons Used'))
-        if 'ticks' in df.columns:
+        if 'ticks' in columns:
             metrics.append(('ticks', 'Ticks', 'Ticks'))
 
         plt.style.use('seaborn-v0_8-whitegrid')
@@ -490,7 +570,7 @@ class IrpinDataAnalyzer:
         for col, ylabel, title in metrics:
             # Bar plot
             plt.figure(figsize=(10, 6))
-            means = df.groupby('site_selection_mode')[col].mean()
+            means = self._means(col)
             sns.barplot(x=means.index, y=means.values, palette='viridis')
             plt.ylabel(ylabel, fontsize=14)
             plt.xlabel('Site Selection Mode', fontsize=14)
@@ -504,7 +584,7 @@ class IrpinDataAnalyzer:
 
             # Box plot
             plt.figure(figsize=(10, 6))
-            sns.boxplot(x='site_selection_mode', y=col, data=df, palette='viridis')
+            self._boxplot(plt.gca(), col, 'viridis')
             plt.ylabel(ylabel, fontsize=14)
             plt.xlabel('Site Selection Mode', fontsize=14)
             plt.title(f'Site-Selection vs. {title} (Boxplot)', fontsize=16, fontweight='bold')
@@ -515,6 +595,77 @@ class IrpinDataAnalyzer:
             print(f"Saved boxplot: {out_box}")
             plt.close()
 
+    def calculate_paired_differences(self, baseline_mode=None, pair_column='crn-replicate'):
+        """Calculate paired differences between site selection modes for common-random-numbers runs.
+
+        Runs of different modes sharing the same CRN replicate index saw the
+        same artillery draws, so differences are taken within each replicate.
+
+        Args:
+            baseline_mode: Mode every other mode is compared against.
+                Defaults to the mode with the highest win rate.
+            pair_column: Column holding the replicate index.
+
+        Returns:
+            A dictionary of paired-difference tables, or None if the data has no pairs.
+        """
+        if self.cells is None:
+            print("No data. Please run preprocess_csv_files() first.")
+            return None
+        if pair_column not in self.available_columns():
+            print(f"Column '{pair_column}' not found; paired statistics need a CRN experiment table.")
+            return None
+
+        if self.store is not None:
+            # Only the columns the pairs need
+            df = self.store.runs(table=self.table, extra=[pair_column],
+                                 columns=['total_infantry_casualties_10', 'total_infantry_used'])
+        else:
+            df = self.data.copy()
+        df['win'] = (df['battle_outcome'] == 'Victory').astype(int) * 100
+        df['casualty_pct'] = (df['total_infantry_casualties_10'] / df['total_infantry_used']) * 100
+
+        if baseline_mode is None:
+            baseline_mode = df.groupby('site_selection_mode')['win'].mean().idxmax()
+
+        paired = {'baseline': baseline_mode}
+        for col in ['win', 'casualty_pct']:
+            paired[col] = paired_differences(df, pair_column, 'site_selection_mode', col, baseline_mode)
+            print(f"\nPaired differences in {col} against '{baseline_mode}':")
+            print(paired[col][['group', 'n_pairs', 'mean_diff', 'ci_low', 'ci_high', 'variance_reduction']])
+
+        self.statistics['paired_differences'] = paired
+        return paired
+
+    def create_paired_difference_chart(self):
+        """Create bar charts of paired differences (with confidence intervals) against the baseline mode"""
+        paired = self.statistics.get('paired_differences')
+        if not paired:
+            print("Paired differences not available. Please run calculate_paired_differences first.")
+            return
+
+        plt.style.use('seaborn-v0_8-whitegrid')
+        fig, axes = plt.subplots(1, 2, figsize=(20, 8))
+
+        for ax, (col, label) in zip(axes, [('win', 'Win %'), ('casualty_pct', 'Casualty %')]):
+            table = paired[col]
+            x = np.arange(len(table))
+            errors = [table['mean_diff'] - table['ci_low'], table['ci_high'] - table['mean_diff']]
+            colors = ['#2ecc71' if v >= 0 else '#e74c3c' for v in table['mean_diff']]
+            ax.bar(x, table['mean_diff'], yerr=errors, capsize=4, color=colors, edgecolor='black')
+            ax.axhline(0, color='black', linewidth=0.8)
+            ax.set_xticks(x)
+            ax.set_xticklabels(table['group'], rotation=45, ha='right')
+            ax.set_xlabel('Site Selection Mode', fontsize=14)
+            ax.set_ylabel(f'{label} difference (paired)', fontsize=14)
+            ax.set_title(f"{label} vs. '{paired['baseline']}'", fontsize=16, fontweight='bold')
+
+        plt.tight_layout()
+        output_file = os.path.join(self.output_dir, "Site_Selection_Paired_Differences.png")
+        plt.savefig(output_file, dpi=300, bbox_inches='tight')
+        print(f"Paired difference chart saved to {output_file}")
+        plt.close(fig)
+
     def create_visualizations(self):
         """Create all visualizations at once"""
         if not self.statistics:
@@ -535,6 +686,10 @@ class IrpinDataAnalyzer:
         # Create individual plots
         self.create_individual_site_selection_plots()
         
+        # Create paired comparison chart (CRN tables only)
+        if 'paired_differences' in self.statistics:
+            self.create_paired_difference_chart()
+
         print("All visualizations completed.")
         return True
     
@@ -542,14 +697,18 @@ def main():
     """Main function to execute the analysis."""
     print("Starting Irpin River battle data analysis...")
     
-    # Initialize the analyzer
-    analyzer = IrpinDataAnalyzer()
+    # Initialize the analyzer (querying the results store when one has been built)
+    analyzer = IrpinDataAnalyzer(store=DEFAULT_STORE_FILE if os.path.exists(DEFAULT_STORE_FILE) else None)
     
     # Preprocess the data - explicitly specify the table file
     table_file = os.path.join(analyzer.output_dir, "IrpinModel Vary Site-Selection Artillery Active-table.csv")
     if analyzer.preprocess_csv_files(table_file):
         # Calculate statistics
         if analyzer.calculate_statistics():
+            # Paired statistics for common-random-numbers tables
+            if 'crn-replicate' in analyzer.available_columns():
+                analyzer.calculate_paired_differences()
+
             # Generate all visualizations
             analyzer.create_visualizations()
             print("Analysis completed successfully.")
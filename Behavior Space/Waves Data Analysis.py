@@ -5,13 +5,28 @@ import matplotlib.pyplot as plt
 from mpl_toolkits.mplot3d import Axes3D  # For 3D plotting
 import matplotlib
 matplotlib.use('Agg')
+from paired_stats import paired_differences
+from run_data import best_summary_cell, cell_totals, read_run_table, summarize_totals
+from results_store import ResultsStore, DEFAULT_STORE_FILE
+from pareto import ParetoFront, plot_front
+from cell_charts import plot_wave_heatmaps, plot_win_rates
+
+
+# Columns of the per-cell totals every statistic and chart is computed from
+CELL_COLUMNS = ['site_selection_mode', 'wave-pause', 'wave-duration', 'battle_outcome']
 
 
 class IrpinDataAnalyzer:
     """Class for analyzing battle data of the Irpin River."""
     
-    def __init__(self, script_dir=None):
-        """Initialization method."""
+    def __init__(self, script_dir=None, store=None):
+        """Initialization method.
+
+        Args:
+            script_dir: Directory holding the data folders.
+            store: ResultsStore (or the path of one) to query the run tables
+                through instead of reading the CSV files.
+        """
         if script_dir is None:
             self.script_dir = os.path.dirname(os.path.abspath(__file__))
         else:
@@ -20,15 +35,54 @@ class IrpinDataAnalyzer:
         self.output_dir = os.path.join(self.script_dir, "Waves - with Artillery")
         self.data_file = os.path.join(self.output_dir, "Waves_Data_Combined_Final.csv")  # Updated to use the provided file
         self.uniform_file = os.path.join(self.script_dir, 'Uniform - with Artillery', 'IrpinModel Vary Site-Selection Artillery Active-table.csv')
-        self.data = None  # Variable to store the loaded data
+        self.crn_file = os.path.join(self.output_dir, 'IrpinModel Waves vs Uniform CRN-table.csv')  # Paired Waves/Uniform runs (crn-mode? on)
+        self.data = None  # Variable to store the loaded data (CSV files only)
+        self.cells = None  # Per-cell totals over CELL_COLUMNS (see run_data.cell_totals)
         self.statistics = {}  # Dictionary to store computed statistics
+        self.store = ResultsStore(store) if isinstance(store, str) else store
+
+    def _store_totals(self, path, by, **filters):
+        """Per-cell totals of one table computed by the results store (ingested on first use), with this analyzer's column names."""
+        if self.store.ingest(path):
+            print(f"Ingested {path} into the results store.")
+        by = [{'wave-pause': 'wave_pause', 'wave-duration': 'wave_duration'}.get(col, col) for col in by]
+        totals = self.store.totals(by, table=path, **filters)
+        return totals.rename(columns={'wave_pause': 'wave-pause', 'wave_duration': 'wave-duration'})
+
+    def _totals(self, by):
+        """The cell totals pooled into coarser cells, in order of first appearance."""
+        return self.cells.groupby(by, sort=False).sum(numeric_only=True).reset_index()
+
+    def _wave_cell(self, pause, duration):
+        """Totals per site selection mode of one (wave-pause, wave-duration) cell."""
+        cell = self.cells[(self.cells['wave-pause']==pause) & (self.cells['wave-duration']==duration)]
+        return cell.groupby('site_selection_mode', sort=False).sum(numeric_only=True).reset_index()
+
+    def _medians(self, column):
+        """Median of a run metric for each site selection mode."""
+        if self.store is not None:
+            medians = self.store.quantiles(column, 'site_selection_mode', [0.5], table=self.data_file)
+            return dict(zip(medians['site_selection_mode'], medians[0.5]))
+        return self.data.groupby('site_selection_mode')[column].median().to_dict()
 
     def load_data(self):
-        """Loads the combined data from the provided CSV file."""
+        """Loads the combined data from the provided CSV file (or a BehaviorSpace table file)."""
+        if self.store is not None:
+            print(f"Loading cell totals from the results store {self.store.path}.")
+            try:
+                self.cells = self._store_totals(self.data_file, CELL_COLUMNS)
+                print("Data successfully loaded.")
+            except Exception as e:
+                print(f"An error occurred while loading the data: {e}")
+                self.cells = None
+            return
         print("Loading data from the combined CSV file.")
         try:
             # Load the data
-            self.data = pd.read_csv(self.data_file)
+            self.data = read_run_table(self.data_file)
+            # BehaviorSpace tables report the duration both as [step] and as the ticks metric
+            if '[step]' in self.data.columns and 'ticks' in self.data.columns:
+                self.data = self.data.drop(columns='ticks')
             # Rename columns to use snake_case internal names
             self.data.rename(columns={
                 'site-selection-mode': 'site_selection_mode',
@@ -37,15 +91,21 @@ class IrpinDataAnalyzer:
                 'infantry-casualties': 'total_infantry_casualties_10',
                 'infantry-crossed': 'total_infantry_crossed',
                 'pontoons-used': 'total_pontoons_used',
+                'total-infantry-used': 'total_infantry_used',
+                'total-infantry-casualties / 10': 'total_infantry_casualties_10',
+                'total-infantry-crossed': 'total_infantry_crossed',
+                'total-pontoons-used': 'total_pontoons_used',
                 '[step]': 'ticks'
             }, inplace=True)
             print("Columns after rename:", self.data.columns.tolist())
+            self.cells = cell_totals(self.data, CELL_COLUMNS)
             print("Data successfully loaded.")
             print("----- Loaded Data (Head) -----")
             print(self.data.head())
         except Exception as e:
             print(f"An error occurred while loading the data: {e}")
             self.data = None
+            self.cells = None
     
     def _standardize_column_names(self, T1, T2):
         """Internal method to standardize column names."""
@@ -67,25 +127,25 @@ class IrpinDataAnalyzer:
         Returns:
             dict: Dictionary containing the computed statistics.
         """
-        if self.data is None:
+        if self.cells is None:
             print("Data has not been loaded. Please run the load_data method first.")
             return None
         
         print("\nStarting statistical calculation.")
         
         # 1. Get unique site selection modes and battle outcomes
-        site_modes = self.data['site_selection_mode'].unique()
-        battle_outcomes = self.data['battle_outcome'].unique()
+        site_modes = self.cells['site_selection_mode'].unique()
+        battle_outcomes = self.cells['battle_outcome'].unique()
         
         self.statistics['site_modes'] = site_modes
         self.statistics['battle_outcomes'] = battle_outcomes
+        mode_totals = self._totals('site_selection_mode').set_index('site_selection_mode')
         
         # 2. Calculate win rate (percentage of 'Victory') for each site selection mode
         win_rate = {}
         for mode in site_modes:
-            mode_idx = self.data['site_selection_mode'] == mode
-            count_mode = mode_idx.sum()
-            count_victory = (self.data.loc[mode_idx, 'battle_outcome'] == 'Victory').sum()
+            count_mode = mode_totals.loc[mode, 'runs']
+            count_victory = mode_totals.loc[mode, 'victories']
             win_rate[mode] = (count_victory / count_mode) * 100 if count_mode > 0 else 0
         
         self.statistics['win_rate'] = win_rate
@@ -93,19 +153,23 @@ class IrpinDataAnalyzer:
         # 3. Calculate casualty rate for each site selection mode
         casualty_rate = {}
         for mode in site_modes:
-            mode_idx = self.data['site_selection_mode'] == mode
-            total_casualties = self.data.loc[mode_idx, 'total_infantry_casualties_10'].sum()
-            total_used = self.data.loc[mode_idx, 'total_infantry_used'].sum()
+            total_casualties = mode_totals.loc[mode, 'total_infantry_casualties_10']
+            total_used = mode_totals.loc[mode, 'total_infantry_used']
             casualty_rate[mode] = (total_casualties / total_used) * 100 if total_used > 0 else 0
         
         self.statistics['casualty_rate'] = casualty_rate
         
-        # 4. Calculate casualty rate per observation
-        row_casualty_rate = (self.data['total_infantry_casualties_10'] / self.data['total_infantry_used']) * 100
-        self.statistics['row_casualty_rate'] = row_casualty_rate
+        # 4. Calculate casualty rate per observation (only the CSV files load the observations)
+        if self.data is not None:
+            row_casualty_rate = (self.data['total_infantry_casualties_10'] / self.data['total_infantry_used']) * 100
+            self.statistics['row_casualty_rate'] = row_casualty_rate
         
-        # 5. Sort data by ticks (as time series) and calculate cumulative values
-        sorted_data = self.data.sort_values(by='ticks').reset_index(drop=True)
+        # 5. Sort the totals by ticks (as time series) and calculate cumulative values at every tick count
+        if self.store is not None:
+            sorted_data = self._store_totals(self.data_file, ['ticks'])
+        else:
+            sorted_data = cell_totals(self.data, 'ticks')
+        sorted_data = sorted_data.sort_values(by='ticks').set_index('ticks')
         sorted_used = sorted_data['total_infantry_used']
         sorted_crossed = sorted_data['total_infantry_crossed']
         sorted_casualties = sorted_data['total_infantry_casualties_10']
@@ -119,10 +183,18 @@ class IrpinDataAnalyzer:
         self.statistics['cum_casualties'] = cum_casualties
         
         # 6. Calculate mean and median for key indices for each site selection mode
-        self._calculate_mode_statistics(site_modes)
+        self._calculate_mode_statistics(site_modes, mode_totals)
         
         # 7. Calculate sum totals for each site selection mode
-        self._calculate_mode_sums(site_modes)
+        self._calculate_mode_sums(site_modes, mode_totals)
+        
+        # 8. Find the best (wave-pause, wave-duration) cell across all modes
+        best = best_summary_cell(summarize_totals(self.cells, ['wave-pause', 'wave-duration']))
+        self.statistics['best_wave_pause'] = int(best['wave-pause'])
+        self.statistics['best_wave_duration'] = int(best['wave-duration'])
+        print(f"\nBest wave cell: pause={self.statistics['best_wave_pause']}, "
+              f"duration={self.statistics['best_wave_duration']} "
+              f"(win rate {best['win_rate']:.2f}% over {int(best['runs'])} runs)")
         
         # Display example results
         print("\nWin rates for each site selection mode:")
@@ -132,23 +204,20 @@ class IrpinDataAnalyzer:
         print("\nStatistical calculation completed.")
         return self.statistics
     
-    def _calculate_mode_statistics(self, site_modes):
+    def _calculate_mode_statistics(self, site_modes, mode_totals):
         """Internal method to calculate statistics grouped by site selection mode."""
         mean_used = {}
-        median_used = {}
         mean_crossed = {}
-        median_crossed = {}
         mean_casualties = {}
-        median_casualties = {}
+        median_used = self._medians('total_infantry_used')
+        median_crossed = self._medians('total_infantry_crossed')
+        median_casualties = self._medians('total_infantry_casualties_10')
         
         for mode in site_modes:
-            mode_idx = self.data['site_selection_mode'] == mode
-            mean_used[mode] = self.data.loc[mode_idx, 'total_infantry_used'].mean()
-            median_used[mode] = self.data.loc[mode_idx, 'total_infantry_used'].median()
-            mean_crossed[mode] = self.data.loc[mode_idx, 'total_infantry_crossed'].mean()
-            median_crossed[mode] = self.data.loc[mode_idx, 'total_infantry_crossed'].median()
-            mean_casualties[mode] = self.data.loc[mode_idx, 'total_infantry_casualties_10'].mean()
-            median_casualties[mode] = self.data.loc[mode_idx, 'total_infantry_casualties_10'].median()
+            runs = mode_totals.loc[mode, 'runs']
+            mean_used[mode] = mode_totals.loc[mode, 'total_infantry_used'] / runs
+            mean_crossed[mode] = mode_totals.loc[mode, 'total_infantry_crossed'] / runs
+            mean_casualties[mode] = mode_totals.loc[mode, 'total_infantry_casualties_10'] / runs
         
         self.statistics['mean_used'] = mean_used
         self.statistics['median_used'] = median_used
@@ -157,17 +226,16 @@ class IrpinDataAnalyzer:
         self.statistics['mean_casualties'] = mean_casualties
         self.statistics['median_casualties'] = median_casualties
     
-    def _calculate_mode_sums(self, site_modes):
+    def _calculate_mode_sums(self, site_modes, mode_totals):
         """Internal method to calculate sum values grouped by site selection mode."""
         sum_used = {}
         sum_crossed = {}
         sum_casualties = {}
         
         for mode in site_modes:
-            mode_idx = self.data['site_selection_mode'] == mode
-            sum_used[mode] = self.data.loc[mode_idx, 'total_infantry_used'].sum()
-            sum_crossed[mode] = self.data.loc[mode_idx, 'total_infantry_crossed'].sum()
-            sum_casualties[mode] = self.data.loc[mode_idx, 'total_infantry_casualties_10'].sum()
+            sum_used[mode] = mode_totals.loc[mode, 'total_infantry_used']
+            sum_crossed[mode] = mode_totals.loc[mode, 'total_infantry_crossed']
+            sum_casualties[mode] = mode_totals.loc[mode, 'total_infantry_casualties_10']
         
         self.statistics['sum_used'] = sum_used
         self.statistics['sum_crossed'] = sum_crossed
@@ -177,21 +245,23 @@ class IrpinDataAnalyzer:
     def _create_3d_scatter_plot(self):
         """Internal method to create a 3D scatter plot with color-coded battle outcomes."""
         try:
+            # One point per cell and outcome: the runs of a cell all sit on the same point
+            cells = self.cells
             # Check if required columns exist for plotting
             required_columns = ['wave-pause', 'wave-duration', 'site_selection_mode', 'battle_outcome']
             for col in required_columns:
-                if col not in self.data.columns:
+                if col not in cells.columns:
                     print(f"Warning: Column '{col}' not found. Skipping 3D graph creation.")
                     return
 
             # Convert site selection (site_selection_mode) from category to numerical values
-            categories = sorted(self.data['site_selection_mode'].unique())
+            categories = sorted(cells['site_selection_mode'].unique())
             cat_to_num = {cat: idx for idx, cat in enumerate(categories)}
-            numeric_site = self.data['site_selection_mode'].map(cat_to_num)
+            numeric_site = cells['site_selection_mode'].map(cat_to_num)
             
             # Create masks for battle outcomes for color coding
-            victory_mask = self.data['battle_outcome'] == 'Victory'
-            retreat_mask = self.data['battle_outcome'] == 'Retreat'
+            victory_mask = cells['battle_outcome'] == 'Victory'
+            retreat_mask = cells['battle_outcome'] == 'Retreat'
 
             # Set plot style
             self._set_plot_style()
@@ -202,8 +272,8 @@ class IrpinDataAnalyzer:
             
             # Plot the data points for Victory outcomes
             sc_victory = ax.scatter(
-                self.data.loc[victory_mask, 'wave-pause'], 
-                self.data.loc[victory_mask, 'wave-duration'], 
+                cells.loc[victory_mask, 'wave-pause'], 
+                cells.loc[victory_mask, 'wave-duration'], 
                 numeric_site[victory_mask],
                 c='#2ecc71', marker='o', label='Victory', s=90, alpha=0.85,
                 edgecolor='white', linewidth=0.5
@@ -211,8 +281,8 @@ class IrpinDataAnalyzer:
             
             # Plot the data points for Retreat outcomes
             sc_retreat = ax.scatter(
-                self.data.loc[retreat_mask, 'wave-pause'], 
-                self.data.loc[retreat_mask, 'wave-duration'], 
+                cells.loc[retreat_mask, 'wave-pause'], 
+                cells.loc[retreat_mask, 'wave-duration'], 
                 numeric_site[retreat_mask],
                 c='#e74c3c', marker='X', label='Retreat', s=90, alpha=0.85,
                 edgecolor='white', linewidth=0.5
@@ -238,8 +308,8 @@ class IrpinDataAnalyzer:
                             fontsize=10, rotation=15)
             
             # Adjust axes limits
-            x_min, x_max = self.data['wave-pause'].min(), self.data['wave-pause'].max()
-            y_min, y_max = self.data['wave-duration'].min(), self.data['wave-duration'].max()
+            x_min, x_max = cells['wave-pause'].min(), cells['wave-pause'].max()
+            y_min, y_max = cells['wave-duration'].min(), cells['wave-duration'].max()
             ax.set_xlim(x_min - (x_max-x_min)*0.1, x_max + (x_max-x_min)*0.1)
             ax.set_ylim(y_min - (y_max-y_min)*0.1, y_max + (y_max-y_min)*0.1)
             
@@ -276,7 +346,7 @@ class IrpinDataAnalyzer:
         
     def create_visualizations(self):
         """Generates visualizations for the data."""
-        if self.data is None or not self.statistics:
+        if self.cells is None or not self.statistics:
             print("Data or statistical information missing. Please run load_data and calculate_statistics methods first.")
             return
             
@@ -290,6 +360,7 @@ class IrpinDataAnalyzer:
         self._create_heatmap_wave_parameters()         
         self._create_3d_surface_plot()                 
         self._create_success_threshold_comparison()
+        self._create_pareto_front_chart()
         
         # New visualizations requested by the user
         print("\nCreating additional visualizations...")
@@ -297,6 +368,7 @@ class IrpinDataAnalyzer:
         self._create_multiple_heatmaps()  # Create heatmaps for various metrics
         self._create_3d_metrics_comparisons()  # Create 3D plots for all metrics
         self._create_uniform_vs_waves_metrics_comparison()  # Create Waves vs Uniform comparisons
+        self._create_paired_waves_vs_uniform_chart()  # Paired Waves - Uniform differences (CRN runs only)
         
         print("All visualization creation completed.")
 
@@ -306,41 +378,9 @@ class IrpinDataAnalyzer:
             # Set plot style
             self._set_plot_style()
             
-            # Retrieve win rate data
-            win_rate = self.statistics['win_rate']
-            modes = list(win_rate.keys())
-            rates = list(win_rate.values())
-            
-            # Set up the figure size
-            plt.figure(figsize=(12, 8))
-            
-            # Create a colormap (gradient from yellow to green)
-            colors = plt.cm.YlGn(np.array(rates) / 100)
-            
-            # Create bar chart
-            bars = plt.bar(modes, rates, color=colors, width=0.6, edgecolor='black', linewidth=0.8)
-            
-            # Display win rate value on top of each bar
-            for bar, rate in zip(bars, rates):
-                height = bar.get_height()
-                plt.text(bar.get_x() + bar.get_width()/2., height + 2,
-                        f'{rate:.1f}%', ha='center', va='bottom', fontsize=11, fontweight='bold')
-            
-            # Decorate the chart
-            plt.title('Success Rate by Site Selection Strategy', fontsize=16, fontweight='bold', pad=20)
-            plt.xlabel('Site Selection Strategy', fontsize=14, fontweight='bold', labelpad=10)
-            plt.ylabel('Success Rate (%)', fontsize=14, fontweight='bold', labelpad=10)
-            plt.xticks(rotation=45, ha='right', fontsize=11)
-            plt.ylim(0, 105)  # Display 0-100% with some margin
-            
-            # Grid lines
-            plt.grid(axis='y', linestyle='--', alpha=0.7)
-            
-            plt.tight_layout()
-            
             # Save the graph
             graph_output_file = os.path.join(self.output_dir, "Success_Rate_by_Strategy.png")
-            plt.savefig(graph_output_file, dpi=300, bbox_inches='tight')
+            plot_win_rates(self._totals('site_selection_mode'), graph_output_file)
             print(f'Success rate bar chart saved to "{graph_output_file}".')
             
         except Exception as e:
@@ -480,78 +520,9 @@ class IrpinDataAnalyzer:
             # Set plot style
             self._set_plot_style()
             
-            # Divide wave parameters into bins
-            wave_pause_bins = sorted(self.data['wave-pause'].unique())
-            wave_duration_bins = sorted(self.data['wave-duration'].unique())
-            
-            # Initialize matrices to store heatmap data for win rate and casualty rate
-            win_rate_matrix = np.zeros((len(wave_pause_bins), len(wave_duration_bins)))
-            casualty_rate_matrix = np.zeros((len(wave_pause_bins), len(wave_duration_bins)))
-            
-            # Calculate win rate and casualty rate for each combination of bins
-            for i, pause in enumerate(wave_pause_bins):
-                for j, duration in enumerate(wave_duration_bins):
-                    # Extract data corresponding to the current bin
-                    mask = (self.data['wave-pause'] == pause) & (self.data['wave-duration'] == duration)
-                    bin_data = self.data[mask]
-                    
-                    if len(bin_data) > 0:
-                        # Calculate win rate (percentage of Victory)
-                        victory_count = (bin_data['battle_outcome'] == 'Victory').sum()
-                        win_rate_matrix[i, j] = (victory_count / len(bin_data)) * 100
-                        
-                        # Calculate casualty rate
-                        casualties = bin_data['total_infantry_casualties_10'].sum()
-                        used = bin_data['total_infantry_used'].sum()
-                        if used > 0:
-                            casualty_rate_matrix[i, j] = (casualties / used) * 100
-                        else:
-                            casualty_rate_matrix[i, j] = 0
-            
-            # Display the two heatmaps side by side
-            fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(18, 8))
-            
-            # Heatmap for win rate
-            im1 = ax1.imshow(win_rate_matrix, cmap='YlGn', interpolation='nearest', aspect='auto')
-            ax1.set_title('Success Rate (%)', fontsize=16, fontweight='bold')
-            ax1.set_xlabel('Wave Duration', fontsize=14, fontweight='bold')
-            ax1.set_ylabel('Wave Pause', fontsize=14, fontweight='bold')
-            ax1.set_xticks(range(len(wave_duration_bins)))
-            ax1.set_yticks(range(len(wave_pause_bins)))
-            ax1.set_xticklabels(wave_duration_bins)
-            ax1.set_yticklabels(wave_pause_bins)
-            
-            # Add colorbar for win rate heatmap
-            cbar1 = fig.colorbar(im1, ax=ax1)
-            cbar1.set_label('Success Rate (%)', fontsize=12, fontweight='bold')
-            
-            # Heatmap for casualty rate
-            im2 = ax2.imshow(casualty_rate_matrix, cmap='YlOrRd', interpolation='nearest', aspect='auto')
-            ax2.set_title('Casualty Rate (%)', fontsize=16, fontweight='bold')
-            ax2.set_xlabel('Wave Duration', fontsize=14, fontweight='bold')
-            ax2.set_ylabel('Wave Pause', fontsize=14, fontweight='bold')
-            ax2.set_xticks(range(len(wave_duration_bins)))
-            ax2.set_yticks(range(len(wave_pause_bins)))
-            ax2.set_xticklabels(wave_duration_bins)
-            ax2.set_yticklabels(wave_pause_bins)
-            
-            # Add colorbar for casualty rate heatmap
-            cbar2 = fig.colorbar(im2, ax=ax2)
-            cbar2.set_label('Casualty Rate (%)', fontsize=12, fontweight='bold')
-            
-            # Display cell values
-            for i in range(len(wave_pause_bins)):
-                for j in range(len(wave_duration_bins)):
-                    ax1.text(j, i, f'{win_rate_matrix[i, j]:.1f}%', 
-                             ha='center', va='center', color='black', fontsize=10)
-                    ax2.text(j, i, f'{casualty_rate_matrix[i, j]:.1f}%', 
-                             ha='center', va='center', color='black', fontsize=10)
-            
-            plt.tight_layout()
-            
             # Save the graph
             graph_output_file = os.path.join(self.output_dir, "Wave_Parameters_Heatmap.png")
-            plt.savefig(graph_output_file, dpi=300, bbox_inches='tight')
+            plot_wave_heatmaps(self._totals(['wave-pause', 'wave-duration']), graph_output_file)
             print(f'Heatmap saved to "{graph_output_file}".')
             
         except Exception as e:
@@ -564,8 +535,9 @@ class IrpinDataAnalyzer:
             self._set_plot_style()
             
             # Divide wave parameters into bins
-            wave_pause_bins = sorted(self.data['wave-pause'].unique())
-            wave_duration_bins = sorted(self.data['wave-duration'].unique())
+            cells = self._totals(['wave-pause', 'wave-duration'])
+            wave_pause_bins = sorted(cells['wave-pause'].unique())
+            wave_duration_bins = sorted(cells['wave-duration'].unique())
             
             # Prepare grid data for 3D surface plot
             X, Y = np.meshgrid(wave_pause_bins, wave_duration_bins)
@@ -574,11 +546,11 @@ class IrpinDataAnalyzer:
             # Calculate win rate data
             for i, duration in enumerate(wave_duration_bins):
                 for j, pause in enumerate(wave_pause_bins):
-                    mask = (self.data['wave-pause'] == pause) & (self.data['wave-duration'] == duration)
-                    data_bin = self.data[mask]
+                    mask = (cells['wave-pause'] == pause) & (cells['wave-duration'] == duration)
+                    data_bin = cells[mask]
                     if len(data_bin) > 0:
-                        win_count = (data_bin['battle_outcome'] == 'Victory').sum()
-                        Z[i, j] = (win_count / len(data_bin)) * 100
+                        win_count = data_bin['victories'].sum()
+                        Z[i, j] = (win_count / data_bin['runs'].sum()) * 100
             
             # Create the plot
             fig = plt.figure(figsize=(14, 12))
@@ -621,18 +593,19 @@ class IrpinDataAnalyzer:
             half = len(sorted_modes) // 2
             low = [m for m, _ in sorted_modes[:half]]
             high = [m for m, _ in sorted_modes[-half:]]
-            pauses = sorted(self.data['wave-pause'].unique())
-            durations = sorted(self.data['wave-duration'].unique())
+            cells = self._totals(['site_selection_mode', 'wave-pause', 'wave-duration'])
+            pauses = sorted(cells['wave-pause'].unique())
+            durations = sorted(cells['wave-duration'].unique())
             high_mat = np.zeros((len(pauses), len(durations)))
             low_mat = np.zeros_like(high_mat)
             for i, p in enumerate(pauses):
                 for j, d in enumerate(durations):
-                    df_h = self.data[(self.data['wave-pause'] == p) & (self.data['wave-duration'] == d) & self.data['site_selection_mode'].isin(high)]
-                    df_l = self.data[(self.data['wave-pause'] == p) & (self.data['wave-duration'] == d) & self.data['site_selection_mode'].isin(low)]
+                    df_h = cells[(cells['wave-pause'] == p) & (cells['wave-duration'] == d) & cells['site_selection_mode'].isin(high)]
+                    df_l = cells[(cells['wave-pause'] == p) & (cells['wave-duration'] == d) & cells['site_selection_mode'].isin(low)]
                     if len(df_h):
-                        high_mat[i, j] = (df_h['battle_outcome'] == 'Victory').mean() * 100
+                        high_mat[i, j] = df_h['victories'].sum() / df_h['runs'].sum() * 100
                     if len(df_l):
-                        low_mat[i, j] = (df_l['battle_outcome'] == 'Victory').mean() * 100
+                        low_mat[i, j] = df_l['victories'].sum() / df_l['runs'].sum() * 100
             # Plot heatmaps side by side
             fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(16, 6))
             im1 = ax1.imshow(high_mat, cmap='YlGn', vmin=0, vmax=100, aspect='auto')
@@ -657,22 +630,41 @@ class IrpinDataAnalyzer:
         except Exception as e:
             print(f"Error drawing strategy comparison: {e}")
 
+    def _create_pareto_front_chart(self):
+        """Pareto front of (mode, pause, duration) cells over success rate, infantry, pontoons and ticks."""
+        try:
+            self._set_plot_style()
+            pareto = ParetoFront(['site_selection_mode', 'wave-pause', 'wave-duration']).update_totals(self.cells)
+            self.statistics['pareto_front'] = pareto.front()
+            print(f"\nPareto-optimal cells ({int(pareto.table['possibly_pareto'].sum())} of {len(pareto.table)} "
+                  f"cells not ruled out at 95% confidence):")
+            print(self.statistics['pareto_front'][['site_selection_mode', 'wave-pause', 'wave-duration', 'win_rate',
+                                                   'total_infantry_used', 'total_pontoons_used', 'ticks']])
+            out = os.path.join(self.output_dir, 'Pareto_Front.png')
+            plot_front(pareto.table, out, title='Waves Pareto Front: Success Rate vs Resource Use')
+            print(f'Saved Pareto front chart to {out}')
+        except Exception as e:
+            print(f"Error drawing Pareto front chart: {e}")
+
     def _create_uniform_vs_waves_bymode_bar_chart(self):
-        """Bar chart comparing success rates by site selection mode between Waves (pause=70,duration=200) and Uniform."""
+        """Bar chart comparing success rates by site selection mode between Waves (best wave cell) and Uniform."""
         try:
             self._set_plot_style()
             # Waves best subset grouped by mode
-            best = self.data[(self.data['wave-pause']==70)&(self.data['wave-duration']==200)]
-            waves_success = best.groupby('site_selection_mode')['battle_outcome']\
-                                 .apply(lambda x: (x=='Victory').mean()*100)
-            # Load and standardize uniform data (skiprows=6 for correct parsing)
-            uni = pd.read_csv(self.uniform_file, skiprows=6)
-            uni.rename(columns={
-                'site-selection-mode':'site_selection_mode',
-                'battle-outcome':'battle_outcome'
-            }, inplace=True)
-            uniform_success = uni.groupby('site_selection_mode')['battle_outcome']\
-                                  .apply(lambda x: (x=='Victory').mean()*100)
+            pause, duration = self.statistics['best_wave_pause'], self.statistics['best_wave_duration']
+            best = self._wave_cell(pause, duration)
+            waves_success = best.set_index('site_selection_mode').eval('victories / runs * 100')
+            if self.store is not None:
+                uni = self._store_totals(self.uniform_file, ['site_selection_mode'])
+            else:
+                # Load and standardize uniform data (skiprows=6 for correct parsing)
+                uni = pd.read_csv(self.uniform_file, skiprows=6)
+                uni.rename(columns={
+                    'site-selection-mode':'site_selection_mode',
+                    'battle-outcome':'battle_outcome'
+                }, inplace=True)
+                uni = cell_totals(uni, 'site_selection_mode')
+            uniform_success = uni.set_index('site_selection_mode').eval('victories / runs * 100')
             # Combine all unique modes and sort as strings (not float)
             modes = sorted(set(waves_success.index).union(uniform_success.index), key=str)
             x = np.arange(len(modes))
@@ -683,7 +675,7 @@ class IrpinDataAnalyzer:
             ax.set_xticks(x)
             ax.set_xticklabels(modes, rotation=45)
             ax.set_ylabel('Success Rate (%)')
-            ax.set_title('Waves vs Uniform Success Rate by Site Selection Mode (pause=70,duration=200)')
+            ax.set_title(f'Waves vs Uniform Success Rate by Site Selection Mode (pause={pause},duration={duration})')
             ax.legend()
             plt.tight_layout()
             out = os.path.join(self.output_dir, 'Waves_vs_Uniform_by_Mode.png')
@@ -699,16 +691,17 @@ class IrpinDataAnalyzer:
             self._set_plot_style()
             
             # Get wave parameters
-            wave_pause_bins = sorted(self.data['wave-pause'].unique())
-            wave_duration_bins = sorted(self.data['wave-duration'].unique())
+            cells = self._totals(['wave-pause', 'wave-duration'])
+            wave_pause_bins = sorted(cells['wave-pause'].unique())
+            wave_duration_bins = sorted(cells['wave-duration'].unique())
             
             # Define metrics to analyze
             metrics = {
-                'Win Rate': lambda df: (df['battle_outcome'] == 'Victory').mean() * 100,
+                'Win Rate': lambda df: df['victories'].sum() / df['runs'].sum() * 100,
                 'Casualty Rate': lambda df: (df['total_infantry_casualties_10'].sum() / df['total_infantry_used'].sum()) * 100 if df['total_infantry_used'].sum() > 0 else 0,
-                'Troops Used': lambda df: df['total_infantry_used'].mean(),
-                'Pontoons Used': lambda df: df['total_pontoons_used'].mean(),
-                'Ticks (Duration)': lambda df: df['ticks'].mean()
+                'Troops Used': lambda df: df['total_infantry_used'].sum() / df['runs'].sum(),
+                'Pontoons Used': lambda df: df['total_pontoons_used'].sum() / df['runs'].sum(),
+                'Ticks (Duration)': lambda df: df['ticks'].sum() / df['runs'].sum()
             }
             
             # Use a 3x2 subplot grid for all metrics
@@ -735,8 +728,8 @@ class IrpinDataAnalyzer:
                 # Calculate metric value for each wave parameter combination
                 for p_idx, pause in enumerate(wave_pause_bins):
                     for d_idx, duration in enumerate(wave_duration_bins):
-                        mask = (self.data['wave-pause'] == pause) & (self.data['wave-duration'] == duration)
-                        data_bin = self.data[mask]
+                        mask = (cells['wave-pause'] == pause) & (cells['wave-duration'] == duration)
+                        data_bin = cells[mask]
                         if len(data_bin) > 0:
                             data_matrix[p_idx, d_idx] = metric_func(data_bin)
                 
@@ -796,20 +789,21 @@ class IrpinDataAnalyzer:
             self._set_plot_style()
             
             # Get parameters
-            site_modes = sorted(self.data['site_selection_mode'].unique())
-            wave_pauses = sorted(self.data['wave-pause'].unique())
-            wave_durations = sorted(self.data['wave-duration'].unique())
+            cells = self._totals(['site_selection_mode', 'wave-pause', 'wave-duration'])
+            site_modes = sorted(cells['site_selection_mode'].unique())
+            wave_pauses = sorted(cells['wave-pause'].unique())
+            wave_durations = sorted(cells['wave-duration'].unique())
             
             # Create numerical mapping for site selection modes
             mode_to_num = {mode: i for i, mode in enumerate(site_modes)}
             
             # Define metrics to analyze
             metrics = {
-                'Win Rate': {'func': lambda df: (df['battle_outcome'] == 'Victory').mean() * 100, 'cmap': 'YlGn'},
+                'Win Rate': {'func': lambda df: df['victories'].sum() / df['runs'].sum() * 100, 'cmap': 'YlGn'},
                 'Casualty Rate': {'func': lambda df: (df['total_infantry_casualties_10'].sum() / df['total_infantry_used'].sum()) * 100 if df['total_infantry_used'].sum() > 0 else 0, 'cmap': 'YlOrRd'},
-                'Troops Used': {'func': lambda df: df['total_infantry_used'].mean(), 'cmap': 'Blues'},
-                'Pontoons Used': {'func': lambda df: df['total_pontoons_used'].mean(), 'cmap': 'Purples'},
-                'Battle Duration': {'func': lambda df: df['ticks'].mean(), 'cmap': 'Oranges'}
+                'Troops Used': {'func': lambda df: df['total_infantry_used'].sum() / df['runs'].sum(), 'cmap': 'Blues'},
+                'Pontoons Used': {'func': lambda df: df['total_pontoons_used'].sum() / df['runs'].sum(), 'cmap': 'Purples'},
+                'Battle Duration': {'func': lambda df: df['ticks'].sum() / df['runs'].sum(), 'cmap': 'Oranges'}
             }
             
             # Create one figure per metric
@@ -824,11 +818,11 @@ class IrpinDataAnalyzer:
                 for mode in site_modes:
                     for pause in wave_pauses:
                         for duration in wave_durations:
-                            mask = ((self.data['site_selection_mode'] == mode) & 
-                                    (self.data['wave-pause'] == pause) & 
-                                    (self.data['wave-duration'] == duration))
+                            mask = ((cells['site_selection_mode'] == mode) & 
+                                    (cells['wave-pause'] == pause) & 
+                                    (cells['wave-duration'] == duration))
                             
-                            subset_data = self.data[mask]
+                            subset_data = cells[mask]
                             
                             if len(subset_data) > 0:
                                 x_data.append(pause)
@@ -876,13 +870,14 @@ class IrpinDataAnalyzer:
             print(f"An error occurred while creating 3D metrics comparisons: {e}")
     
     def _create_uniform_vs_waves_metrics_comparison(self):
-        """Creates multiple bar charts comparing Waves (pause=70, duration=200) vs Uniform across various metrics."""
+        """Creates multiple bar charts comparing Waves (best wave cell) vs Uniform across various metrics."""
         try:
             # Set plot style
             self._set_plot_style()
             
-            # Filter waves data for the specific parameters
-            best_waves = self.data[(self.data['wave-pause']==70) & (self.data['wave-duration']==200)]
+            # Filter waves data for the best wave parameters
+            pause, duration = self.statistics['best_wave_pause'], self.statistics['best_wave_duration']
+            best_waves = self._wave_cell(pause, duration)
             
             # Load uniform data - try different methods to handle various data formats
             try:
@@ -894,7 +889,10 @@ class IrpinDataAnalyzer:
                         print(f"{i}: {line.strip()}")
                 
                 # skiprows=6 is common, but may need adjustment based on file format
-                uni = pd.read_csv(self.uniform_file, skiprows=6)
+                if self.store is not None:
+                    uni = self._store_totals(self.uniform_file, ['site_selection_mode', 'battle_outcome'])
+                else:
+                    uni = pd.read_csv(self.uniform_file, skiprows=6)
                 print("Available columns (Original Uniform data):", uni.columns.tolist())
                 
                 # Define all possible mappings from existing column names to standardized names
@@ -998,12 +996,16 @@ class IrpinDataAnalyzer:
                     print(f"Provisionally using column {uni.columns[3]} as battle_outcome")
                     uni = uni.rename(columns={uni.columns[3]: 'battle_outcome'})
             
+            # Per-mode and outcome totals, which the metrics below are computed from (the store computes them itself)
+            if 'runs' not in uni.columns:
+                uni = cell_totals(uni, ['site_selection_mode', 'battle_outcome'])
+            
             # Define metrics to compare - start with just the basic Success Rate that's guaranteed
             metrics = [
                 {
                     'name': 'Success Rate (%)',
-                    'waves_func': lambda df: (df['battle_outcome'] == 'Victory').mean() * 100,
-                    'uni_func': lambda df: (df['battle_outcome'] == 'Victory').mean() * 100,
+                    'waves_func': lambda df: df['victories'].sum() / df['runs'].sum() * 100,
+                    'uni_func': lambda df: df['victories'].sum() / df['runs'].sum() * 100,
                     'format': '{:.1f}%'
                 }
             ]
@@ -1032,8 +1034,8 @@ class IrpinDataAnalyzer:
                         # Normal mean calculation
                         metrics.append({
                             'name': friendly_name,
-                            'waves_func': lambda df, col=col_name: df[col].mean(),
-                            'uni_func': lambda df, col=col_name: df[col].mean(),
+                            'waves_func': lambda df, col=col_name: df[col].sum() / df['runs'].sum(),
+                            'uni_func': lambda df, col=col_name: df[col].sum() / df['runs'].sum(),
                             'format': format_str
                         })
             
@@ -1042,8 +1044,8 @@ class IrpinDataAnalyzer:
                all(col in uni.columns for col in ['total_infantry_crossed', 'total_pontoons_used']):
                 metrics.append({
                     'name': 'Pontoon Efficiency (troops/pontoon)',
-                    'waves_func': lambda df: (df['total_infantry_crossed'].mean() / df['total_pontoons_used'].mean()) if df['total_pontoons_used'].mean() > 0 else 0,
-                    'uni_func': lambda df: (df['total_infantry_crossed'].mean() / df['total_pontoons_used'].mean()) if df['total_pontoons_used'].mean() > 0 else 0,
+                    'waves_func': lambda df: (df['total_infantry_crossed'].sum() / df['total_pontoons_used'].sum()) if df['total_pontoons_used'].sum() > 0 else 0,
+                    'uni_func': lambda df: (df['total_infantry_crossed'].sum() / df['total_pontoons_used'].sum()) if df['total_pontoons_used'].sum() > 0 else 0,
                     'format': '{:.1f}'
                 })
             
@@ -1109,7 +1111,7 @@ class IrpinDataAnalyzer:
                 width = 0.35
                 
                 try:
-                    waves_bars = ax.bar(x - width/2, waves_values, width, label='Waves (p=70, d=200)', 
+                    waves_bars = ax.bar(x - width/2, waves_values, width, label=f'Waves (p={pause}, d={duration})', 
                                       color='#3498db', edgecolor='black', linewidth=0.8)
                     uni_bars = ax.bar(x + width/2, uni_values, width, label='Uniform', 
                                      color='#e74c3c', edgecolor='black', linewidth=0.8)
@@ -1176,18 +1178,72 @@ class IrpinDataAnalyzer:
             print(f"An error occurred while creating Waves vs Uniform comparison: {e}")
             print(traceback.format_exc())  # Show detailed error trace
 
+    def _create_paired_waves_vs_uniform_chart(self):
+        """Paired Waves - Uniform differences by site selection mode from a common-random-numbers table."""
+        try:
+            if not os.path.exists(self.crn_file):
+                print(f'No CRN table at "{self.crn_file}"; skipping paired Waves vs Uniform chart.')
+                return
+
+            self._set_plot_style()
+
+            crn = pd.read_csv(self.crn_file, skiprows=6)
+            crn.rename(columns={
+                'site-selection-mode': 'site_selection_mode',
+                'battle-outcome': 'battle_outcome',
+                'total-infantry-casualties / 10': 'total_infantry_casualties_10',
+                'total-infantry-used': 'total_infantry_used'
+            }, inplace=True)
+            crn['win'] = (crn['battle_outcome'] == 'Victory').astype(int) * 100
+            crn['casualty_pct'] = (crn['total_infantry_casualties_10'] / crn['total_infantry_used']) * 100
+
+            # Pair runs of the same mode and CRN replicate, compare Waves against Uniform
+            tables = {}
+            for col in ['win', 'casualty_pct']:
+                per_mode = []
+                for mode, mode_data in crn.groupby('site_selection_mode'):
+                    diff = paired_differences(mode_data, 'crn-replicate', 'spacing-mode', col, 'Uniform')
+                    diff['site_selection_mode'] = mode
+                    per_mode.append(diff)
+                tables[col] = pd.concat(per_mode, ignore_index=True)
+                print(f"\nPaired Waves - Uniform differences in {col}:")
+                print(tables[col][['site_selection_mode', 'n_pairs', 'mean_diff', 'ci_low', 'ci_high', 'variance_reduction']])
+            self.statistics['paired_waves_vs_uniform'] = tables
+
+            fig, axes = plt.subplots(1, 2, figsize=(18, 7))
+            for ax, (col, label) in zip(axes, [('win', 'Success Rate (pct. points)'), ('casualty_pct', 'Casualty Rate (pct. points)')]):
+                table = tables[col]
+                x = np.arange(len(table))
+                errors = [table['mean_diff'] - table['ci_low'], table['ci_high'] - table['mean_diff']]
+                colors = ['#3498db' if v >= 0 else '#e74c3c' for v in table['mean_diff']]
+                ax.bar(x, table['mean_diff'], yerr=errors, capsize=4, color=colors, edgecolor='black', linewidth=0.8)
+                ax.axhline(0, color='black', linewidth=0.8)
+                ax.set_xticks(x)
+                ax.set_xticklabels(table['site_selection_mode'], rotation=45, ha='right')
+                ax.set_xlabel('Site Selection Strategy', fontsize=14, fontweight='bold')
+                ax.set_ylabel(f'Waves - Uniform: {label}', fontsize=12, fontweight='bold')
+                ax.grid(axis='y', linestyle='--', alpha=0.7)
+            plt.suptitle('Paired Waves vs Uniform Differences (Common Random Numbers)', fontsize=16, fontweight='bold')
+            plt.tight_layout()
+            out = os.path.join(self.output_dir, 'Waves_vs_Uniform_Paired_Differences.png')
+            plt.savefig(out, dpi=300, bbox_inches='tight')
+            print(f'Saved paired Waves vs Uniform chart to {out}')
+            plt.close(fig)
+        except Exception as e:
+            print(f"Error drawing paired Waves vs Uniform chart: {e}")
+
 def main():
     """Main function."""
     print("Starting script.")
     
-    # Instantiate the analysis class
-    analyzer = IrpinDataAnalyzer()
+    # Instantiate the analysis class (querying the results store when one has been built)
+    analyzer = IrpinDataAnalyzer(store=DEFAULT_STORE_FILE if os.path.exists(DEFAULT_STORE_FILE) else None)
     
     # Step 1: Load the combined data
     analyzer.load_data()
     
     # Step 2: Calculate statistical information
-    if analyzer.data is not None:
+    if analyzer.cells is not None:
         analyzer.calculate_statistics()
         
         # Step 3: Generate visualizations
@@ -0,0 +1,238 @@
+import os
+import math
+import argparse
+from statistics import NormalDist
+
+import pandas as pd
+
+from run_cache import RunCache, DEFAULT_CACHE_FILE
+from sweep import Sweep, make_backend, load_experiments, write_table, SCRIPT_DIR
+
+
+OUTCOME_METRIC = 'battle-outcome'
+CASUALTY_METRIC = 'total-infantry-casualties / 10'
+USED_METRIC = 'total-infantry-used'
+
+
+def wilson_interval(successes, n, z):
+    """Wilson score interval for a binomial proportion.
+
+    Returns:
+        tuple: (lower, upper) bounds in [0, 1].
+    """
+    if n == 0:
+        return 0.0, 1.0
+    p = successes / n
+    denom = 1 + z * z / n
+    center = (p + z * z / (2 * n)) / denom
+    half = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / denom
+    lower = 0.0 if successes == 0 else max(0.0, center - half)
+    upper = 1.0 if successes == n else min(1.0, center + half)
+    return lower, upper
+
+
+class ConfigEstimate:
+    """Running win-rate and casualty-rate estimate of one configuration."""
+
+    def __init__(self, point):
+        self.point = point
+        self.n = 0
+        self.wins = 0
+        self.casualty_sum = 0.0
+        self.casualty_sq_sum = 0.0
+        self.stop_reason = None
+
+    @property
+    def active(self):
+        return self.stop_reason is None
+
+    @property
+    def win_rate(self):
+        return self.wins / self.n if self.n else 0.0
+
+    @property
+    def casualty_rate(self):
+        return self.casualty_sum / self.n if self.n else 0.0
+
+    def add(self, outcome, casualties, used):
+        self.n += 1
+        self.wins += outcome == 'Victory'
+        rate = (casualties / used) * 100 if used else 0.0
+        self.casualty_sum += rate
+        self.casualty_sq_sum += rate * rate
+
+    def win_interval(self, z):
+        return wilson_interval(self.wins, self.n, z)
+
+    def casualty_half_width(self, z):
+        if self.n < 2:
+            return float('inf')
+        mean = self.casualty_rate
+        var = max(0.0, (self.casualty_sq_sum - self.n * mean * mean) / (self.n - 1))
+        return z * math.sqrt(var / self.n)
+
+
+class AdaptiveReplication:
+    """Sequential-sampling driver that replicates configurations in batches.
+
+    A configuration stops receiving runs as soon as one of the following holds:
+      - precision: its win-rate confidence interval (and, if requested, its
+        casualty-rate interval) is narrower than the target half-width;
+      - ranking: its win-rate interval no longer overlaps the interval of the
+        current best configuration, so its position relative to the best is settled;
+      - budget: it reached `max_reps`.
+
+    Seeds follow the repetition index, so results are shared with flat sweeps
+    through the run cache and an interrupted run resumes where it stopped.
+    """
+
+    def __init__(self, sweep, points, batch_size=20, min_reps=20, max_reps=1000,
+                 win_half_width=0.05, casualty_half_width=None, confidence=0.95,
+                 seed_base=0, bonferroni=True):
+        self.sweep = sweep
+        self.estimates = [ConfigEstimate(dict(p)) for p in points]
+        self.batch_size = batch_size
+        self.min_reps = min_reps
+        self.max_reps = max_reps
+        self.win_half_width = win_half_width
+        self.casualty_half_width = casualty_half_width
+        self.seed_base = seed_base
+        alpha = 1 - confidence
+        # Ranking decisions compare every configuration with the best one
+        ranking_alpha = alpha / max(1, len(self.estimates) - 1) if bonferroni else alpha
+        self.z = NormalDist().inv_cdf(1 - alpha / 2)
+        self.z_ranking = NormalDist().inv_cdf(1 - ranking_alpha / 2)
+        self.rows = []
+
+    def _next_jobs(self):
+        jobs = []
+        owners = []
+        for estimate in self.estimates:
+            if not estimate.active:
+                continue
+            size = self.min_reps if estimate.n == 0 else self.batch_size
+            size = min(size, self.max_reps - estimate.n)
+            for rep in range(estimate.n, estimate.n + size):
+                jobs.append(self.sweep.job(estimate.point, rep, self.seed_base))
+                owners.append(estimate)
+        return jobs, owners
+
+    def _update_stopping(self):
+        scored = [e for e in self.estimates if e.n > 0]
+        if not scored:
+            return
+        best = max(scored, key=lambda e: e.win_rate)
+        best_low, best_high = best.win_interval(self.z_ranking)
+
+        for estimate in self.estimates:
+            if not estimate.active:
+                continue
+            if estimate.n >= self.max_reps:
+                estimate.stop_reason = 'budget'
+                continue
+
+            low, high = estimate.win_interval(self.z)
+            precise = (high - low) / 2 <= self.win_half_width
+            if precise and self.casualty_half_width is not None:
+                precise = estimate.casualty_half_width(self.z) <= self.casualty_half_width
+            if precise:
+                estimate.stop_reason = 'precision'
+                continue
+
+            if estimate is best:
+                others = [e.win_interval(self.z_ranking)[1] for e in scored if e is not best]
+                if others and best_low > max(others):
+                    estimate.stop_reason = 'ranking'
+            elif estimate.win_interval(self.z_ranking)[1] < best_low:
+                estimate.stop_reason = 'ranking'
+
+    def run(self):
+        """Runs batches until every configuration has stopped.
+
+        Returns:
+            DataFrame: One summary row per configuration.
+        """
+        round_num = 0
+        while True:
+            jobs, owners = self._next_jobs()
+            if not jobs:
+                break
+            round_num += 1
+            print(f"Round {round_num}: {len(jobs)} run(s) across "
+                  f"{sum(e.active for e in self.estimates)} active configuration(s).")
+
+            df = self.sweep.run(jobs)
+            for estimate, (_, row) in zip(owners, df.iterrows()):
+                estimate.add(row[OUTCOME_METRIC], row[CASUALTY_METRIC], row[USED_METRIC])
+            self.rows.append(df)
+            self._update_stopping()
+
+        summary = self.summary()
+        total = int(summary['runs'].sum())
+        flat = self.max_reps * len(self.estimates)
+        print(f"Adaptive replication used {total} runs instead of {flat} "
+              f"({100 * (1 - total / flat):.1f}% fewer).")
+        return summary
+
+    def results(self):
+        """Returns every run executed so far as one DataFrame."""
+        if not self.rows:
+            return pd.DataFrame()
+        df = pd.concat(self.rows, ignore_index=True)
+        df['[run number]'] = range(1, len(df) + 1)
+        return df
+
+    def summary(self):
+        rows = []
+        for estimate in self.estimates:
+            low, high = estimate.win_interval(self.z)
+            row = dict(estimate.point)
+            row.update({
+                'runs': estimate.n,
+                'win_rate': estimate.win_rate * 100,
+                'win_ci_low': low * 100,
+                'win_ci_high': high * 100,
+                'casualty_rate': estimate.casualty_rate,
+                'casualty_ci_half_width': estimate.casualty_half_width(self.z),
+                'stop_reason': estimate.stop_reason
+            })
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+
+def main():
+    """Adaptively replicates a BehaviorSpace experiment instead of using a flat repetition count."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('experiment', nargs='?', default="Vary Site-Selection Artillery Active")
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--min-reps', type=int, default=20)
+    parser.add_argument('--max-reps', type=int, default=None,
+                        help="Defaults to the experiment's repetition count")
+    parser.add_argument('--win-half-width', type=float, default=0.05)
+    parser.add_argument('--casualty-half-width', type=float, default=None)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--backend', choices=['netlogo', 'python'], default='netlogo')
+    parser.add_argument('--netlogo-home', default=None)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    experiment = load_experiments()[args.experiment]
+    backend = make_backend(args.backend, args.netlogo_home, args.threads)
+    with RunCache(args.cache) as cache:
+        driver = AdaptiveReplication(
+            Sweep(backend, cache), experiment.points(),
+            batch_size=args.batch_size, min_reps=args.min_reps,
+            max_reps=args.max_reps or experiment.repetitions,
+            win_half_width=args.win_half_width, casualty_half_width=args.casualty_half_width,
+            confidence=args.confidence)
+        summary = driver.run()
+
+    print(summary.to_string(index=False))
+    base = os.path.join(SCRIPT_DIR, f"IrpinModel {experiment.name} (adaptive)")
+    summary.to_csv(base + "-summary.csv", index=False)
+    write_table(driver.results(), base + "-table.csv", experiment.name)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,173 @@
+import os
+import time
+import shutil
+import warnings
+import argparse
+import tempfile
+import contextlib
+import tracemalloc
+import importlib.util
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+from sweep import load_experiments, SCRIPT_DIR
+from synthetic_data import SyntheticRuns
+from worker_pool import peak_rss_mib
+
+
+# Analyzer -> (script, experiment its synthetic table follows, loading method)
+ANALYZERS = {
+    'uniform': ("Uniform Data Analysis.py", "Vary Site-Selection Artillery Active", 'preprocess_csv_files'),
+    'waves': ("Waves Data Analysis.py", "Vary Site-Selection Artillery Active Waves", 'load_data'),
+}
+
+
+def load_analyzer(kind):
+    """Imports an analyzer script (their file names are not valid module names) and returns its class."""
+    script = ANALYZERS[kind][0]
+    spec = importlib.util.spec_from_file_location(f"{kind}_data_analysis", os.path.join(SCRIPT_DIR, script))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.IrpinDataAnalyzer
+
+
+def analyzer_stages(analyzer_class, kind):
+    """Stage methods in pipeline order: loading, calculate_statistics, then every chart in definition order."""
+    charts = [name for name in vars(analyzer_class)
+              if name.startswith(('create_', '_create_')) and name != 'create_visualizations']
+    return [ANALYZERS[kind][2], 'calculate_statistics'] + charts
+
+
+def synthetic_table(kind, rows, data_dir, seed=0):
+    """Path of a synthetic table for an analyzer, written on first use."""
+    path = os.path.join(data_dir, f"synthetic-{kind}-{rows}-table.csv")
+    if not os.path.exists(path):
+        experiment = load_experiments()[ANALYZERS[kind][1]]
+        SyntheticRuns(seed=seed).write_table(path, experiment, rows)
+    return path
+
+
+def run_case(kind, rows, tables, trace_memory=False, keep_plots_dir=None):
+    """Runs one analyzer on one table size, stage by stage (meant for a fresh worker process).
+
+    Returns:
+        list: One dict per stage with its seconds, the process peak RSS after
+        it, the traced peak of the stage (when `trace_memory`) and any error.
+    """
+    import matplotlib.pyplot as plt
+
+    warnings.simplefilter('ignore', FutureWarning)
+    analyzer_class = load_analyzer(kind)
+    output_dir = keep_plots_dir or tempfile.mkdtemp(prefix=f"analysis-{kind}-{rows}-")
+    os.makedirs(output_dir, exist_ok=True)
+    analyzer = analyzer_class(SCRIPT_DIR)
+    analyzer.output_dir = output_dir
+    if kind == 'waves':
+        analyzer.data_file = tables['waves']
+        analyzer.uniform_file = tables['uniform']
+        analyzer.crn_file = os.path.join(output_dir, "no-crn-table.csv")
+
+    results = []
+    for stage in analyzer_stages(analyzer_class, kind):
+        arguments = [tables['uniform']] if stage == 'preprocess_csv_files' else []
+        if trace_memory:
+            tracemalloc.start()
+        error = None
+        start = time.perf_counter()
+        try:
+            with open(os.devnull, 'w') as quiet, contextlib.redirect_stdout(quiet):
+                getattr(analyzer, stage)(*arguments)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        seconds = time.perf_counter() - start
+        plt.close('all')
+        traced = None
+        if trace_memory:
+            traced = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        results.append({'analyzer': kind, 'rows': rows, 'stage': stage, 'seconds': seconds,
+                        'peak_rss_mib': peak_rss_mib(),
+                        'traced_peak_mib': traced, 'error': error})
+    if keep_plots_dir is None:
+        shutil.rmtree(output_dir, ignore_errors=True)
+    return results
+
+
+def scaling_exponents(results):
+    """Log-log slope of seconds against rows per (analyzer, stage): 1 is linear, 2 quadratic."""
+    rows = []
+    for (kind, stage), group in results.groupby(['analyzer', 'stage'], sort=False):
+        group = group[group['seconds'] > 0]
+        slope = np.polyfit(np.log(group['rows']), np.log(group['seconds']), 1)[0] if group['rows'].nunique() > 1 \
+            else float('nan')
+        rows.append({'analyzer': kind, 'stage': stage, 'exponent': slope})
+    return pd.DataFrame(rows)
+
+
+def plot_scaling(results, path):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    kinds = list(results['analyzer'].unique())
+    fig, axes = plt.subplots(1, len(kinds), figsize=(8 * len(kinds), 6), squeeze=False)
+    for ax, kind in zip(axes[0], kinds):
+        for stage, group in results[results['analyzer'] == kind].groupby('stage', sort=False):
+            ax.plot(group['rows'], group['seconds'], marker='o', label=stage)
+        ax.set_xscale('log')
+        ax.set_yscale('log')
+        ax.set_xlabel('Rows')
+        ax.set_ylabel('Seconds')
+        ax.set_title(f"{kind} analyzer")
+        ax.legend(fontsize=7)
+    plt.tight_layout()
+    plt.savefig(path, dpi=150)
+    plt.close(fig)
+
+
+def main():
+    """Times every stage of the Uniform and Waves analyzers on synthetic tables of growing size."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[1e3, 1e4, 1e5],
+                        help="Table sizes in rows (e.g. 1e6 1e7)")
+    parser.add_argument('--analyzers', nargs='+', choices=list(ANALYZERS), default=list(ANALYZERS))
+    parser.add_argument('--data-dir', default=os.path.join(tempfile.gettempdir(), "irpin-synthetic-tables"),
+                        help="Where synthetic tables are written and reused")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help="Also trace each stage's peak allocations (slows the stages down)")
+    parser.add_argument('--out', default=os.path.join(SCRIPT_DIR, "Analysis_Benchmark"),
+                        help="Prefix of the results CSV and scaling plot")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    sizes = sorted({int(size) for size in args.sizes})
+    results = []
+    for rows in sizes:
+        tables = {kind: synthetic_table(kind, rows, args.data_dir, args.seed) for kind in ANALYZERS}
+        for kind in args.analyzers:
+            # A fresh process per case, so its peak memory is its own
+            with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+                case = pool.submit(run_case, kind, rows, tables, args.trace_memory).result()
+            results.extend(case)
+            total = sum(stage['seconds'] for stage in case)
+            print(f"{kind} analyzer, {rows} rows: {total:.2f} s, peak {case[-1]['peak_rss_mib']:.0f} MiB")
+            for stage in case:
+                if stage['error']:
+                    print(f"  {stage['stage']} failed: {stage['error']}")
+
+    results = pd.DataFrame(results)
+    results.to_csv(args.out + ".csv", index=False)
+    with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200,
+                           'display.max_rows', None):
+        order = list(dict.fromkeys(zip(results['analyzer'], results['stage'])))
+        print(results.pivot_table(index=['analyzer', 'stage'], columns='rows', values='seconds').reindex(order))
+        print(scaling_exponents(results).to_string(index=False))
+    plot_scaling(results, args.out + ".png")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+from datetime import datetime
+
+import pandas as pd
+
+import irpin_model
+from sweep import PythonBackend, load_experiments, SCRIPT_DIR
+from worker_pool import peak_rss_mib
+
+
+DEFAULT_BASELINE_FILE = os.path.join(SCRIPT_DIR, "benchmark_baseline.json")
+
+# (name, experiment, point selection, overrides). Every scenario is a point of
+# an experiment in IrpinModel.nlogo; no experiment runs Waves without
+# artillery, so that scenario takes the Waves point with the artillery switch
+# of the No Artillery experiment.
+SCENARIOS = [
+    (f"{spacing.lower()}-{'artillery' if artillery else 'no-artillery'}-{mode[:2]}-sites", experiment,
+     {'site-selection-mode': mode, **selection}, {} if artillery else {'turn-on-artillery?': False})
+    for mode in ("01 Shortest Bridges", "13 Shortest Bridges")
+    for spacing, artillery, experiment, selection in (
+        ('Uniform', True, "Vary Site-Selection Artillery Active", {}),
+        ('Uniform', False, "Varying Site-Selection With No Artillery Active", {}),
+        ('Waves', True, "Vary Site-Selection Artillery Active Waves", {'wave-pause': 70, 'wave-duration': 200}),
+        ('Waves', False, "Vary Site-Selection Artillery Active Waves", {'wave-pause': 70, 'wave-duration': 200}),
+    )
+]
+
+# Largest tolerated relative change before a metric counts as a regression
+DEFAULT_THRESHOLDS = {
+    'ticks_per_second': 0.10,
+    'runs_per_hour_per_core': 0.10,
+    'peak_memory_mib': 0.20,
+}
+HIGHER_IS_BETTER = {'ticks_per_second': True, 'runs_per_hour_per_core': True, 'peak_memory_mib': False}
+
+
+def scenario_params(experiments=None):
+    """Parameters of every benchmark scenario, taken from the experiment definitions.
+
+    Returns:
+        dict: Scenario name -> parameter dict.
+    """
+    experiments = experiments or load_experiments()
+    scenarios = {}
+    for name, experiment_name, selection, overrides in SCENARIOS:
+        experiment = experiments[experiment_name]
+        point = next((p for p in experiment.points() if all(p.get(k) == v for k, v in selection.items())), None)
+        if point is None:
+            raise ValueError(f"Experiment {experiment_name!r} has no point matching {selection}")
+        scenarios[name] = {**point, **overrides}
+    return scenarios
+
+
+def run_scenario(params, seeds, max_ticks=None):
+    """Times fixed-seed runs of one scenario, then measures the peak traced memory of one more run.
+
+    Peak memory is what a run allocates on top of the shared map.
+
+    Returns:
+        dict: Runs, ticks and seconds per run, ticks per second, runs per
+        hour per core and peak memory (MiB of Python and numpy allocations).
+    """
+    map_data = irpin_model.load_map()
+    # Warm-up, so the first scenario does not pay for the shared terrain lists
+    irpin_model.IrpinModel(params, seeds[0], map_data).run(max_ticks=50)
+    ticks = 0
+    start = time.perf_counter()
+    for seed in seeds:
+        ticks += irpin_model.IrpinModel(params, seed, map_data).run(max_ticks=max_ticks)['[step]']
+    seconds = time.perf_counter() - start
+
+    tracemalloc.start()
+    irpin_model.IrpinModel(params, seeds[0], map_data).run(max_ticks=max_ticks)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        'runs': len(seeds),
+        'ticks_per_run': ticks / len(seeds),
+        'seconds_per_run': seconds / len(seeds),
+        'ticks_per_second': ticks / seconds,
+        'runs_per_hour_per_core': 3600 * len(seeds) / seconds,
+        'peak_memory_mib': peak / 2 ** 20,
+    }
+
+
+def run_suite(names=None, reps=3, max_ticks=None):
+    """Runs the benchmark scenarios (all of them by default) with seeds 0..reps-1.
+
+    Returns:
+        dict: JSON-ready report with the environment and one entry per scenario.
+    """
+    scenarios = scenario_params()
+    names = list(names or scenarios)
+    unknown = [name for name in names if name not in scenarios]
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(unknown)}")
+    report = {
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        # Same version as the sweep cache: the model, the movement kernel and the map
+        'model_version': PythonBackend().version,
+        'reps': reps,
+        'max_ticks': max_ticks,
+        'scenarios': {},
+    }
+    for name in names:
+        report['scenarios'][name] = {'params': scenarios[name],
+                                     **run_scenario(scenarios[name], list(range(reps)), max_ticks)}
+    report['process_peak_rss_mib'] = peak_rss_mib()
+    return report
+
+
+def compare(report, baseline, thresholds=None):
+    """Compares a report with a baseline report.
+
+    Args:
+        thresholds: Metric -> largest tolerated relative change in the bad
+            direction (DEFAULT_THRESHOLDS for the metrics not given).
+
+    Returns:
+        pandas.DataFrame: One row per (scenario, metric) present in both
+        reports with the baseline and current values, the relative change
+        and whether it is a regression.
+    """
+    limits = dict(DEFAULT_THRESHOLDS)
+    limits.update(thresholds or {})
+    rows = []
+    for name, current in report['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            continue
+        for metric, limit in limits.items():
+            change = current[metric] / previous[metric] - 1
+            worse = -change if HIGHER_IS_BETTER[metric] else change
+            rows.append({'scenario': name, 'metric': metric, 'baseline': previous[metric],
+                         'current': current[metric], 'change': change, 'regression': worse > limit})
+    return pd.DataFrame(rows, columns=['scenario', 'metric', 'baseline', 'current', 'change', 'regression'])
+
+
+def main():
+    """Benchmarks the Python port on fixed-seed scenarios from the model's experiments and gates regressions."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--scenarios', nargs='+', default=None, help="Scenario names (default: all)")
+    parser.add_argument('--list', action='store_true', help="List the scenarios and their parameters")
+    parser.add_argument('--reps', type=int, default=3, help="Fixed seeds 0..reps-1 per scenario")
+    parser.add_argument('--max-ticks', type=int, default=None)
+    parser.add_argument('--output', default=None, help="Write the report as JSON to this file")
+    parser.add_argument('--baseline', default=None, help="Baseline report to compare against")
+    parser.add_argument('--save-baseline', action='store_true',
+                        help=f"Also write the report to {DEFAULT_BASELINE_FILE}")
+    parser.add_argument('--max-slowdown', type=float, default=DEFAULT_THRESHOLDS['ticks_per_second'],
+                        help="Tolerated relative drop of ticks/s and runs/hour")
+    parser.add_argument('--max-memory-growth', type=float, default=DEFAULT_THRESHOLDS['peak_memory_mib'],
+                        help="Tolerated relative growth of the peak memory")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, params in scenario_params().items():
+            print(f"{name}: {params}")
+        return
+
+    report = run_suite(args.scenarios, args.reps, args.max_ticks)
+    table = pd.DataFrame(report['scenarios']).T.drop(columns='params')
+    with pd.option_context('display.float_format', '{:.2f}'.format, 'display.width', 200,
+                           'display.max_columns', None):
+        print(table)
+    for path in [args.output] + ([DEFAULT_BASELINE_FILE] if args.save_baseline else []):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        thresholds = {'ticks_per_second': args.max_slowdown, 'runs_per_hour_per_core': args.max_slowdown,
+                      'peak_memory_mib': args.max_memory_growth}
+        comparison = compare(report, baseline, thresholds)
+        with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200,
+                           'display.max_columns', None):
+            print(comparison.to_string(index=False))
+        regressions = comparison[comparison['regression']]
+        if len(regressions):
+            print(f"{len(regressions)} regression(s) beyond the thresholds")
+            sys.exit(1)
+        print("No regressions beyond the thresholds")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+import numpy as np
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from adaptive import wilson_interval
+
+
+def plot_wave_heatmaps(cells, path, title=None, label_cells=400, dpi=300):
+    """Success and casualty rate over (wave-pause, wave-duration), pooled over the other cell columns.
+
+    Args:
+        cells: Per-cell totals with wave-pause and wave-duration columns (see run_data.cell_totals).
+        label_cells: Largest grid whose cells are labelled with their values.
+    """
+    pooled = cells.groupby(['wave-pause', 'wave-duration'])[['runs', 'victories', 'total_infantry_casualties_10',
+                                                            'total_infantry_used']].sum()
+    used = pooled['total_infantry_used']
+    pooled['win_rate'] = 100 * pooled['victories'] / pooled['runs']
+    pooled['casualty_rate'] = (100 * pooled['total_infantry_casualties_10'] / used.where(used > 0)).fillna(0)
+
+    fig, axes = plt.subplots(1, 2, figsize=(18, 8))
+    for ax, column, label, cmap in ((axes[0], 'win_rate', 'Success Rate (%)', 'YlGn'),
+                                    (axes[1], 'casualty_rate', 'Casualty Rate (%)', 'YlOrRd')):
+        matrix = pooled[column].unstack('wave-duration')
+        image = ax.imshow(matrix.values, cmap=cmap, interpolation='nearest', aspect='auto')
+        ax.set_title(label, fontsize=16, fontweight='bold')
+        ax.set_xlabel('Wave Duration', fontsize=14, fontweight='bold')
+        ax.set_ylabel('Wave Pause', fontsize=14, fontweight='bold')
+        ax.set_xticks(range(len(matrix.columns)))
+        ax.set_yticks(range(len(matrix.index)))
+        ax.set_xticklabels(matrix.columns)
+        ax.set_yticklabels(matrix.index)
+        fig.colorbar(image, ax=ax).set_label(label, fontsize=12, fontweight='bold')
+        if matrix.size <= label_cells:
+            fontsize = 10 if matrix.size <= 100 else 7
+            for i in range(matrix.shape[0]):
+                for j in range(matrix.shape[1]):
+                    # Cells without runs yet are left blank
+                    if not np.isnan(matrix.values[i, j]):
+                        ax.text(j, i, f'{matrix.values[i, j]:.1f}%', ha='center', va='center', color='black',
+                                fontsize=fontsize)
+    if title:
+        fig.suptitle(title, fontsize=14)
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+
+
+def plot_win_rates(cells, path, by='site_selection_mode', title=None, z=None, dpi=300):
+    """Bar chart of the success rate of each site selection strategy, pooled over the other cell columns.
+
+    Args:
+        cells: Per-cell totals with a `by` column (see run_data.cell_totals).
+        z: If given, draws the Wilson interval at this z (1.96 for 95%) on every bar.
+    """
+    grouped = cells.groupby(by, sort=False)[['runs', 'victories']].sum()
+    modes = list(grouped.index)
+    rates = (100 * grouped['victories'] / grouped['runs']).to_numpy()
+    tops = rates
+    errors = None
+    if z is not None:
+        bounds = 100 * np.array([wilson_interval(wins, n, z) for wins, n in zip(grouped['victories'], grouped['runs'])])
+        errors = [rates - bounds[:, 0], bounds[:, 1] - rates]
+        tops = bounds[:, 1]
+
+    fig = plt.figure(figsize=(12, 8))
+    # Colored from yellow to green by success rate
+    bars = plt.bar(modes, rates, yerr=errors, capsize=4, color=plt.cm.YlGn(rates / 100), width=0.6,
+                   edgecolor='black', linewidth=0.8)
+    for bar, rate, top in zip(bars, rates, tops):
+        plt.text(bar.get_x() + bar.get_width() / 2., top + 2,
+                 f'{rate:.1f}%', ha='center', va='bottom', fontsize=11, fontweight='bold')
+
+    plt.title('Success Rate by Site Selection Strategy', fontsize=16, fontweight='bold', pad=20)
+    if title:
+        fig.suptitle(title, fontsize=12)
+    plt.xlabel('Site Selection Strategy', fontsize=14, fontweight='bold', labelpad=10)
+    plt.ylabel('Success Rate (%)', fontsize=14, fontweight='bold', labelpad=10)
+    plt.xticks(rotation=45, ha='right', fontsize=11)
+    plt.ylim(0, 110 if z is not None else 105)  # Display 0-100% with some margin
+    plt.grid(axis='y', linestyle='--', alpha=0.7)
+    plt.tight_layout()
+    plt.savefig(path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
@@ -0,0 +1,436 @@
+import math
+import argparse
+from collections import deque
+
+from irpin_model import (
+    MAP_FILE, NUM_SITES, ENTRIES, SITE_ENTRY, INFANTRY, TRUCK, DEFAULT_PARAMS,
+    NUM_REQUIRED_PONTOONS_PER_SITE, SITE_INFANTRY_UNITS_PER_ROAD, IrpinModel, RandomStreams, load_map, select_sites
+)
+
+
+# Ticks per coarse step; a divisor of time-between-drone-checks keeps the strikes on their ticks
+COARSE_STEP = 10
+
+# Fitted by calibrate() over CALIBRATION_GRID against full-resolution runs of irpin_model.py (all 13 modes,
+# Uniform and Waves, seeds 0-4), reproduced by `python coarse_model.py --seeds 5`. The coarse runs end the
+# same way in about 91% of those runs; the win rates of modes 07-10 still differ by up to 40 points.
+CALIBRATION = {
+    'infantry-spacing': 4.0,   # patches of road per queued infantry unit
+    'truck-spacing': 200.0,    # patches of road per queued truck (200 leaves room for one truck per site)
+    'bridge-rate': 0.4,        # infantry units starting across a finished bridge per tick
+    'travel-scale': 0.8,       # multiplier on free-flow travel times
+    'infantry-entry-rate': 0.6,  # share of infantry deployment turns that release a unit
+    'truck-entry-rate': 0.7,     # share of truck turns that release a truck (the rest clog behind the last one)
+}
+
+
+_ROUTES = {}
+
+
+def install_routes(routes, map_file=MAP_FILE):
+    """Makes free_flow_routes return `routes` for `map_file` (measured once by a worker pool host)."""
+    _ROUTES[map_file] = routes
+
+
+def free_flow_routes(map_file=MAP_FILE):
+    """Travel time (ticks) and road length (patches) of a lone unit from its entry to each site.
+
+    Measured by moving a single unit with the full-resolution movement code,
+    so acceleration, the dirt-road speed limit and the turns are included.
+
+    Returns:
+        dict: (site, breed) -> (ticks, length)
+    """
+    if map_file in _ROUTES:
+        return _ROUTES[map_file]
+    model = IrpinModel({'site-selection-mode': "13 Shortest Bridges"}, 0, load_map(map_file))
+    routes = {}
+    for site in range(NUM_SITES):
+        _, x, y, heading, _ = ENTRIES[SITE_ENTRY[site]]
+        for breed in (INFANTRY, TRUCK):
+            model.setup()
+            model._create_unit(breed, site, x, y, heading, 1)
+            ticks, length, last = 0, 0, (x, y)
+            while model.agents.n and ticks < 10000:
+                model.move_units()
+                ticks += 1
+                if model.agents.n:
+                    here = (int(model.agents.x[0]), int(model.agents.y[0]))
+                    length += abs(here[0] - last[0]) + abs(here[1] - last[1])
+                    last = here
+            routes[(site, breed)] = (ticks, length)
+    _ROUTES[map_file] = routes
+    return routes
+
+
+class CoarseIrpinModel:
+    """Coarse-fidelity version of IrpinModel with a multi-tick step and aggregated movement.
+
+    Units are not moved patch by patch. Each spawned unit becomes a count in
+    a per-site pipeline that arrives after its free-flow travel time. Units
+    that cannot deliver yet (infantry once a site has its builders and no
+    bridge, trucks once a site has all its pontoons) wait in a per-site
+    queue, and a queue whose length fills the road clogs its entry point.
+    Spawning, deliveries, construction, activity durations, artillery
+    checks and stop conditions keep the rules of the full model, evaluated
+    once per `step` ticks. Artillery draws use the same random streams, so
+    common random numbers also pair coarse and full runs.
+
+    Args:
+        params: Parameter overrides (NetLogo global names, see DEFAULT_PARAMS).
+        seed: Run seed.
+        step: Ticks per coarse step.
+        calibration: Overrides of CALIBRATION.
+    """
+
+    def __init__(self, params=None, seed=0, step=COARSE_STEP, calibration=None, map_data=None):
+        self.params = dict(DEFAULT_PARAMS)
+        self.params.update(params or {})
+        p = self.params
+        if p['time-between-drone-checks'] % step:
+            raise ValueError(f"step {step} must divide time-between-drone-checks ({p['time-between-drone-checks']})")
+        self.step = step
+        self.calibration = dict(CALIBRATION)
+        self.calibration.update(calibration or {})
+        self.map = map_data or load_map()
+        self.seed = seed
+        crn_replicate = int(p['crn-replicate']) if p['crn-mode?'] else None
+        self.streams = RandomStreams(seed, crn_replicate)
+
+        self.chosen_site_ids = select_sites(p['site-selection-mode'], p['custom-site-ids'])
+        self.entry_sites = [[s for s in entry[4] if s in self.chosen_site_ids] for entry in ENTRIES]
+        routes = free_flow_routes()
+        scale = self.calibration['travel-scale']
+        spacing = (self.calibration['infantry-spacing'], self.calibration['truck-spacing'])
+        self.travel = [[max(1, round(routes[(s, b)][0] * scale)) for b in (INFANTRY, TRUCK)] for s in range(NUM_SITES)]
+        self.capacity = [[max(1, int(routes[(s, b)][1] / spacing[b])) for b in (INFANTRY, TRUCK)]
+                         for s in range(NUM_SITES)]
+        self.crossing_time = [
+            max(1, math.ceil((self.map.bridge_end_x[s] - self.map.bridge_start_x[s]) / p['infantry-max-dirt-speed']))
+            if self.map.bridge_start_x[s] is not None and self.map.bridge_end_x[s] is not None else 1
+            for s in range(NUM_SITES)
+        ]
+        self.setup()
+
+    def setup(self):
+        self.ticks = 0
+        self.builder_count = [0] * NUM_SITES
+        self.pontoon_count = [0] * NUM_SITES
+        self.pontoon_built_count = [0] * NUM_SITES
+        self.bridge_built = [False] * NUM_SITES
+        self.time_of_last_activity = [-1] * NUM_SITES
+        self.activity_duration = [0] * NUM_SITES
+        self.first_bridge_tick = [-1] * NUM_SITES
+        self.strike_count = [0] * NUM_SITES
+        self.pontoons_delivered = [0] * NUM_SITES
+        self.pontoons_built = [0] * NUM_SITES
+        self.infantry_crossed = [0] * NUM_SITES
+        self.waiting = [[0] * NUM_SITES, [0] * NUM_SITES]
+        self.in_transit = [[deque() for _ in range(NUM_SITES)], [deque() for _ in range(NUM_SITES)]]
+        self.crossing = [deque() for _ in range(NUM_SITES)]
+        self._bridge_credit = [0.0] * NUM_SITES
+        self._entry_credit = [[0.0, 0.0] for _ in ENTRIES]
+
+        self.total_pontoons_built = 0
+        self.total_infantry_crossed = 0
+        self.total_infantry_used = 0
+        self.total_pontoons_used = 0
+        self.total_infantry_casualties = 0
+        self.battle_outcome = "In Progress"
+        self.spawn_index_infantry = [len(entry[4]) - 1 for entry in ENTRIES]
+        self.spawn_index_trucks = [len(entry[4]) - 1 for entry in ENTRIES]
+        self.deployment_index = [0] * len(ENTRIES)
+        self.done = False
+
+    def _payload(self, breed, site):
+        p = self.params
+        if breed == INFANTRY:
+            return p['infantry-unit-depth'] * SITE_INFANTRY_UNITS_PER_ROAD[site] * 10
+        return p['truck-pontoon-module-capacity'] * p['truck-unit-depth'] * 10
+
+    def go(self):
+        """Runs one coarse step. Returns False once the battle is over."""
+        if self.done:
+            return False
+        end = self.ticks + self.step
+        self.move_units(end)
+        self.spawn_units(end)
+        self.build_pontoon_bridges(end)
+        if self.params['turn-on-artillery?']:
+            self.drone_detect_and_artillery_fire(end)
+        self.ticks = end
+        if self.params['turn-on-stop-conditions?'] and self.battle_over():
+            self.done = True
+            return False
+        return True
+
+    def run(self, max_ticks=None):
+        """Runs until the battle is over (or `max_ticks`) and returns the metrics."""
+        if max_ticks is None and not self.params['turn-on-stop-conditions?']:
+            raise ValueError("max_ticks is required when turn-on-stop-conditions? is off")
+        while not self.done:
+            if max_ticks is not None and self.ticks >= max_ticks:
+                break
+            self.go()
+        return self.results()
+
+    results = IrpinModel.results
+    site_results = IrpinModel.site_results
+
+    def move_units(self, end):
+        """Moves arrivals into the site queues, delivers what the sites accept and starts bridge crossings."""
+        required_builders = self.params['num-required-builders-per-site']
+        for site in self.chosen_site_ids:
+            for breed in (INFANTRY, TRUCK):
+                pipeline = self.in_transit[breed][site]
+                while pipeline and pipeline[0][0] < end:
+                    self.waiting[breed][site] += pipeline.popleft()[1]
+
+            payload = self._payload(TRUCK, site)
+            while self.waiting[TRUCK][site] and self.pontoon_count[site] < NUM_REQUIRED_PONTOONS_PER_SITE[site]:
+                self.pontoon_count[site] += payload
+                self.pontoons_delivered[site] += payload
+                self.waiting[TRUCK][site] -= 1
+
+            payload = self._payload(INFANTRY, site)
+            while self.waiting[INFANTRY][site] and self.builder_count[site] < required_builders:
+                self.builder_count[site] += payload
+                self.waiting[INFANTRY][site] -= 1
+
+            crossing = self.crossing[site]
+            while crossing and crossing[0][0] < end:
+                crossed = crossing.popleft()[1] * payload
+                self.total_infantry_crossed += crossed
+                self.infantry_crossed[site] += crossed
+            if self.bridge_built[site] and self.waiting[INFANTRY][site]:
+                self._bridge_credit[site] += self.calibration['bridge-rate'] * self.step
+                starting = min(self.waiting[INFANTRY][site], int(self._bridge_credit[site]))
+                if starting:
+                    self._bridge_credit[site] -= starting
+                    self.waiting[INFANTRY][site] -= starting
+                    crossing.append([end + self.crossing_time[site], starting])
+
+    def _clogged(self, entry, breed):
+        return any(self.waiting[breed][s] >= self.capacity[s][breed] for s in self.entry_sites[entry])
+
+    def spawn_units(self, end):
+        p = self.params
+        spacing = p['spacing-mode']
+        period = p['wave-duration'] + p['wave-pause']
+        rates = (self.calibration['infantry-entry-rate'], self.calibration['truck-entry-rate'])
+        for e in range(len(ENTRIES)):
+            sites = self.entry_sites[e]
+            if not sites:
+                continue
+            clogged = (self._clogged(e, INFANTRY), self._clogged(e, TRUCK))
+            if clogged[INFANTRY] and clogged[TRUCK]:
+                continue
+            for tick in range(self.ticks, end):
+                if spacing == "Waves" and tick % period >= p['wave-duration']:
+                    continue
+                if spacing not in ("Waves", "Uniform"):
+                    continue
+                breed = self.deployment_index[e] % 2
+                credit = self._entry_credit[e]
+                if not clogged[breed]:
+                    credit[breed] += rates[breed]
+                if not clogged[breed] and credit[breed] >= 1:
+                    credit[breed] -= 1
+                    index = self.spawn_index_infantry if breed == INFANTRY else self.spawn_index_trucks
+                    site = sites[index[e] % len(sites)]
+                    index[e] -= 1
+                    pipeline = self.in_transit[breed][site]
+                    arrival = tick + self.travel[site][breed]
+                    if pipeline and pipeline[-1][0] == arrival:
+                        pipeline[-1][1] += 1
+                    else:
+                        pipeline.append([arrival, 1])
+                    if breed == INFANTRY:
+                        self.total_infantry_used += p['infantry-unit-depth']
+                    else:
+                        self.total_pontoons_used += self._payload(TRUCK, site)
+                self.deployment_index[e] += 1
+
+    def build_pontoon_bridges(self, end):
+        """Builds up to one pontoon module per tick of the step at every staffed, supplied site."""
+        required_builders = self.params['num-required-builders-per-site']
+        per_tick = 1 / self.params['pontoon-module-setup-time']
+        for site in self.chosen_site_ids:
+            if self.bridge_built[site]:
+                continue
+            required = NUM_REQUIRED_PONTOONS_PER_SITE[site]
+            if self.builder_count[site] >= required_builders and self.pontoon_count[site] >= 1:
+                modules = min(per_tick * self.step, math.floor(self.pontoon_count[site]),
+                              required - self.pontoon_built_count[site])
+                self.total_pontoons_built += modules
+                self.pontoon_built_count[site] += modules
+                self.pontoons_built[site] += modules
+                self.pontoon_count[site] -= modules
+            if self.pontoon_built_count[site] >= required:
+                self.bridge_built[site] = True
+                if self.first_bridge_tick[site] < 0:
+                    self.first_bridge_tick[site] = end - 1
+
+    def _attacked_recently(self, site, tick):
+        last = self.time_of_last_activity[site]
+        return last != -1 and tick - last < self.params['activity-cooldown-time']
+
+    def drone_detect_and_artillery_fire(self, end):
+        p = self.params
+        last_tick = end - 1
+        for site in self.chosen_site_ids:
+            if self.pontoon_built_count[site] > 0:
+                self.time_of_last_activity[site] = last_tick
+                self.activity_duration[site] += self.step
+            elif not self._attacked_recently(site, last_tick):
+                self.activity_duration[site] = 0
+
+        num_active = sum(1 for site in self.chosen_site_ids if self.pontoon_built_count[site] > 0)
+        if num_active == 0:
+            return
+        for tick in range(self.ticks, end):
+            if tick % p['time-between-drone-checks']:
+                continue
+            for site in self.chosen_site_ids:
+                if not self._attacked_recently(site, last_tick):
+                    continue
+                duration = self.activity_duration[site]
+                if duration > 45:
+                    p_destroyed = max(0, 1 - p['artillery-alpha'] * num_active) * \
+                        (1 - math.exp(-p['artillery-beta'] * (duration - 45)))
+                    if self.streams.uniform('artillery', tick * 16 + site) < p_destroyed:
+                        self.destroy_site(site)
+
+    def destroy_site(self, site):
+        self.total_infantry_casualties += self.builder_count[site]
+        self.builder_count[site] = 0
+        self.pontoon_count[site] = 0
+        self.pontoon_built_count[site] = 0
+        self.bridge_built[site] = False
+        self.strike_count[site] += 1
+        # Infantry still on the bridge goes down with it
+        on_bridge = sum(count for _, count in self.crossing[site])
+        self.total_infantry_casualties += on_bridge * self._payload(INFANTRY, site)
+        self.crossing[site].clear()
+
+    battle_over = IrpinModel.battle_over
+
+
+CALIBRATION_GRID = {
+    'infantry-spacing': (2.0, 2.5, 3.0, 4.0, 5.0),
+    'truck-spacing': (2.0, 4.0, 6.0, 10.0, 20.0, 30.0, 60.0, 100.0, 200.0),
+    'bridge-rate': (0.25, 0.4, 0.6, 0.8, 1.0, 2.0),
+    'travel-scale': (0.5, 0.6, 0.7, 0.8, 1.0, 1.25),
+    'infantry-entry-rate': (0.3, 0.4, 0.5, 0.6, 0.8, 1.0),
+    'truck-entry-rate': (0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0),
+}
+CALIBRATION_METRICS = ('[step]', 'total-infantry-used', 'total-pontoons-used', 'total-infantry-casualties / 10')
+
+
+def calibration_loss(reference, coarse):
+    """Discrepancy between full-resolution and coarse runs of the same (params, seed) jobs.
+
+    Per configuration, the squared win-rate difference plus the squared log
+    ratio of the mean of every CALIBRATION_METRICS column, averaged over
+    configurations.
+    """
+    keys = [c for c in reference.columns if c in DEFAULT_PARAMS]
+    loss = 0.0
+    groups = list(reference.groupby(keys, dropna=False).groups.values())
+    for index in groups:
+        fine, approx = reference.loc[index], coarse.loc[index]
+        loss += ((fine['battle-outcome'] == 'Victory').mean() - (approx['battle-outcome'] == 'Victory').mean()) ** 2
+        for metric in CALIBRATION_METRICS:
+            loss += math.log((approx[metric].mean() + 1) / (fine[metric].mean() + 1)) ** 2
+    return loss / len(groups)
+
+
+def coarse_runs(reference, calibration=None, step=COARSE_STEP):
+    """The reference table with its outcome and CALIBRATION_METRICS columns replaced by coarse runs of the same jobs."""
+    param_names = [c for c in reference.columns if c in DEFAULT_PARAMS]
+    rows = [CoarseIrpinModel({name: row[name] for name in param_names}, int(row['seed']), step, calibration).run()
+            for _, row in reference.iterrows()]
+    return reference.assign(**{
+        column: [row[column] for row in rows] for column in CALIBRATION_METRICS + ('battle-outcome',)
+    })
+
+
+def calibrate(reference, grid=CALIBRATION_GRID, rounds=2, step=COARSE_STEP):
+    """Fits the coarse-model calibration to full-resolution runs by coordinate search over `grid`.
+
+    Args:
+        reference: Full-resolution runs, one row per job with the parameter
+            columns, `seed` and the BehaviorSpace metric columns.
+
+    Returns:
+        tuple: (calibration dict, loss)
+    """
+    reference = reference.reset_index(drop=True)
+
+    def loss_of(calibration):
+        return calibration_loss(reference, coarse_runs(reference, calibration, step))
+
+    best = dict(CALIBRATION)
+    best_loss = loss_of(best)
+    for _ in range(rounds):
+        for name, values in grid.items():
+            for value in values:
+                if value == best[name]:
+                    continue
+                trial = dict(best, **{name: value})
+                trial_loss = loss_of(trial)
+                if trial_loss < best_loss:
+                    best, best_loss = trial, trial_loss
+    return best, best_loss
+
+
+def agreement(reference, coarse, by=('spacing-mode', 'site-selection-mode')):
+    """Win rate and mean ticks of full-resolution and coarse runs of the same jobs, per cell.
+
+    Returns:
+        pandas.DataFrame: One row per cell, with the share of jobs whose
+        outcome is the same at both fidelities.
+    """
+    by = list(by)
+    table = reference[by].copy()
+    table['full_win'] = 100.0 * (reference['battle-outcome'] == 'Victory')
+    table['coarse_win'] = 100.0 * (coarse['battle-outcome'] == 'Victory')
+    table['full_ticks'] = reference['[step]']
+    table['coarse_ticks'] = coarse['[step]']
+    table['same_outcome'] = 100.0 * (reference['battle-outcome'] == coarse['battle-outcome'])
+    return table.groupby(by, sort=False).mean().reset_index()
+
+
+def main():
+    """Fits CALIBRATION to full-resolution runs of every site-selection mode, Uniform and Waves."""
+    from run_cache import RunCache, DEFAULT_CACHE_FILE
+    from sweep import Sweep, PythonBackend
+
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--seeds', type=int, default=3, help="Full-resolution runs per mode and spacing mode")
+    parser.add_argument('--seed-base', type=int, default=0)
+    parser.add_argument('--rounds', type=int, default=2, help="Coordinate-search passes over CALIBRATION_GRID")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    backend = PythonBackend(processes=args.threads)
+    points = [{'site-selection-mode': f"{n:02d} Shortest Bridges", 'spacing-mode': spacing}
+              for spacing in ('Uniform', 'Waves') for n in range(1, NUM_SITES + 1)]
+    with RunCache(args.cache) as cache:
+        sweep = Sweep(backend, cache, base_params=backend.default_params())
+        reference = sweep.run(sweep.jobs_for(points, args.seeds, args.seed_base))
+
+    start_loss = calibration_loss(reference, coarse_runs(reference))
+    calibration, loss = calibrate(reference, rounds=args.rounds)
+    print(f"Loss {start_loss:.4f} with CALIBRATION, {loss:.4f} fitted over {len(reference)} runs:")
+    for name, value in calibration.items():
+        print(f"    '{name}': {value},")
+    table = agreement(reference, coarse_runs(reference, calibration))
+    print(table.to_string(index=False, float_format='{:.0f}'.format))
+    print(f"Same outcome in {table['same_outcome'].mean():.1f}% of runs; win rate off by up to "
+          f"{(table['full_win'] - table['coarse_win']).abs().max():.0f} points")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,204 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from irpin_model import NUM_SITES, IrpinModel, load_map
+
+
+STRIKE = 0
+BRIDGE = 1
+KIND_NAMES = {STRIKE: 'strike', BRIDGE: 'bridge'}
+
+# One fixed-width record per event
+EVENT_DTYPE = np.dtype([
+    ('run_id', '<u4'),
+    ('tick', '<i4'),
+    ('kind', 'u1'),
+    ('site', 'u1'),
+    ('active_sites', 'u1'),
+    ('activity_duration', '<i4'),
+    ('p_destroyed', '<f4'),
+    ('builders_killed', '<i4'),
+    ('infantry_killed', '<i4'),
+    ('pontoons_lost', '<f4'),
+])
+MAGIC = b"IRPINEV1"
+HEADER_SIZE = 256
+
+
+def _header():
+    descr = json.dumps(EVENT_DTYPE.descr).encode()
+    return MAGIC + descr.ljust(HEADER_SIZE - len(MAGIC))
+
+
+class EventLog:
+    """Binary append-only log of artillery strikes and bridge completions.
+
+    The file is a fixed header (with the record layout) followed by
+    EVENT_DTYPE records. Events are buffered in a preallocated record array
+    and appended to the file when it fills up or the log is closed, so a
+    crashed run leaves at most a truncated last record, which the reader
+    ignores. Runs write through `for_run`; concurrent processes should use
+    one log file each.
+    """
+
+    def __init__(self, path, buffer_events=4096):
+        self.path = path
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as f:
+                f.write(_header())
+        else:
+            _check_header(path)
+        self.buffer = np.zeros(buffer_events, dtype=EVENT_DTYPE)
+        self.pending = 0
+        self.written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def for_run(self, run_id):
+        """The handle a model logs through (set it as `model.events`)."""
+        return RunEvents(self, run_id)
+
+    def append(self, run_id, tick, kind, site, active_sites, activity_duration, p_destroyed=np.nan,
+               builders_killed=0, infantry_killed=0, pontoons_lost=0.0):
+        if self.pending == len(self.buffer):
+            self.flush()
+        self.buffer[self.pending] = (run_id, tick, kind, site, active_sites, activity_duration, p_destroyed,
+                                     builders_killed, infantry_killed, pontoons_lost)
+        self.pending += 1
+
+    def flush(self):
+        if self.pending:
+            with open(self.path, 'ab') as f:
+                f.write(self.buffer[:self.pending].tobytes())
+            self.written += self.pending
+            self.pending = 0
+
+    def close(self):
+        self.flush()
+
+
+class RunEvents:
+    """Logs the events of one run into an EventLog."""
+
+    def __init__(self, log, run_id):
+        self.log = log
+        self.run_id = run_id
+
+    def strike(self, model, site, num_active, p_destroyed, builders_killed, infantry_killed, pontoons_lost):
+        """Logs a strike the model has just carried out (destroy-site) with what it cost."""
+        self.log.append(self.run_id, model.ticks, STRIKE, site, num_active, int(model.activity_duration[site]),
+                        p_destroyed, builders_killed, infantry_killed, pontoons_lost)
+
+    def bridge(self, model, site):
+        active = int(np.count_nonzero(model.site_table.chosen[model.row] & (model.pontoon_built_count > 0)))
+        self.log.append(self.run_id, model.ticks, BRIDGE, site, active, int(model.activity_duration[site]))
+
+
+def _check_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+    if not header.startswith(MAGIC):
+        raise ValueError(f"{path} is not an event log")
+    descr = json.loads(header[len(MAGIC):].decode().strip())
+    if np.dtype([tuple(field) for field in descr]) != EVENT_DTYPE:
+        raise ValueError(f"{path} was written with another record layout")
+
+
+def read_events(path):
+    """Memory-maps an event log as a read-only NumPy structured array (no copy, so any size opens instantly)."""
+    _check_header(path)
+    count = (os.path.getsize(path) - HEADER_SIZE) // EVENT_DTYPE.itemsize
+    if count == 0:
+        return np.zeros(0, dtype=EVENT_DTYPE)
+    return np.memmap(path, dtype=EVENT_DTYPE, mode='r', offset=HEADER_SIZE, shape=(count,))
+
+
+def strikes_by_duration(events, bin_width=10):
+    """Strike counts per site and activity-duration bin.
+
+    Returns:
+        pandas.DataFrame: Sites as rows, bins (lower edge in ticks) as columns.
+    """
+    # Field by field: masking whole records of a memory-mapped log would copy all of them
+    strike = events['kind'] == STRIKE
+    sites = events['site'][strike].astype(np.int64)
+    bins = events['activity_duration'][strike] // bin_width
+    width = int(bins.max()) + 1 if len(bins) else 1
+    counts = np.bincount(sites * width + bins, minlength=NUM_SITES * width).reshape(NUM_SITES, width)
+    table = pd.DataFrame(counts, columns=np.arange(width) * bin_width)
+    table.index.name = 'site'
+    return table.loc[:, counts.any(axis=0)]
+
+
+def site_summary(events):
+    """Per site: strikes, bridges completed and the losses and activity duration at the strikes."""
+    strike = events['kind'] == STRIKE
+    sites = events['site'][strike]
+
+    def per_site(field):
+        return np.bincount(sites, weights=events[field][strike], minlength=NUM_SITES)
+
+    strikes = np.bincount(sites, minlength=NUM_SITES)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return pd.DataFrame({
+            'strikes': strikes,
+            'bridges': np.bincount(events['site'][~strike], minlength=NUM_SITES),
+            'mean_duration': per_site('activity_duration') / strikes,
+            'mean_p_destroyed': per_site('p_destroyed') / strikes,
+            'builders_killed': per_site('builders_killed'),
+            'infantry_killed': per_site('infantry_killed'),
+            'pontoons_lost': per_site('pontoons_lost'),
+        }).rename_axis('site')
+
+
+def main():
+    """Runs the Python port with an artillery event log, or summarizes an existing log."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('log', help="Event log file (appended to when running)")
+    parser.add_argument('--runs', type=int, default=0, help="Runs to simulate and log first (seeds 0..runs-1)")
+    parser.add_argument('--site-selection-mode', default="13 Shortest Bridges")
+    parser.add_argument('--spacing-mode', choices=['Uniform', 'Waves'], default="Uniform")
+    parser.add_argument('--wave-pause', type=int, default=None)
+    parser.add_argument('--wave-duration', type=int, default=None)
+    parser.add_argument('--first-run-id', type=int, default=0)
+    parser.add_argument('--bin-width', type=int, default=100, help="Activity-duration bin of the strike table")
+    args = parser.parse_args()
+
+    if args.runs:
+        params = {'site-selection-mode': args.site_selection_mode, 'spacing-mode': args.spacing_mode}
+        for name, value in (('wave-pause', args.wave_pause), ('wave-duration', args.wave_duration)):
+            if value is not None:
+                params[name] = value
+        map_data = load_map()
+        with EventLog(args.log) as log:
+            for seed in range(args.runs):
+                model = IrpinModel(params, seed, map_data)
+                model.events = log.for_run(args.first_run_id + seed)
+                model.run()
+            log.flush()
+            print(f"Logged {log.written} events of {args.runs} runs to {args.log}")
+
+    start = time.perf_counter()
+    events = read_events(args.log)
+    summary = site_summary(events)
+    by_duration = strikes_by_duration(events, args.bin_width)
+    seconds = time.perf_counter() - start
+    print(f"{len(events)} events, summarized in {seconds * 1000:.1f} ms")
+    with pd.option_context('display.float_format', '{:.2f}'.format, 'display.width', 200,
+                           'display.max_columns', None):
+        print(summary[(summary['strikes'] > 0) | (summary['bridges'] > 0)])
+        print("\nStrikes per site by activity duration (ticks):")
+        print(by_duration[by_duration.sum(axis=1) > 0])
+
+
+if __name__ == '__main__':
+    main()
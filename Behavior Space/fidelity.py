@@ -0,0 +1,271 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+
+from run_cache import RunCache, DEFAULT_CACHE_FILE
+from run_data import (COLUMN_NAME_MAPPING, UNIFORM_RUN_FILE, WAVES_RUN_FILE, NO_ARTILLERY_RUN_FILE,
+                      read_run_table, standardize_runs)
+from sweep import Sweep, PythonBackend, make_backend, load_experiments, SCRIPT_DIR
+
+
+# Recorded NetLogo outputs -> (table, experiment that produced it)
+REFERENCE_TABLES = {
+    'uniform': (UNIFORM_RUN_FILE, "Vary Site-Selection Artillery Active"),
+    'waves': (WAVES_RUN_FILE, "Vary Site-Selection Artillery Active Waves"),
+    'no-artillery': (NO_ARTILLERY_RUN_FILE, "Varying Site-Selection With No Artillery Active"),
+}
+METRICS = ['victory', 'total_infantry_casualties_10', 'total_infantry_used', 'total_pontoons_used', 'ticks']
+# Largest tolerated effect: win-rate difference in points for the outcome,
+# standardized mean difference (Cohen's d) for the other metrics
+DEFAULT_TOLERANCES = {
+    'victory': 10.0,
+    'total_infantry_casualties_10': 0.5,
+    'total_infantry_used': 0.5,
+    'total_pontoons_used': 0.5,
+    'ticks': 0.5,
+}
+
+
+def compare_samples(reference, alternative, metric):
+    """Two-sample comparison of one metric of one cell.
+
+    The outcome is compared with Fisher's exact test and its effect is the
+    win-rate difference in points. Other metrics use the two-sample
+    Kolmogorov-Smirnov test, which also catches the bimodal shifts a mean
+    test misses, and their effect is Cohen's d (the relative difference of
+    the means when both samples are constant).
+
+    Returns:
+        dict: Sample sizes, means, effect and p-value (NaN when a sample
+        is too small to test).
+    """
+    reference = np.asarray(reference, dtype=float)
+    alternative = np.asarray(alternative, dtype=float)
+    result = {'reference_runs': len(reference), 'alternative_runs': len(alternative),
+              'reference_mean': reference.mean(), 'alternative_mean': alternative.mean()}
+    if metric == 'victory':
+        wins = [reference.sum(), alternative.sum()]
+        table = [[wins[0], len(reference) - wins[0]], [wins[1], len(alternative) - wins[1]]]
+        result['effect'] = (alternative.mean() - reference.mean()) * 100
+        result['p_value'] = stats.fisher_exact(table)[1]
+        return result
+    testable = min(len(reference), len(alternative)) > 1
+    difference = alternative.mean() - reference.mean()
+    pooled = 0.0
+    if testable:
+        pooled = np.sqrt(((len(reference) - 1) * reference.var(ddof=1) + (len(alternative) - 1) * alternative.var(ddof=1))
+                         / (len(reference) + len(alternative) - 2))
+    result['effect'] = difference / pooled if pooled > 0 else difference / max(abs(reference.mean()), 1)
+    result['p_value'] = stats.ks_2samp(reference, alternative).pvalue if testable else float('nan')
+    return result
+
+
+class FidelityHarness:
+    """Checks an alternative execution path against recorded BehaviorSpace outputs, cell by cell.
+
+    Every cell of the reference table (one value of each varying experiment
+    variable, or the coarser `by` grouping) is re-run on the alternative
+    backend, and each metric is compared with compare_samples. A comparison
+    fails only when the difference is both significant (Benjamini-Hochberg
+    adjusted p-value below `alpha` across all comparisons) and larger than
+    the metric's tolerance, so small samples cannot fail a cell on noise and
+    huge samples cannot fail it on negligible differences.
+
+    Args:
+        sweep: Sweep over the alternative backend.
+        reference: Name of a REFERENCE_TABLES entry.
+        by: Experiment variables (NetLogo names) defining a cell; the
+            experiment's varying variables by default.
+        reps: Alternative runs per cell; the cell's recorded run count by default.
+    """
+
+    def __init__(self, sweep, reference='uniform', by=None, reps=None, alpha=0.05, tolerances=None, seed_base=0):
+        path, experiment_name = REFERENCE_TABLES[reference]
+        self.sweep = sweep
+        self.experiment = load_experiments()[experiment_name]
+        self.reference = standardize_runs(read_run_table(path))
+        self.by = list(by or [name for name, values in self.experiment.values.items() if len(values) > 1])
+        self.columns = [COLUMN_NAME_MAPPING.get(name, name) for name in self.by]
+        self.reps = reps
+        self.alpha = alpha
+        self.tolerances = dict(DEFAULT_TOLERANCES)
+        self.tolerances.update(tolerances or {})
+        self.seed_base = seed_base
+        self.metrics = [m for m in METRICS if m in self.reference.columns]
+        self.alternative = None
+        self.seconds = None
+        self.executed = 0
+        self.cells_run = None
+        self.comparison = None
+
+    def cells(self):
+        """Reference cells with their recorded run counts."""
+        return self.reference.groupby(self.columns).size().rename('runs').reset_index()
+
+    def jobs(self, cells, reps=None):
+        """(params, seed) jobs re-running some reference cells.
+
+        A cell pooling several grid points (a coarse `by`) cycles its
+        repetitions over the points recorded in it, so the alternative runs
+        cover the same mix of configurations.
+        """
+        varying = [name for name, values in self.experiment.values.items() if len(values) > 1]
+        constants = {name: values[0] for name, values in self.experiment.values.items() if name not in varying}
+        columns = [COLUMN_NAME_MAPPING.get(name, name) for name in varying]
+        recorded = self.reference.groupby(self.columns)
+        jobs = []
+        for _, cell in cells.iterrows():
+            key = tuple(cell[column] for column in self.columns)
+            points = recorded.get_group(key)[columns].drop_duplicates()
+            points = [{**constants, **{name: _plain(value) for name, value in zip(varying, values)}}
+                      for values in points.itertuples(index=False)]
+            for rep in range(reps or self.reps or cell['runs']):
+                jobs.append(self.sweep.job(points[rep % len(points)], rep, self.seed_base))
+        return jobs
+
+    def run(self, max_cells=None, seed=0):
+        """Runs the alternative backend on the reference cells (a random subset of `max_cells` if given).
+
+        Returns:
+            pandas.DataFrame: The comparison table (see compare).
+        """
+        cells = self.cells()
+        if max_cells is not None and len(cells) > max_cells:
+            cells = cells.sample(max_cells, random_state=seed).sort_index()
+        start = time.perf_counter()
+        table = self.sweep.run(self.jobs(cells))
+        self.seconds = time.perf_counter() - start
+        self.executed = self.sweep.last_run_info['executed']
+        self.alternative = standardize_runs(table)
+        self.cells_run = cells
+        return self.compare()
+
+    def compare(self):
+        """One row per (cell, metric): means, effect, adjusted p-value and whether it passes."""
+        reference = self.reference.groupby(self.columns).indices
+        alternative = self.alternative.groupby(self.columns).indices
+        rows = []
+        for _, cell in self.cells_run.iterrows():
+            key = tuple(cell[column] for column in self.columns)
+            key = key[0] if len(key) == 1 else key
+            ref = self.reference.iloc[reference[key]]
+            alt = self.alternative.iloc[alternative[key]]
+            for metric in self.metrics:
+                if metric not in alt.columns:
+                    continue
+                row = {column: cell[column] for column in self.columns}
+                row['metric'] = metric
+                row.update(compare_samples(ref[metric].dropna(), alt[metric].dropna(), metric))
+                rows.append(row)
+        comparison = pd.DataFrame(rows)
+        tested = comparison['p_value'].notna()
+        comparison['p_adjusted'] = np.nan
+        if tested.any():
+            comparison.loc[tested, 'p_adjusted'] = stats.false_discovery_control(comparison.loc[tested, 'p_value'])
+        comparison['tolerance'] = comparison['metric'].map(self.tolerances)
+        beyond = comparison['effect'].abs() > comparison['tolerance']
+        significant = comparison['p_adjusted'] < self.alpha
+        # Untestable samples (a single recorded run) are judged on the effect alone
+        comparison['passed'] = ~(beyond & (significant | ~tested))
+        self.comparison = comparison
+        return comparison
+
+    def summary(self):
+        """Per metric: comparisons, pass share, and mean and largest absolute effect."""
+        grouped = self.comparison.groupby('metric', sort=False)
+        summary = pd.DataFrame({
+            'comparisons': grouped.size(),
+            'pass_share': grouped['passed'].mean(),
+            'mean_abs_effect': grouped['effect'].apply(lambda e: e.abs().mean()),
+            'max_abs_effect': grouped['effect'].apply(lambda e: e.abs().max()),
+            'tolerance': grouped['tolerance'].first(),
+        })
+        return summary
+
+    def seconds_per_run(self):
+        """Wall-clock seconds per executed alternative run (NaN when every run came from the cache)."""
+        return self.seconds / self.executed if self.executed else float('nan')
+
+
+def time_backend(backend, jobs):
+    """Seconds per run of a backend on some jobs, bypassing the cache."""
+    start = time.perf_counter()
+    Sweep(backend, None, base_params=PythonBackend().default_params()).run(jobs)
+    return (time.perf_counter() - start) / len(jobs)
+
+
+def _plain(value):
+    # Cell values come back from pandas as numpy scalars; the backends want plain Python values
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return value
+
+
+def main():
+    """Re-runs the recorded BehaviorSpace cells on an alternative backend and checks the outputs still match."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--reference', choices=list(REFERENCE_TABLES), default='uniform')
+    parser.add_argument('--backend', choices=['netlogo', 'python', 'python-coarse'], default='python')
+    parser.add_argument('--by', nargs='+', default=None,
+                        help="Experiment variables defining a cell (default: the varying ones)")
+    parser.add_argument('--reps', type=int, default=None, help="Runs per cell (default: as recorded)")
+    parser.add_argument('--max-cells', type=int, default=None, help="Check a random subset of the cells")
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--tolerance', nargs='+', default=[], metavar='METRIC=VALUE',
+                        help="Override effect tolerances, e.g. victory=5 ticks=0.3")
+    parser.add_argument('--max-fail-share', type=float, default=0.0,
+                        help="Largest share of failing comparisons that still passes the harness")
+    parser.add_argument('--speed-reference', choices=['netlogo', 'python', 'python-coarse'], default=None,
+                        help="Backend the speed-up is measured against (on a few of the same jobs)")
+    parser.add_argument('--speed-jobs', type=int, default=5)
+    parser.add_argument('--seed-base', type=int, default=0)
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--netlogo-home', default=None)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--out', default=None, help="Write the comparison table to this CSV")
+    args = parser.parse_args()
+
+    tolerances = {name: float(value) for name, _, value in (item.partition('=') for item in args.tolerance)}
+    backend = make_backend(args.backend, args.netlogo_home, args.threads)
+    with RunCache(args.cache) as cache:
+        harness = FidelityHarness(Sweep(backend, cache, base_params=PythonBackend().default_params()),
+                                  args.reference, args.by, args.reps, args.alpha, tolerances, args.seed_base)
+        comparison = harness.run(args.max_cells)
+
+    summary = harness.summary()
+    with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200,
+                           'display.max_columns', None):
+        print(summary)
+        failed = comparison[~comparison['passed']]
+        if len(failed):
+            print("\nFailing comparisons:")
+            print(failed.to_string(index=False))
+    fail_share = 1 - comparison['passed'].mean()
+    print(f"\n{len(comparison)} comparisons over {len(harness.cells_run)} cells, {fail_share:.1%} failing")
+
+    per_run = harness.seconds_per_run()
+    print(f"{args.backend}: {per_run:.3f} s per run ({harness.executed} executed)")
+    if args.speed_reference:
+        jobs = harness.jobs(harness.cells_run.head(args.speed_jobs), reps=1)
+        reference_per_run = time_backend(make_backend(args.speed_reference, args.netlogo_home), jobs)
+        alternative_per_run = per_run if harness.executed else time_backend(backend, jobs)
+        print(f"{args.speed_reference}: {reference_per_run:.3f} s per run, "
+              f"speed-up {reference_per_run / alternative_per_run:.1f}x")
+
+    out = args.out or os.path.join(SCRIPT_DIR, f"Fidelity_{args.backend}_vs_{args.reference}.csv")
+    comparison.to_csv(out, index=False)
+    if fail_share > args.max_fail_share:
+        print("Fidelity check FAILED")
+        sys.exit(1)
+    print("Fidelity check passed")
+
+
+if __name__ == '__main__':
+    main()
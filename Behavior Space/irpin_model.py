@@ -0,0 +1,1349 @@
+import os
+import copy
+import math
+
+import numpy as np
+from PIL import Image
+
+import movement_kernel
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MAP_FILE = os.path.join(os.path.dirname(SCRIPT_DIR), "NewIrpinMap.png")
+
+WORLD_WIDTH = 460
+WORLD_HEIGHT = 625
+
+# Terrain codes (patches-own terrain)
+ROAD, WATER, GOAL, BRIDGE = 0, 1, 2, 3
+
+# Breeds
+INFANTRY, TRUCK = 0, 1
+
+SITE_YS = (576, 542, 526, 403, 329, 292, 263, 237, 210, 171, 142, 112, 82)
+NUM_SITES = len(SITE_YS)
+SITE_INFANTRY_UNITS_PER_ROAD = (1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 3)
+NUM_REQUIRED_PONTOONS_PER_SITE = (183, 131, 131, 104, 160, 165, 179, 208, 240, 226, 302, 107, 104)
+
+# name, x, y, initial heading, sites served (same order as the *-entry-sites globals)
+ENTRIES = (
+    ('north', 240, 624, 180, (0, 1, 2, 3, 4)),
+    ('west', 10, 260, 90, (5, 6, 7, 8)),
+    ('south', 60, 0, 0, (9, 10, 11, 12)),
+)
+SITE_ENTRY = {site: e for e, entry in enumerate(ENTRIES) for site in entry[4]}
+SELECTION_ORDER = ((3, 1, 2, 4, 0), (5, 6, 7, 8), (12, 11, 9, 10))
+CUSTOM_SITES = "Custom Sites"
+
+# Unit step (fd 1) and the patch checked by the model's swapped-trig target test, per heading
+STEP = {0: (0, 1), 90: (1, 0), 180: (0, -1), 270: (-1, 0)}
+TARGET_STEP = {0: (1, 0), 90: (0, 1), 180: (-1, 0), 270: (0, -1)}
+
+# Per-site outcome reporter -> site field. A site never bridged has a first-bridge tick of -1.
+SITE_METRICS = (
+    ('site-first-bridge-tick', 'first_bridge_tick'),
+    ('site-strikes', 'strike_count'),
+    ('site-pontoons-delivered', 'pontoons_delivered'),
+    ('site-pontoons-built', 'pontoons_built'),
+    ('site-infantry-crossed', 'infantry_crossed'),
+)
+SITE_COLUMNS = [f"{name}-{site}" for name, _ in SITE_METRICS for site in range(NUM_SITES)]
+
+# Interface globals followed by the constants set in initialize-params
+DEFAULT_PARAMS = {
+    'site-selection-mode': "01 Shortest Bridges",
+    'custom-site-ids': "3 5 12",
+    'spacing-mode': "Waves",
+    'wave-duration': 200,
+    'wave-pause': 30,
+    'turn-on-artillery?': True,
+    'turn-on-stop-conditions?': True,
+    'crn-mode?': False,
+    'crn-replicate': 1,
+    'num-required-builders-per-site': 18,
+    'infantry-unit-depth': 10,
+    'truck-unit-depth': 1,
+    'truck-pontoon-module-capacity': 1,
+    'pontoon-module-setup-time': 1,
+    'activity-cooldown-time': 30,
+    'artillery-alpha': 0.06,
+    'artillery-beta': 0.05,
+    'time-between-drone-checks': 20,
+    'win-num-crossers-threshold': 4500,
+    'loss-battle-duration-threshold': 28 * 24 * 60,
+    'dirt-roads-start-x': 235,
+    'infantry-max-road-speed': 45,
+    'truck-max-road-speed': 45,
+    'infantry-max-dirt-speed': 15,
+    'truck-max-dirt-speed': 15,
+    'infantry-acceleration': 2,
+    'truck-acceleration': 1.5,
+    'infantry-deceleration': 3,
+    'truck-deceleration': 2,
+}
+
+WATER_RGB = (4, 36, 194)
+GOAL_RGB = (252, 252, 60)
+# The map is drawn with a handful of flat colors; a pixel this close to the water
+# or goal color is the one approximate-rgb matches in the model
+COLOR_TOLERANCE = 16
+
+
+class MapData:
+    """Static terrain of the world, shared read-only by every model instance.
+
+    `terrain` is indexed [pxcor, pycor]. The bridge drawing extents are the
+    leftmost water and goal patch of each site row, as in
+    update-bridge-drawing-x-values (None where the row has no such patch).
+    Extents computed elsewhere (e.g. by a worker pool host) can be passed in.
+    """
+
+    def __init__(self, terrain, bridge_start_x=None, bridge_end_x=None):
+        terrain.flags.writeable = False
+        self.terrain = terrain
+        if bridge_start_x is not None and bridge_end_x is not None:
+            self.bridge_start_x = list(bridge_start_x)
+            self.bridge_end_x = list(bridge_end_x)
+            return
+        self.bridge_start_x = []
+        self.bridge_end_x = []
+        for y in SITE_YS:
+            water = np.flatnonzero(terrain[:, y] == WATER)
+            goal = np.flatnonzero(terrain[:, y] == GOAL)
+            self.bridge_start_x.append(int(water[0]) if len(water) else None)
+            self.bridge_end_x.append(int(goal[0]) if len(goal) else None)
+
+
+def classify_map(map_file=MAP_FILE):
+    """Reproduces import-pcolors followed by classify-terrain.
+
+    The image is scaled to fit the world keeping its aspect ratio and centered,
+    then every pixel matching the water or goal color is classified as such.
+
+    Returns:
+        numpy.ndarray: uint8 terrain codes indexed [pxcor, pycor].
+    """
+    image = Image.open(map_file).convert('RGB')
+    scale = min(WORLD_WIDTH / image.width, WORLD_HEIGHT / image.height)
+    width, height = int(image.width * scale), int(image.height * scale)
+    pixels = np.asarray(image.resize((width, height), Image.NEAREST))
+
+    colors, inverse = np.unique(pixels.reshape(-1, 3), axis=0, return_inverse=True)
+    codes = np.full(len(colors), ROAD, dtype=np.uint8)
+    for rgb, code in ((WATER_RGB, WATER), (GOAL_RGB, GOAL)):
+        distance = np.sqrt(((colors.astype(float) - rgb) ** 2).sum(axis=1))
+        codes[distance <= COLOR_TOLERANCE] = code
+    classified = codes[inverse.reshape(-1)].reshape(height, width)
+
+    terrain = np.full((WORLD_WIDTH, WORLD_HEIGHT), ROAD, dtype=np.uint8)
+    x0 = (WORLD_WIDTH - width) // 2
+    y0 = (WORLD_HEIGHT - height) // 2
+    # Image rows run top to bottom, pycor bottom to top
+    terrain[x0:x0 + width, y0:y0 + height] = classified[::-1].T
+    return terrain
+
+
+_MAPS = {}
+
+
+def load_map(map_file=MAP_FILE):
+    """Loads and classifies the map once per process (unless install_map provided it)."""
+    if map_file not in _MAPS:
+        _MAPS[map_file] = MapData(classify_map(map_file))
+    return _MAPS[map_file]
+
+
+def install_map(map_data, map_file=MAP_FILE):
+    """Makes load_map return `map_data` for `map_file`, e.g. a view of a map held in shared memory."""
+    _MAPS[map_file] = map_data
+
+
+def parse_site_ids(text):
+    """Site ids listed in a custom-site-ids string such as "3 5 12"."""
+    return [int(token) for token in str(text).replace('[', ' ').replace(']', ' ').split()]
+
+
+def format_site_ids(site_ids):
+    """custom-site-ids string of a collection of site ids."""
+    return ' '.join(str(s) for s in sorted(set(site_ids)))
+
+
+def select_sites(site_selection_mode, custom_site_ids=""):
+    """Port of select-sites: round-robin over the north, west and south groups.
+
+    "Custom Sites" keeps the sites listed in `custom_site_ids`, in the same
+    round-robin order as the full 13-site selection.
+    """
+    custom = site_selection_mode == CUSTOM_SITES
+    num_sites = NUM_SITES if custom else int(site_selection_mode[:2])
+    groups = [list(g) for g in SELECTION_ORDER]
+    selected = []
+    while len(selected) < num_sites and any(groups):
+        for group in groups:
+            if len(selected) < num_sites and group:
+                selected.append(group.pop(0))
+    if custom:
+        wanted = set(parse_site_ids(custom_site_ids))
+        selected = [s for s in selected if s in wanted]
+    return selected
+
+
+def cone_offsets(heading, radius, half_angle):
+    """Integer offsets inside an in-cone query, nearest first.
+
+    Units spawn on integer entry coordinates and only ever step one patch
+    along a cardinal heading, so positions stay integral and cone queries
+    reduce to a fixed set of occupied-cell lookups.
+    """
+    offsets = []
+    r = int(radius)
+    for dx in range(-r, r + 1):
+        for dy in range(-r, r + 1):
+            distance = math.hypot(dx, dy)
+            if (dx, dy) == (0, 0) or distance > radius:
+                continue
+            towards = math.degrees(math.atan2(dx, dy)) % 360
+            if abs((towards - heading + 180) % 360 - 180) <= half_angle + 1e-9:
+                offsets.append((distance, dx, dy))
+    return tuple((dx, dy) for _, dx, dy in sorted(offsets))
+
+
+# in-cone 10 60 (slow-down check) and in-cone 2 90 (per-step blocking check)
+FAR_CONE = {h: cone_offsets(h, 10, 30) for h in STEP}
+NEAR_CONE = {h: cone_offsets(h, 2, 45) for h in STEP}
+
+# The same tables as flat arrays indexed by heading // 90, for the compiled move-units
+_FAR_DX, _FAR_DY, _FAR_LEN = movement_kernel.cone_arrays([FAR_CONE[h] for h in STEP])
+_NEAR_DX, _NEAR_DY, _NEAR_LEN = movement_kernel.cone_arrays([NEAR_CONE[h] for h in STEP])
+_STEPS = np.array([STEP[h] for h in STEP], dtype=np.int64)
+_TARGET_STEPS = np.array([TARGET_STEP[h] for h in STEP], dtype=np.int64)
+_SITE_YS = np.array(SITE_YS, dtype=np.int64)
+_SITE_ENTRY = np.array([SITE_ENTRY[site] for site in range(NUM_SITES)], dtype=np.int64)
+_REQUIRED_PONTOONS = np.array(NUM_REQUIRED_PONTOONS_PER_SITE, dtype=np.float64)
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _splitmix64(z):
+    z = (z + 0x9E3779B97F4A7C15) & _MASK64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return z ^ (z >> 31)
+
+
+def counter_uniform(key):
+    """Uniform draw in [0, 1) that depends only on an integer key."""
+    return (_splitmix64(key & _MASK64) >> 11) * 2.0 ** -53
+
+
+def crn_stream_key(crn_replicate, stream_id, counter):
+    """Same key layout as the model's crn-stream-seed reporter."""
+    return (((crn_replicate * 4 + stream_id) * 65536 * 16) + counter) % 4294967296
+
+
+class RandomStreams:
+    """The model's named random streams: "schedule" (ask order) and "artillery".
+
+    Without CRN both streams are generators seeded from the run seed. With CRN
+    the schedule generator is seeded from the replicate index and every
+    artillery draw is a pure function of (crn-replicate, tick, site), like
+    stream-random-float in the model. `origin` offsets the seeds so that
+    streams reseeded at a fork differ from those of a fresh run.
+    """
+
+    NAMES = ('schedule', 'artillery')
+
+    def __init__(self, seed, crn_replicate=None, origin=0):
+        self.seed = seed
+        self.crn_replicate = crn_replicate
+        self.origin = origin
+        if crn_replicate is None:
+            self.schedule = np.random.default_rng([int(seed) & _MASK64, 0, origin])
+            self.artillery = np.random.default_rng([int(seed) & _MASK64, 1, origin])
+        else:
+            self.schedule = np.random.default_rng([crn_stream_key(crn_replicate, 0, 0), origin])
+            self.artillery = None
+
+    def order(self, n):
+        """Random visiting order of n agents (ask turtles)."""
+        return self.schedule.permutation(n).tolist()
+
+    def uniform(self, stream, counter):
+        if self.crn_replicate is not None:
+            return counter_uniform(crn_stream_key(self.crn_replicate, self.NAMES.index(stream), counter))
+        return getattr(self, stream).random()
+
+    def copy(self):
+        return copy.deepcopy(self)
+
+
+class AgentArrays:
+    """Struct-of-arrays storage of the infantry and truck agents, in creation order."""
+
+    FIELDS = (
+        ('x', np.int32),
+        ('y', np.int32),
+        ('heading', np.int16),
+        ('breed', np.int8),
+        ('site', np.int8),
+        ('current_speed', np.float64),
+        ('payload', np.int32),  # num-troops or num-pontoons
+        ('asleep', np.bool_),   # parked in a stopped column (see IrpinModel.move_units)
+        ('uid', np.int64),      # creation number, increasing along the arrays
+    )
+
+    def __init__(self, capacity=256):
+        self.n = 0
+        self.next_uid = 0
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros(capacity, dtype=dtype))
+
+    def __len__(self):
+        return self.n
+
+    def append(self, **values):
+        if self.n == len(self.x):
+            for name, _ in self.FIELDS:
+                array = getattr(self, name)
+                grown = np.zeros(2 * len(array), dtype=array.dtype)
+                grown[:self.n] = array[:self.n]
+                setattr(self, name, grown)
+        values['uid'] = self.next_uid
+        self.next_uid += 1
+        for name, _ in self.FIELDS:
+            getattr(self, name)[self.n] = values[name]
+        self.n += 1
+        return values['uid']
+
+    def keep(self, mask):
+        """Drops the agents whose mask entry is False, preserving order.
+
+        Returns:
+            numpy.ndarray: New index of every old agent (-1 for dropped ones).
+        """
+        count = int(np.count_nonzero(mask))
+        for name, _ in self.FIELDS:
+            array = getattr(self, name)
+            array[:count] = array[:self.n][mask]
+        index = np.where(mask, np.cumsum(mask) - 1, -1)
+        self.n = count
+        return index
+
+    def indices(self, uids):
+        """Current index of the agents with these uids (binary search, the uids being sorted)."""
+        return np.searchsorted(self.uid[:self.n], uids)
+
+    def export(self):
+        """Trimmed copies of the arrays."""
+        return {name: getattr(self, name)[:self.n].copy() for name, _ in self.FIELDS}
+
+    @classmethod
+    def from_export(cls, data):
+        n = len(data['x'])
+        agents = cls(max(256, n))
+        for name, _ in cls.FIELDS:
+            getattr(agents, name)[:n] = data[name]
+        agents.n = n
+        agents.next_uid = int(data['uid'][-1]) + 1 if n else 0
+        return agents
+
+
+class AgentRegistry:
+    """Where the agents are, kept in step with AgentArrays as units spawn, move and die.
+
+    `cells` holds one {cell: units} occupancy map per breed (the map the
+    cone checks of move-units read), so whether an entry point is occupied
+    is a single lookup. `site_units` holds the uids of each site's infantry
+    (see AgentArrays.indices), so destroy-site only looks at the units bound
+    for the site it hits.
+    """
+
+    def __init__(self):
+        self.cells = ({}, {})
+        self.site_units = [set() for _ in range(NUM_SITES)]
+
+    @classmethod
+    def from_agents(cls, agents):
+        registry = cls()
+        n = agents.n
+        for x, y, breed, site, uid in zip(agents.x[:n].tolist(), agents.y[:n].tolist(), agents.breed[:n].tolist(),
+                                          agents.site[:n].tolist(), agents.uid[:n].tolist()):
+            registry.add(breed, (x, y))
+            if breed == INFANTRY:
+                registry.site_units[site].add(uid)
+        return registry
+
+    def add(self, breed, cell):
+        cells = self.cells[breed]
+        cells[cell] = cells.get(cell, 0) + 1
+
+    def remove(self, breed, cell):
+        """Removes one unit. Returns True when no unit of its breed is left on the cell."""
+        return _decrement(self.cells[breed], cell)
+
+    def forget_site_units(self, sites, uids):
+        """Removes dead infantry from `site_units`."""
+        for site, uid in zip(sites, uids):
+            self.site_units[site].discard(uid)
+
+    def occupied(self, breed, cell):
+        return cell in self.cells[breed]
+
+
+def _decrement(cells, cell):
+    if cells[cell] == 1:
+        del cells[cell]
+        return True
+    cells[cell] -= 1
+    return False
+
+
+class Convoy:
+    """A column of same-breed units stopped one behind the other.
+
+    Built by IrpinModel.convoys from the parked units: `head` is the first
+    unit of the column (the one the others are waiting behind, often at a
+    site's water edge), `count` the units in it and `length` the road
+    patches it covers.
+    """
+
+    def __init__(self, breed, site, head, count, length):
+        self.breed = breed
+        self.site = site
+        self.head = head    # (x, y)
+        self.count = count
+        self.length = length
+
+    def __repr__(self):
+        breed = 'infantry' if self.breed == INFANTRY else 'trucks'
+        return f"Convoy({breed}, site {self.site}, head {self.head}, {self.count} units, {self.length} patches)"
+
+
+class SiteTable:
+    """Struct-of-arrays state of the crossing sites: one typed (replicates, NUM_SITES) array per field.
+
+    A model owns one row (its site lists are views of that row) and keeps the
+    row's parameter columns up to date. The site procedures run on a slice of
+    rows at once, so models stepped in lockstep by run_batch share one table
+    and update every replicate's sites in a single vectorized pass. A row
+    with no chosen sites (a finished replicate) is left untouched.
+    """
+
+    FIELDS = (
+        ('builder_count', np.int64),
+        ('pontoon_count', np.float64),
+        ('pontoon_built_count', np.float64),
+        ('bridge_built', np.bool_),
+        ('time_of_last_activity', np.int64),
+        ('activity_duration', np.int64),
+        ('artillery_just_fired', np.bool_),
+        # Per-site outcome accumulators (see SITE_METRICS)
+        ('first_bridge_tick', np.int64),
+        ('strike_count', np.int64),
+        ('pontoons_delivered', np.float64),
+        ('pontoons_built', np.float64),
+        ('infantry_crossed', np.int64),
+    )
+    REQUIRED_PONTOONS = np.array(NUM_REQUIRED_PONTOONS_PER_SITE, dtype=np.float64)
+
+    def __init__(self, replicates=1):
+        self.replicates = replicates
+        for name, dtype in self.FIELDS:
+            setattr(self, name, np.zeros((replicates, NUM_SITES), dtype=dtype))
+        self.time_of_last_activity[:] = -1
+        self.first_bridge_tick[:] = -1
+        self.chosen = np.zeros((replicates, NUM_SITES), dtype=bool)
+        # Per-row parameters, as columns so that they broadcast over the sites
+        self.required_builders = np.zeros((replicates, 1))
+        self.setup_rate = np.ones((replicates, 1))
+        self.cooldown = np.zeros((replicates, 1))
+        self.artillery = np.zeros((replicates, 1), dtype=bool)
+
+    def configure(self, row, chosen_site_ids, params):
+        self.chosen[row] = False
+        self.chosen[row, list(chosen_site_ids)] = True
+        self.required_builders[row] = params['num-required-builders-per-site']
+        self.setup_rate[row] = 1 / params['pontoon-module-setup-time']
+        self.cooldown[row] = params['activity-cooldown-time']
+        self.artillery[row] = params['turn-on-artillery?']
+
+    def retire(self, row):
+        """Excludes a finished replicate from the vectorized updates."""
+        self.chosen[row] = False
+
+    def reset(self, row):
+        for name, _ in self.FIELDS:
+            getattr(self, name)[row] = 0
+        self.time_of_last_activity[row] = -1
+        self.first_bridge_tick[row] = -1
+
+    def export(self, row):
+        return {name: getattr(self, name)[row].copy() for name, _ in self.FIELDS}
+
+    def load(self, row, data):
+        for name, _ in self.FIELDS:
+            getattr(self, name)[row] = data[name]
+
+    def build(self, rows):
+        """One tick of build-pontoon-bridges on a slice of rows.
+
+        Returns:
+            tuple: (completed, pontoons_built) where `completed` marks the
+            sites whose bridge was finished this tick (the caller draws them)
+            and `pontoons_built` is the number of modules set up per row, or
+            None when nothing happened.
+        """
+        bridge_built = self.bridge_built[rows]
+        built = self.pontoon_built_count[rows]
+        open_sites = self.chosen[rows] & ~bridge_built
+        # NetLogo tests `=`, which a setup time whose reciprocal is not a dyadic
+        # fraction never reaches; the last module is clamped and `>=` tested instead
+        # (identical for the default setup time of 1)
+        completed = open_sites & (built >= self.REQUIRED_PONTOONS)
+        building = (open_sites & ~completed & (self.builder_count[rows] >= self.required_builders[rows])
+                    & (self.pontoon_count[rows] >= 1))
+        if not (completed.any() or building.any()):
+            return None
+        bridge_built |= completed
+        step = building * np.minimum(self.setup_rate[rows], self.REQUIRED_PONTOONS - built)
+        built += step
+        self.pontoon_count[rows] -= step
+        self.pontoons_built[rows] += step
+        return completed, step.sum(axis=1)
+
+    def update_activity(self, rows, ticks):
+        """Activity bookkeeping of drone-detect-and-artillery-fire on a slice of rows.
+
+        Sites with pontoons set up are active: their last activity moves to
+        `ticks` and their activity duration grows. The durations of the other
+        sites are reset unless they were active within the cooldown. Rows with
+        the artillery turned off are skipped.
+
+        Returns:
+            tuple: (number of active sites per row, mask of the sites active
+            within the cooldown)
+        """
+        chosen = self.chosen[rows] & self.artillery[rows]
+        active = chosen & (self.pontoon_built_count[rows] > 0)
+        last = self.time_of_last_activity[rows]
+        last[active] = ticks
+        recent = chosen & (last != -1) & (ticks - last < self.cooldown[rows])
+        duration = self.activity_duration[rows]
+        duration += active
+        duration[chosen & ~active & ~recent] = 0
+        return active.sum(axis=1), recent
+
+    def destroy(self, row, site):
+        """Resets a destroyed site. Returns (builders lost, whether a bridge stood)."""
+        builders = int(self.builder_count[row, site])
+        had_bridge = bool(self.bridge_built[row, site])
+        self.builder_count[row, site] = 0
+        self.pontoon_count[row, site] = 0
+        self.pontoon_built_count[row, site] = 0
+        self.bridge_built[row, site] = False
+        self.artillery_just_fired[row, site] = True
+        self.strike_count[row, site] += 1
+        return builders, had_bridge
+
+
+class SimulationSnapshot:
+    """Compact copy of a model's state at one tick.
+
+    Agent arrays are trimmed copies; the terrain array is shared with the
+    model that took the snapshot and copied only when either side later
+    draws or destroys a bridge.
+    """
+
+    def __init__(self, params, seed, ticks, globals_, sites, agents, terrain, streams):
+        self.params = params
+        self.seed = seed
+        self.ticks = ticks
+        self.globals = globals_
+        self.sites = sites
+        self.agents = agents
+        self.terrain = terrain
+        self.streams = streams
+
+    def nbytes(self, include_terrain=False):
+        total = sum(a.nbytes for a in self.agents.values())
+        return total + (self.terrain.nbytes if include_terrain else 0)
+
+
+class IrpinModel:
+    """Python port of IrpinModel.nlogo for fast in-process experiments.
+
+    Follows the go procedure step for step (move-units, update-spawn-availability,
+    spawn-units, build-pontoon-bridges, drone-detect-and-artillery-fire, battle-over?).
+    Drawing-only procedures are omitted. State can be snapshotted at any tick
+    and forked into branches that continue with different parameters. Setting
+    `profiler` to a PhaseProfiler (phase_profiler.py) times the procedures of
+    its sampled ticks, setting `recorder` to a TrajectoryRecorder
+    (trajectory.py) records per-tick series, and setting `events` to the
+    RunEvents of an EventLog (event_log.py) logs every strike and bridge
+    completion; left None each costs one check per tick.
+
+    Args:
+        params: Parameter overrides (NetLogo global names, see DEFAULT_PARAMS).
+        seed: Run seed (ignored for the streams CRN mode derives from crn-replicate).
+        map_data: Pre-loaded MapData; defaults to the cached NewIrpinMap.png.
+    """
+
+    SITE_FIELDS = tuple(name for name, _ in SiteTable.FIELDS)
+    GLOBAL_FIELDS = (
+        'total_pontoons_built', 'total_infantry_crossed', 'total_infantry_used',
+        'total_pontoons_used', 'total_infantry_casualties', 'battle_outcome',
+        'spawn_index_infantry', 'spawn_index_trucks', 'deployment_index',
+        'infantry_clogged', 'trucks_clogged', 'done'
+    )
+
+    # move-units runs the compiled loop of movement_kernel.py when Numba is installed
+    compiled_movement = movement_kernel.AVAILABLE
+    move_kernel = staticmethod(movement_kernel.move_units)
+
+    def __init__(self, params=None, seed=0, map_data=None, site_table=None, row=0):
+        self.map = map_data or load_map()
+        self.seed = seed
+        self.profiler = None
+        self.recorder = None
+        self.events = None
+        self._bind_sites(site_table or SiteTable(), row)
+        self._configure(params)
+        self.streams = self._new_streams()
+        self.setup()
+
+    def _configure(self, params):
+        self.params = dict(DEFAULT_PARAMS)
+        self.params.update(params or {})
+        p = self.params
+        self.chosen_site_ids = select_sites(p['site-selection-mode'], p['custom-site-ids'])
+        self.entry_sites = [[s for s in entry[4] if s in self.chosen_site_ids] for entry in ENTRIES]
+        self.max_road_speed = (p['infantry-max-road-speed'], p['truck-max-road-speed'])
+        self.max_dirt_speed = (p['infantry-max-dirt-speed'], p['truck-max-dirt-speed'])
+        self.acceleration = (p['infantry-acceleration'], p['truck-acceleration'])
+        self.deceleration = (p['infantry-deceleration'], p['truck-deceleration'])
+        self.site_table.configure(self.row, self.chosen_site_ids, p)
+
+    def _bind_sites(self, site_table, row):
+        """Makes the per-site lists views of one row of a SiteTable."""
+        self.site_table = site_table
+        self.row = row
+        for name in self.SITE_FIELDS:
+            setattr(self, name, getattr(site_table, name)[row])
+
+    def _new_streams(self, origin=0):
+        crn_replicate = int(self.params['crn-replicate']) if self.params['crn-mode?'] else None
+        return RandomStreams(self.seed, crn_replicate, origin)
+
+    def setup(self):
+        """Equivalent of setup/initialize-params on an already classified map."""
+        self.ticks = 0
+        self._terrain = self.map.terrain
+        self._terrain_owned = False
+        self._terrain_cells = None
+        self.agents = AgentArrays()
+
+        self.site_table.reset(self.row)
+
+        self.total_pontoons_built = 0
+        self.total_infantry_crossed = 0
+        self.total_infantry_used = 0
+        self.total_pontoons_used = 0
+        self.total_infantry_casualties = 0
+        self.battle_outcome = "In Progress"
+        self.spawn_index_infantry = [len(entry[4]) - 1 for entry in ENTRIES]
+        self.spawn_index_trucks = [len(entry[4]) - 1 for entry in ENTRIES]
+        self.deployment_index = [0] * len(ENTRIES)
+        self.infantry_clogged = [False] * len(ENTRIES)
+        self.trucks_clogged = [False] * len(ENTRIES)
+        self.done = False
+        self.registry = AgentRegistry()
+        self._wake_all()
+
+    def _wake_all(self):
+        self.agents.asleep[:] = False
+        self._watcher_cells = ({}, {})
+        self._waiting = None
+
+    @property
+    def _watchers(self):
+        """Per breed: cell -> parked units waiting for it to be vacated.
+
+        The compiled move-units keeps them as `_waiting` (the flat cell each
+        unit waits on, -1 if none); they are turned back into dicts only
+        when read.
+        """
+        if self._waiting is not None:
+            waiting, self._waiting = self._waiting, None
+            self._watcher_cells = ({}, {})
+            parked = np.flatnonzero(waiting >= 0)
+            for i, breed, cell in zip(parked.tolist(), self.agents.breed[parked].tolist(), waiting[parked].tolist()):
+                self._watcher_cells[breed].setdefault(divmod(cell, WORLD_HEIGHT), []).append(i)
+        return self._watcher_cells
+
+    # ---------------------------------------------------
+    # Snapshot / fork
+    # ---------------------------------------------------
+
+    def snapshot(self):
+        """Captures the current state; the terrain becomes copy-on-write for both sides."""
+        self._terrain_owned = False
+        return SimulationSnapshot(
+            params=dict(self.params),
+            seed=self.seed,
+            ticks=self.ticks,
+            globals_={name: copy.copy(getattr(self, name)) for name in self.GLOBAL_FIELDS},
+            sites=self.site_table.export(self.row),
+            agents=self.agents.export(),
+            terrain=self._terrain,
+            streams=self.streams.copy()
+        )
+
+    @classmethod
+    def from_snapshot(cls, snapshot, params=None, seed=None, map_data=None):
+        """Builds a model that continues from a snapshot.
+
+        Args:
+            snapshot: State to continue from.
+            params: Parameter overrides for the branch (e.g. another wave-pause).
+                Parameters that shaped the prefix, such as site-selection-mode,
+                should not change.
+            seed: Keep None to continue the snapshot's random streams, so the
+                branch reproduces a from-scratch run of its configuration
+                whenever the prefix is shared. A new seed (or crn-replicate)
+                draws fresh streams from the fork tick on, giving an independent
+                replicate that shares the prefix.
+        """
+        model = cls.__new__(cls)
+        model.map = map_data or load_map()
+        merged = dict(snapshot.params)
+        merged.update(params or {})
+        model.seed = snapshot.seed if seed is None else seed
+        model.profiler = None
+        model.recorder = None
+        model.events = None
+        model._bind_sites(SiteTable(), 0)
+        model._configure(merged)
+        model.ticks = snapshot.ticks
+        model._terrain = snapshot.terrain
+        model._terrain_owned = False
+        model._terrain_cells = None
+        model.agents = AgentArrays.from_export(snapshot.agents)
+        model.registry = AgentRegistry.from_agents(model.agents)
+        model._wake_all()
+        for name, value in snapshot.globals.items():
+            setattr(model, name, copy.copy(value))
+        model.site_table.load(model.row, snapshot.sites)
+
+        reseed = seed is not None and seed != snapshot.seed
+        if model.params['crn-mode?'] and model.params['crn-replicate'] != snapshot.params['crn-replicate']:
+            reseed = True
+        model.streams = model._new_streams(origin=snapshot.ticks + 1) if reseed else snapshot.streams.copy()
+        return model
+
+    def restore(self, snapshot):
+        """Resets this model in place to a snapshot (with the snapshot's parameters)."""
+        restored = self.from_snapshot(snapshot, map_data=self.map)
+        restored.profiler = self.profiler
+        restored.recorder = self.recorder
+        restored.events = self.events
+        self.__dict__.update(restored.__dict__)
+
+    def fork(self, params=None, seed=None):
+        """Clones the model, optionally with new parameters or a new seed (see from_snapshot)."""
+        return self.from_snapshot(self.snapshot(), params, seed, self.map)
+
+    def set_param(self, name, value):
+        """Changes a parameter of a running model."""
+        params = dict(self.params)
+        params[name] = value
+        self._configure(params)
+
+    # ---------------------------------------------------
+    # Terrain
+    # ---------------------------------------------------
+
+    def _flat_terrain(self):
+        """The terrain as a flat memoryview, indexed x * WORLD_HEIGHT + y.
+
+        Indexing it yields Python ints about as fast as nested lists, without
+        copying the (possibly shared) terrain array.
+        """
+        if self._terrain_cells is None:
+            self._terrain_cells = memoryview(self._terrain).cast('B')
+        return self._terrain_cells
+
+    def _paint_band(self, site_id, code):
+        y = SITE_YS[site_id]
+        x_start = self.map.bridge_start_x[site_id]
+        x_end = self.map.bridge_end_x[site_id]
+        if x_start is None or x_end is None:
+            return
+        if not self._terrain_owned:
+            self._terrain = self._terrain.copy()
+            self._terrain_owned = True
+        self._terrain[x_start:x_end + 1, max(0, y - 2):y + 3] = code
+        self._terrain_cells = None
+
+    def draw_bridge(self, site_id):
+        self._paint_band(site_id, BRIDGE)
+
+    def redraw_water(self, site_id):
+        self._paint_band(site_id, WATER)
+
+    @property
+    def terrain(self):
+        return self._terrain
+
+    # ---------------------------------------------------
+    # Main procedures
+    # ---------------------------------------------------
+
+    def phases(self):
+        """The procedures go runs this tick, as (NetLogo name, bound method) pairs."""
+        phases = [('move-units', self.move_units),
+                  ('update-spawn-availability', self.update_spawn_availability),
+                  ('spawn-units', self.spawn_units),
+                  ('build-pontoon-bridges', self.build_pontoon_bridges)]
+        if self.params['turn-on-artillery?']:
+            phases.append(('drone-detect-and-artillery-fire', self.drone_detect_and_artillery_fire))
+        return phases
+
+    def go(self):
+        """Runs one tick. Returns False once the battle is over."""
+        if self.done:
+            return False
+        if self.profiler is not None and self.profiler.sampled(self.ticks):
+            self.profiler.record(self, self.phases())
+        else:
+            self.move_units()
+            self.update_spawn_availability()
+            self.spawn_units()
+            self.build_pontoon_bridges()
+            if self.params['turn-on-artillery?']:
+                self.drone_detect_and_artillery_fire()
+        if self.recorder is not None and self.ticks % self.recorder.every == 0:
+            self.recorder.record(self)
+        if self.params['turn-on-stop-conditions?'] and self.battle_over():
+            self.done = True
+            return False
+        self.ticks += 1
+        return True
+
+    def run(self, until_tick=None, max_ticks=None):
+        """Runs until the battle is over.
+
+        Args:
+            until_tick: Pause once `ticks` reaches this value (for prefixes).
+            max_ticks: Hard limit, required when stop conditions are off.
+
+        Returns:
+            dict: The run's metrics (see results).
+        """
+        if max_ticks is None and not self.params['turn-on-stop-conditions?'] and until_tick is None:
+            raise ValueError("max_ticks is required when turn-on-stop-conditions? is off")
+        while not self.done:
+            if until_tick is not None and self.ticks >= until_tick:
+                break
+            if max_ticks is not None and self.ticks >= max_ticks:
+                break
+            self.go()
+        if self.recorder is not None:
+            self.recorder.finish(self)
+        return self.results()
+
+    def results(self):
+        """Metrics named like the BehaviorSpace reporters."""
+        casualties = self.total_infantry_casualties / 10
+        return {
+            'battle-outcome': self.battle_outcome,
+            'total-infantry-crossed': self.total_infantry_crossed,
+            'total-infantry-casualties / 10': int(casualties) if casualties == int(casualties) else casualties,
+            'total-infantry-used': self.total_infantry_used,
+            'total-pontoons-used': self.total_pontoons_used,
+            'ticks': self.ticks,
+            '[step]': self.ticks,
+            **self.site_results()
+        }
+
+    def site_results(self):
+        """Per-site outcomes, one column per SITE_METRICS entry and site id (0..12)."""
+        results = {}
+        for name, field in SITE_METRICS:
+            for site, value in enumerate(getattr(self, field)):
+                results[f"{name}-{site}"] = int(value) if value == int(value) else float(value)
+        return results
+
+    def spawning(self):
+        spacing = self.params['spacing-mode']
+        if spacing == "Uniform":
+            return True
+        if spacing == "Waves":
+            duration = self.params['wave-duration']
+            return self.ticks % (duration + self.params['wave-pause']) < duration
+        return False
+
+    def spawn_units(self):
+        if not self.spawning():
+            return
+        p = self.params
+        for e, (_, entry_x, entry_y, heading, _) in enumerate(ENTRIES):
+            sites = self.entry_sites[e]
+            infantry_clogged = self.infantry_clogged[e]
+            trucks_clogged = self.trucks_clogged[e]
+            if (infantry_clogged and trucks_clogged) or not sites:
+                continue
+
+            next_unit = self.deployment_index[e] % 2
+            if next_unit == INFANTRY and not infantry_clogged:
+                site = sites[self.spawn_index_infantry[e] % len(sites)]
+                self._create_unit(INFANTRY, site, entry_x, entry_y, heading,
+                                  p['infantry-unit-depth'] * SITE_INFANTRY_UNITS_PER_ROAD[site] * 10)
+                self.total_infantry_used += p['infantry-unit-depth']
+                self.spawn_index_infantry[e] -= 1
+            if next_unit == TRUCK and not trucks_clogged:
+                site = sites[self.spawn_index_trucks[e] % len(sites)]
+                pontoons = p['truck-pontoon-module-capacity'] * p['truck-unit-depth'] * 10
+                self._create_unit(TRUCK, site, entry_x, entry_y, heading, pontoons)
+                self.total_pontoons_used += pontoons
+                self.spawn_index_trucks[e] -= 1
+            self.deployment_index[e] += 1
+
+    def _create_unit(self, breed, site, x, y, heading, payload):
+        uid = self.agents.append(x=x, y=y, heading=heading, breed=breed, site=site,
+                                 current_speed=0, payload=payload, asleep=False)
+        self.registry.add(breed, (x, y))
+        if breed == INFANTRY:
+            self.registry.site_units[site].add(uid)
+
+    def update_spawn_availability(self):
+        registry = self.registry
+        for e, (_, entry_x, entry_y, _, _) in enumerate(ENTRIES):
+            self.infantry_clogged[e] = registry.occupied(INFANTRY, (entry_x, entry_y))
+            self.trucks_clogged[e] = registry.occupied(TRUCK, (entry_x, entry_y))
+
+    def _turn_heading(self, site, x, y, heading):
+        """Port of turn-into-site-when-arrived."""
+        target_y = SITE_YS[site]
+        entry = SITE_ENTRY[site]
+        if entry == 1 and x > 250:
+            heading = 0 if y < target_y else 180
+        elif entry == 2:
+            if y == 82:
+                heading = 90
+            if x >= 250:
+                heading = 0
+        if y == target_y:
+            heading = 90
+        return heading
+
+    def move_units(self):
+        a = self.agents
+        n = a.n
+        if n == 0:
+            return
+        if self.compiled_movement:
+            self._move_units_compiled()
+            return
+        xs = a.x[:n].tolist()
+        ys = a.y[:n].tolist()
+        headings = a.heading[:n].tolist()
+        breeds = a.breed[:n].tolist()
+        sites = a.site[:n].tolist()
+        speeds = a.current_speed[:n].tolist()
+        payloads = a.payload[:n].tolist()
+        asleep = a.asleep[:n].tolist()
+        alive = [True] * n
+        watchers = self._watchers
+
+        registry = self.registry
+        occupied = registry.cells
+
+        terrain = self._flat_terrain()
+        dirt_x = self.params['dirt-roads-start-x']
+        required_builders = self.params['num-required-builders-per-site']
+        any_dead = False
+
+        # A unit that stops behind an occupied cell of its far cone decelerates to 0
+        # again every tick and never enters its move loop until that cell is
+        # vacated. It is parked (asleep) meanwhile and skipped, which turns a
+        # stopped column into a single moving front: whoever vacates a cell wakes
+        # the units waiting on it, before their turn if they come later this tick.
+        for i in self.streams.order(n):
+            if asleep[i]:
+                continue
+            breed = breeds[i]
+            cells = occupied[breed]
+            x, y, heading, site = xs[i], ys[i], headings[i], sites[i]
+
+            max_speed = self.max_dirt_speed[breed] if x > dirt_x else self.max_road_speed[breed]
+            blocker = _cone_blocker(cells, x, y, FAR_CONE[heading])
+            if blocker is not None:
+                speed = max(0, speeds[i] - self.deceleration[breed])
+                if speed == 0 and blocker != (x, y):
+                    asleep[i] = True
+                    watchers[breed].setdefault(blocker, []).append(i)
+            else:
+                speed = min(max_speed, speeds[i] + self.acceleration[breed])
+            speeds[i] = speed
+
+            remaining = speed
+            dead = False
+            while remaining > 0:
+                heading = self._turn_heading(site, x, y, heading)
+                dx, dy = STEP[heading]
+                ax, ay = x + dx, y + dy
+                inside = 0 <= ax < WORLD_WIDTH and 0 <= ay < WORLD_HEIGHT
+                ahead = terrain[ax * WORLD_HEIGHT + ay] if inside else None
+                move_ok = True
+
+                if ahead == WATER or (ahead == BRIDGE and breed == TRUCK):
+                    if breed == TRUCK and self.pontoon_count[site] < NUM_REQUIRED_PONTOONS_PER_SITE[site]:
+                        self.pontoon_count[site] += payloads[i]
+                        self.pontoons_delivered[site] += payloads[i]
+                        dead = True
+                        break
+                    if breed == INFANTRY and self.builder_count[site] < required_builders:
+                        self.builder_count[site] += payloads[i]
+                        dead = True
+                        break
+                    move_ok = False
+
+                if breed == INFANTRY and (ahead == GOAL or terrain[x * WORLD_HEIGHT + y] == GOAL):
+                    self.total_infantry_crossed += payloads[i]
+                    self.infantry_crossed[site] += payloads[i]
+                    dead = True
+                    break
+
+                if ahead == ROAD or (ahead == BRIDGE and breed == INFANTRY):
+                    if _cone_occupied(cells, x, y, NEAR_CONE[heading]):
+                        break
+                    tx, ty = TARGET_STEP[heading]
+                    if not (0 <= x + tx < WORLD_WIDTH and 0 <= y + ty < WORLD_HEIGHT):
+                        break
+                    key = (x, y)
+                    if cells[key] == 1:
+                        del cells[key]
+                        for j in watchers[breed].pop(key, ()):
+                            asleep[j] = False
+                    else:
+                        cells[key] -= 1
+                    x, y = ax, ay
+                    cells[(x, y)] = cells.get((x, y), 0) + 1
+                    remaining -= 1
+                elif move_ok:
+                    # NetLogo would loop forever here (edge of the world, or a
+                    # truck facing the far bank); the unit just stops for this tick
+                    break
+                if not move_ok:
+                    break
+
+            xs[i], ys[i], headings[i] = x, y, heading
+            if dead:
+                alive[i] = False
+                any_dead = True
+                if registry.remove(breed, (x, y)):
+                    for j in watchers[breed].pop((x, y), ()):
+                        asleep[j] = False
+
+        a.x[:n] = xs
+        a.y[:n] = ys
+        a.heading[:n] = headings
+        a.current_speed[:n] = speeds
+        a.asleep[:n] = asleep
+        if any_dead:
+            self._remap_watchers(self._drop_dead(np.array(alive)))
+
+    def _move_units_compiled(self):
+        """move_units through movement_kernel: same order, moves and wake-ups, with the loop compiled."""
+        a = self.agents
+        n = a.n
+        start_x = a.x[:n].copy()
+        start_y = a.y[:n].copy()
+        waiting = np.full(n, -1, dtype=np.int64)
+        if self._waiting is not None:
+            # Units spawned since the last move wait on nothing
+            waiting[:len(self._waiting)] = self._waiting
+        else:
+            for watchers in self._watcher_cells:
+                for (x, y), units in watchers.items():
+                    waiting[units] = x * WORLD_HEIGHT + y
+        alive = np.ones(n, dtype=np.bool_)
+        scratch = movement_kernel.scratch(WORLD_WIDTH, WORLD_HEIGHT)
+        p = self.params
+
+        crossed = self.move_kernel(
+            np.asarray(self.streams.order(n), dtype=np.int64), a.x[:n], a.y[:n], a.heading[:n], a.breed[:n],
+            a.site[:n], a.current_speed[:n], a.payload[:n], a.asleep[:n], waiting, alive,
+            self._terrain, scratch.occupied, scratch.heads, scratch.links_for(n),
+            _FAR_DX, _FAR_DY, _FAR_LEN, _NEAR_DX, _NEAR_DY, _NEAR_LEN, _STEPS, _TARGET_STEPS,
+            np.array(self.max_road_speed, dtype=np.float64), np.array(self.max_dirt_speed, dtype=np.float64),
+            np.array(self.acceleration, dtype=np.float64), np.array(self.deceleration, dtype=np.float64),
+            p['dirt-roads-start-x'], p['num-required-builders-per-site'], _SITE_YS, _SITE_ENTRY,
+            _REQUIRED_PONTOONS, self.pontoon_count, self.pontoons_delivered, self.builder_count,
+            self.infantry_crossed)
+        self.total_infantry_crossed += int(crossed)
+
+        registry = self.registry
+        changed = np.flatnonzero((a.x[:n] != start_x) | (a.y[:n] != start_y) | ~alive)
+        if len(changed):
+            breeds, sites = a.breed[changed].tolist(), a.site[changed].tolist()
+            breeds = a.breed[changed].tolist()
+            for breed, x, y in zip(breeds, start_x[changed].tolist(), start_y[changed].tolist()):
+                registry.remove(breed, (x, y))
+            for breed, x, y, kept in zip(breeds, a.x[changed].tolist(), a.y[changed].tolist(),
+                                         alive[changed].tolist()):
+                if kept:
+                    registry.add(breed, (x, y))
+        if not alive.all():
+            self._drop_dead(alive)
+            waiting = waiting[alive]
+        self._waiting = waiting
+
+    def _drop_dead(self, alive):
+        """Removes the agents whose `alive` entry is False, and their infantry from the site registry.
+
+        Returns:
+            numpy.ndarray: New index of every old agent (see AgentArrays.keep).
+        """
+        a = self.agents
+        dead = np.flatnonzero(~alive & (a.breed[:a.n] == INFANTRY))
+        self.registry.forget_site_units(a.site[dead].tolist(), a.uid[dead].tolist())
+        return a.keep(alive)
+
+    def _remap_watchers(self, index):
+        index = index.tolist()
+        for watchers in self._watchers:
+            for cell, units in list(watchers.items()):
+                units = [index[j] for j in units if index[j] >= 0]
+                if units:
+                    watchers[cell] = units
+                else:
+                    del watchers[cell]
+
+    @property
+    def active_agents(self):
+        """Units move-units visits individually (the others are parked in stopped columns)."""
+        return int(self.agents.n - np.count_nonzero(self.agents.asleep[:self.agents.n]))
+
+    def convoys(self):
+        """The stopped columns of parked units, longest first (ties by head cell).
+
+        Each parked unit waits on one cell ahead of it; following those links
+        from unit to unit leads to the column's head.
+
+        Returns:
+            list: Convoy objects.
+        """
+        a = self.agents
+        n = a.n
+        xs, ys, breeds, sites = a.x[:n].tolist(), a.y[:n].tolist(), a.breed[:n].tolist(), a.site[:n].tolist()
+        at = ({}, {})
+        for i in range(n):
+            at[breeds[i]].setdefault((xs[i], ys[i]), i)
+        ahead = {}
+        for breed, watchers in enumerate(self._watchers):
+            for cell, units in watchers.items():
+                for i in units:
+                    ahead[i] = at[breed].get(cell)
+        columns = {}
+        for i in ahead:
+            head, seen = i, {i}
+            while ahead.get(head) is not None and ahead[head] not in seen:
+                head = ahead[head]
+                seen.add(head)
+            columns.setdefault(head, {head}).add(i)
+        convoys = [Convoy(breeds[head], sites[head], (xs[head], ys[head]), len(units),
+                          len({(xs[i], ys[i]) for i in units}))
+                   for head, units in columns.items()]
+        return sorted(convoys, key=lambda convoy: (-convoy.count, convoy.head))
+
+    def build_pontoon_bridges(self):
+        result = self.site_table.build(slice(self.row, self.row + 1))
+        if result is not None:
+            self._finish_build(result[0][0], result[1][0])
+
+    def _finish_build(self, completed, built):
+        if completed.any():
+            for site in np.flatnonzero(completed).tolist():
+                self.draw_bridge(site)
+                if self.first_bridge_tick[site] < 0:
+                    self.first_bridge_tick[site] = self.ticks
+                if self.events is not None:
+                    self.events.bridge(self, site)
+        self.total_pontoons_built += float(built)
+
+    def drone_detect_and_artillery_fire(self):
+        num_active, recent = self.site_table.update_activity(slice(self.row, self.row + 1), self.ticks)
+        self._fire_artillery(int(num_active[0]), recent[0])
+
+    def _fire_artillery(self, num_active, recent):
+        # Strike draws stay sequential, in site-selection order, to keep the streams of a single run
+        p = self.params
+        if num_active == 0 or self.ticks % p['time-between-drone-checks']:
+            return
+        durations = self.activity_duration
+        candidates = recent & (durations > 45)
+        if not candidates.any():
+            return
+        for site in self.chosen_site_ids:
+            if not candidates[site]:
+                continue
+            p_destroyed = max(0, 1 - p['artillery-alpha'] * num_active) * \
+                (1 - math.exp(-p['artillery-beta'] * (int(durations[site]) - 45)))
+            if self.streams.uniform('artillery', self.ticks * 16 + site) < p_destroyed:
+                builders = int(self.builder_count[site])
+                pontoons = float(self.pontoon_count[site] + self.pontoon_built_count[site])
+                killed = self.destroy_site(site)
+                if self.events is not None:
+                    self.events.strike(self, site, num_active, p_destroyed, builders, killed, pontoons)
+
+    def destroy_site(self, site):
+        """Port of destroy-site. Returns the infantry killed on the bridge."""
+        builders, had_bridge = self.site_table.destroy(self.row, site)
+        self.total_infantry_casualties += builders
+        if had_bridge:
+            self.redraw_water(site)
+
+        x_start = self.map.bridge_start_x[site]
+        x_end = self.map.bridge_end_x[site]
+        if x_start is None or x_end is None:
+            return 0
+        units = self.registry.site_units[site]
+        if not units:
+            return 0
+        y = SITE_YS[site]
+        a = self.agents
+        # Only the site's own infantry are looked up; the arrays are compacted only when some are hit
+        index = np.sort(a.indices(np.fromiter(units, dtype=np.int64, count=len(units))))
+        xs, ys = a.x[index], a.y[index]
+        hit = index[(xs >= x_start) & (xs <= x_end) & (ys >= y - 2) & (ys <= y + 2)]
+        if not len(hit):
+            return 0
+        killed = int(a.payload[hit].sum())
+        self.total_infantry_casualties += killed
+        watchers = self._watchers[INFANTRY]
+        for cell in zip(a.x[hit].tolist(), a.y[hit].tolist()):
+            if self.registry.remove(INFANTRY, cell):
+                for j in watchers.pop(cell, ()):
+                    a.asleep[j] = False
+        alive = np.ones(a.n, dtype=bool)
+        alive[hit] = False
+        self._remap_watchers(self._drop_dead(alive))
+        return killed
+
+    def battle_over(self):
+        p = self.params
+        if self.ticks >= p['loss-battle-duration-threshold'] or self.total_infantry_casualties / 10 > 4500:
+            self.battle_outcome = "Retreat"
+            return True
+        if self.total_infantry_crossed >= p['win-num-crossers-threshold']:
+            self.battle_outcome = "Victory"
+            return True
+        return False
+
+
+def _cone_occupied(cells, x, y, offsets):
+    if cells.get((x, y), 0) > 1:
+        return True
+    for dx, dy in offsets:
+        if (x + dx, y + dy) in cells:
+            return True
+    return False
+
+
+def _cone_blocker(cells, x, y, offsets):
+    """First occupied cell of a cone (the unit's own cell when it is shared), or None."""
+    if cells.get((x, y), 0) > 1:
+        return x, y
+    for dx, dy in offsets:
+        cell = (x + dx, y + dy)
+        if cell in cells:
+            return cell
+    return None
+
+
+def run_wave_pause_grid(params, pauses, seed=0, max_ticks=None, map_data=None):
+    """Runs one Waves configuration for several wave-pause values sharing their common prefix.
+
+    Configurations with the same wave-duration D behave identically until
+    tick D + pause, so a single trunk model is run with the smallest
+    remaining pause and forked just before each pause ends. Forks keep the
+    trunk's random streams, so each result equals a from-scratch run of
+    (params, pause, seed).
+
+    Returns:
+        dict: wave-pause -> metrics.
+    """
+    pauses = sorted(set(pauses))
+    params = dict(params)
+    params['spacing-mode'] = "Waves"
+    params['wave-pause'] = pauses[0]
+    trunk = IrpinModel(params, seed, map_data)
+    duration = trunk.params['wave-duration']
+
+    results = {}
+    for k, pause in enumerate(pauses):
+        trunk.set_param('wave-pause', pause)
+        trunk.run(until_tick=duration + pause, max_ticks=max_ticks)
+        if trunk.done or k == len(pauses) - 1:
+            branch = trunk
+        else:
+            branch = trunk.fork()
+        results[pause] = branch.run(max_ticks=max_ticks)
+    return results
+
+
+def run_batch(jobs, max_ticks=None, map_data=None):
+    """Runs several (params, seed) jobs in lockstep, sharing one SiteTable.
+
+    The agents of each replicate are moved and spawned model by model, while
+    the site procedures (build-pontoon-bridges and the activity bookkeeping
+    of drone-detect-and-artillery-fire) update every live replicate's sites
+    in one vectorized pass per tick. Strike draws stay per model, so each
+    result equals a from-scratch run of its job.
+
+    Returns:
+        list: Metrics of each job, in order.
+    """
+    map_data = map_data or load_map()
+    table = SiteTable(len(jobs))
+    models = [IrpinModel(params, seed, map_data, table, row) for row, (params, seed) in enumerate(jobs)]
+    for model in models:
+        if max_ticks is None and not model.params['turn-on-stop-conditions?']:
+            raise ValueError("max_ticks is required when turn-on-stop-conditions? is off")
+    live = []
+    for model in models:
+        if max_ticks is not None and model.ticks >= max_ticks:
+            table.retire(model.row)
+        else:
+            live.append(model)
+    rows = slice(None)
+    while live:
+        for model in live:
+            model.move_units()
+            model.update_spawn_availability()
+            model.spawn_units()
+        built = table.build(rows)
+        if built is not None:
+            completed, pontoons = built
+            for model in live:
+                model._finish_build(completed[model.row], pontoons[model.row])
+        ticks = live[0].ticks
+        num_active, recent = table.update_activity(rows, ticks)
+        still_live = []
+        for model in live:
+            if model.params['turn-on-artillery?']:
+                model._fire_artillery(int(num_active[model.row]), recent[model.row])
+            if model.params['turn-on-stop-conditions?'] and model.battle_over():
+                model.done = True
+            else:
+                model.ticks += 1
+            if model.done or (max_ticks is not None and model.ticks >= max_ticks):
+                table.retire(model.row)
+            else:
+                still_live.append(model)
+        live = still_live
+    for model in models:
+        table.configure(model.row, model.chosen_site_ids, model.params)
+    return [model.results() for model in models]
@@ -0,0 +1,173 @@
+import os
+import time
+import argparse
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import pandas as pd
+
+from adaptive import wilson_interval, OUTCOME_METRIC, CASUALTY_METRIC, USED_METRIC
+from cell_charts import plot_wave_heatmaps, plot_win_rates
+from online_stats import StatsAggregator
+from sweep import Sweep, PythonBackend, CoarseBackend, NetLogoBackend, load_experiments, SCRIPT_DIR
+from worker_pool import WorkerPool, aggregate_chunk, python_groups
+
+
+def live_tasks(sweep, points, reps, keys, metrics, coarse=False, seed_base=0, accuracy=0.01):
+    """Yields aggregate_chunk arguments repetition by repetition, so every cell fills up at the same pace.
+
+    Full-model Waves jobs of one repetition that differ only in wave-pause
+    form one task, which runs them as a single forked run.
+    """
+    for rep in range(reps):
+        jobs = [sweep.job(point, rep, seed_base) for point in points]
+        groups = [[i] for i in range(len(jobs))] if coarse else [indices for indices, _ in python_groups(jobs)]
+        for indices in groups:
+            yield coarse, [jobs[i] for i in indices], keys, metrics, accuracy
+
+
+def stream_aggregates(tasks, keys, metrics, threads=1, queue_size=None, coarse=False, accuracy=0.01):
+    """Runs tasks and yields the merged StatsAggregator each time one lands.
+
+    At most `queue_size` tasks (twice the workers by default) are submitted
+    ahead of the consumer, so a sweep of any size holds only that many tasks
+    and the per-configuration accumulators in memory. Closing the generator
+    (e.g. breaking out of the loop) cancels the tasks not yet started.
+    """
+    merged = StatsAggregator(keys, metrics, accuracy=accuracy)
+    tasks = iter(tasks)
+    if threads <= 1:
+        for task in tasks:
+            merged.merge(StatsAggregator.from_state(aggregate_chunk(*task)))
+            yield merged
+        return
+
+    queue_size = queue_size or 2 * threads
+    pool = WorkerPool(threads, routes=coarse)
+    pending = set()
+    try:
+        while True:
+            for task in tasks:
+                pending.add(pool.submit(aggregate_chunk, *task))
+                if len(pending) >= queue_size:
+                    break
+            if not pending:
+                return
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                merged.merge(StatsAggregator.from_state(future.result()))
+                yield merged
+    finally:
+        for future in pending:
+            future.cancel()
+        pool.close()
+
+
+def cell_summary(aggregator, z=1.96):
+    """One row per configuration: runs, win rate with its Wilson interval (%) and the metric means."""
+    rows = []
+    for key, cell in aggregator.cells.items():
+        wins = cell['outcomes'].get('Victory', 0)
+        low, high = wilson_interval(wins, cell['runs'], z)
+        row = dict(zip(aggregator.keys, key))
+        row.update({'runs': cell['runs'], 'victories': wins, 'win_rate': 100 * wins / cell['runs'],
+                    'win_low': 100 * low, 'win_high': 100 * high})
+        row.update({name: stats.mean for name, stats in cell['metrics'].items()})
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def converged(summary, half_width, min_runs=2):
+    """Whether every configuration has `min_runs` runs and a win-rate interval no wider than +-half_width points."""
+    if summary.empty or (summary['runs'] < min_runs).any():
+        return False
+    return bool(((summary['win_high'] - summary['win_low']) / 2 <= half_width).all())
+
+
+def cell_totals(summary):
+    """Per-cell totals of a cell_summary, in the form cell_charts draws (see run_data.cell_totals)."""
+    return summary.assign(total_infantry_casualties_10=summary[CASUALTY_METRIC] * summary['runs'],
+                          total_infantry_used=summary[USED_METRIC] * summary['runs'])
+
+
+def _render(plot, cells, path, **kwargs):
+    # Written aside and moved into place, so a viewer never reads a half-written image
+    base, ext = os.path.splitext(path)
+    partial = f"{base}.partial{ext}"
+    plot(cells, partial, **kwargs)
+    os.replace(partial, path)
+
+
+def main():
+    """Runs an experiment with live, incrementally updated aggregates and charts, optionally stopping once converged."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('experiment', help="Experiment name as defined in the model file")
+    parser.add_argument('--backend', choices=['python', 'python-coarse'], default='python')
+    parser.add_argument('--repetitions', type=int, default=None, help="Most repetitions per configuration")
+    parser.add_argument('--seed-base', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--queue-size', type=int, default=None,
+                        help="Tasks submitted ahead of the aggregation (default: twice the threads)")
+    parser.add_argument('--render-every', type=float, default=30.0, help="Seconds between chart updates")
+    parser.add_argument('--stop-half-width', type=float, default=None,
+                        help="Stop once every configuration's 95%% win-rate interval is within +-this many points")
+    parser.add_argument('--min-runs', type=int, default=10, help="Runs per configuration before stopping early")
+    parser.add_argument('--max-seconds', type=float, default=None,
+                        help="Stop submitting runs after this long (checked as runs land; running tasks finish)")
+    parser.add_argument('--out', default=os.path.join(SCRIPT_DIR, "Live_Sweep"),
+                        help="Prefix of the charts and the stats table")
+    args = parser.parse_args()
+
+    experiment = load_experiments()[args.experiment]
+    reps = experiment.repetitions if args.repetitions is None else args.repetitions
+    coarse = args.backend == 'python-coarse'
+    backend = CoarseBackend() if coarse else PythonBackend()
+    sweep = Sweep(backend, None, base_params=PythonBackend().default_params())
+    keys = list(experiment.values)
+    metrics = [m for m in NetLogoBackend.DEFAULT_METRICS if m != OUTCOME_METRIC]
+    points = list(experiment.points())
+    tasks = live_tasks(sweep, points, reps, keys, metrics, coarse, args.seed_base)
+    waves = {'wave-pause', 'wave-duration'} <= set(keys)
+
+    def render(merged, seconds):
+        summary = cell_summary(merged)
+        title = f"{merged.runs} runs, {len(summary)}/{len(points)} configurations, {seconds:.0f} s"
+        cells = cell_totals(summary)
+        if waves:
+            _render(plot_wave_heatmaps, cells, args.out + "_Heatmap.png", title=title, dpi=150)
+        if 'site-selection-mode' in keys:
+            _render(plot_win_rates, cells, args.out + "_Win_Rates.png", by='site-selection-mode', title=title,
+                    z=1.96, dpi=150)
+        worst = ((summary['win_high'] - summary['win_low']) / 2).max()
+        print(f"{title}: widest win-rate interval +-{worst:.1f} points")
+        return summary
+
+    start = last_render = time.perf_counter()
+    merged = StatsAggregator(keys, metrics)
+    stream = stream_aggregates(tasks, keys, metrics, args.threads, args.queue_size, coarse)
+    try:
+        for merged in stream:
+            now = time.perf_counter()
+            if now - last_render >= args.render_every:
+                summary = render(merged, now - start)
+                last_render = now
+                if args.stop_half_width is not None and len(summary) == len(points) \
+                        and converged(summary, args.stop_half_width, args.min_runs):
+                    print("Every configuration has converged; stopping.")
+                    break
+            if args.max_seconds is not None and now - start >= args.max_seconds:
+                print("Time limit reached; stopping.")
+                break
+    except KeyboardInterrupt:
+        print("Interrupted; writing the aggregates so far.")
+    finally:
+        stream.close()
+
+    seconds = time.perf_counter() - start
+    if merged.runs:
+        render(merged, seconds)
+        merged.write_stats(args.out + "-stats.csv", experiment.name)
+        print(f"Stats of {merged.runs} runs saved to {args.out}-stats.csv")
+
+
+if __name__ == '__main__':
+    main()
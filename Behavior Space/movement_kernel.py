@@ -0,0 +1,280 @@
+import os
+import time
+import argparse
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# Compiled movement is used when Numba is installed, unless IRPIN_NO_JIT is set
+AVAILABLE = numba is not None and not os.environ.get('IRPIN_NO_JIT')
+
+# Terrain codes and breeds, as in irpin_model
+ROAD, WATER, GOAL, BRIDGE = 0, 1, 2, 3
+INFANTRY, TRUCK = 0, 1
+
+
+def cone_arrays(cones):
+    """Pads per-heading cone offsets (in heading order 0, 90, 180, 270) into (dx, dy, lengths) arrays."""
+    width = max(len(offsets) for offsets in cones)
+    dx = np.zeros((len(cones), width), dtype=np.int64)
+    dy = np.zeros((len(cones), width), dtype=np.int64)
+    for h, offsets in enumerate(cones):
+        if offsets:
+            dx[h, :len(offsets)], dy[h, :len(offsets)] = zip(*offsets)
+    return dx, dy, np.array([len(offsets) for offsets in cones], dtype=np.int64)
+
+
+def _turn_heading(site, x, y, heading, site_ys, site_entry):
+    """Port of turn-into-site-when-arrived (IrpinModel._turn_heading)."""
+    target_y = site_ys[site]
+    entry = site_entry[site]
+    if entry == 1 and x > 250:
+        heading = 0 if y < target_y else 180
+    elif entry == 2:
+        if y == 82:
+            heading = 90
+        if x >= 250:
+            heading = 0
+    if y == target_y:
+        heading = 90
+    return heading
+
+
+def _wake(heads, links, asleep, waiting, breed, cell):
+    """Wakes the parked units waiting for a vacated cell."""
+    j = heads[breed, cell]
+    while j >= 0:
+        asleep[j] = False
+        waiting[j] = -1
+        j = links[j]
+    heads[breed, cell] = -1
+
+
+def _move_units(order, xs, ys, headings, breeds, sites, speeds, payloads, asleep, waiting, alive,
+                terrain, occupied, heads, links, far_dx, far_dy, far_len, near_dx, near_dy, near_len,
+                steps, target_steps, max_road_speed, max_dirt_speed, acceleration, deceleration,
+                dirt_x, required_builders, site_ys, site_entry, required_pontoons,
+                pontoon_count, pontoons_delivered, builder_count, infantry_crossed):
+    """One move-units pass over flat unit arrays, updated in place (see IrpinModel.move_units).
+
+    `occupied` (units per breed and cell) and `heads` (first parked unit
+    waiting on each breed and flat cell, -1 if none) are scratch arrays that
+    must be all 0 and all -1 on entry; they are left that way. `waiting`
+    holds the flat cell (x * height + y) each parked unit waits on, or -1.
+
+    Returns:
+        int: Infantry that crossed the river this tick.
+    """
+    n = len(xs)
+    width, height = terrain.shape
+    for i in range(n):
+        occupied[breeds[i], xs[i], ys[i]] += 1
+        if waiting[i] >= 0:
+            links[i] = heads[breeds[i], waiting[i]]
+            heads[breeds[i], waiting[i]] = i
+
+    crossed = 0
+    for k in range(n):
+        i = order[k]
+        if asleep[i]:
+            continue
+        breed = breeds[i]
+        x = xs[i]
+        y = ys[i]
+        heading = headings[i]
+        site = sites[i]
+
+        max_speed = max_dirt_speed[breed] if x > dirt_x else max_road_speed[breed]
+        h = heading // 90
+        blocker_x = -1
+        blocker_y = -1
+        if occupied[breed, x, y] > 1:
+            blocker_x = x
+            blocker_y = y
+        else:
+            for m in range(far_len[h]):
+                cx = x + far_dx[h, m]
+                cy = y + far_dy[h, m]
+                if 0 <= cx < width and 0 <= cy < height and occupied[breed, cx, cy] > 0:
+                    blocker_x = cx
+                    blocker_y = cy
+                    break
+        if blocker_x >= 0:
+            speed = max(0.0, speeds[i] - deceleration[breed])
+            if speed == 0 and (blocker_x != x or blocker_y != y):
+                asleep[i] = True
+                cell = blocker_x * height + blocker_y
+                waiting[i] = cell
+                links[i] = heads[breed, cell]
+                heads[breed, cell] = i
+        else:
+            speed = min(max_speed, speeds[i] + acceleration[breed])
+        speeds[i] = speed
+
+        remaining = speed
+        dead = False
+        while remaining > 0:
+            heading = _turn_heading(site, x, y, heading, site_ys, site_entry)
+            h = heading // 90
+            ax = x + steps[h, 0]
+            ay = y + steps[h, 1]
+            ahead = terrain[ax, ay] if 0 <= ax < width and 0 <= ay < height else -1
+            move_ok = True
+
+            if ahead == WATER or (ahead == BRIDGE and breed == TRUCK):
+                if breed == TRUCK and pontoon_count[site] < required_pontoons[site]:
+                    pontoon_count[site] += payloads[i]
+                    pontoons_delivered[site] += payloads[i]
+                    dead = True
+                    break
+                if breed == INFANTRY and builder_count[site] < required_builders:
+                    builder_count[site] += payloads[i]
+                    dead = True
+                    break
+                move_ok = False
+
+            if breed == INFANTRY and (ahead == GOAL or terrain[x, y] == GOAL):
+                crossed += payloads[i]
+                infantry_crossed[site] += payloads[i]
+                dead = True
+                break
+
+            if ahead == ROAD or (ahead == BRIDGE and breed == INFANTRY):
+                blocked = occupied[breed, x, y] > 1
+                for m in range(near_len[h]):
+                    if blocked:
+                        break
+                    cx = x + near_dx[h, m]
+                    cy = y + near_dy[h, m]
+                    blocked = 0 <= cx < width and 0 <= cy < height and occupied[breed, cx, cy] > 0
+                if blocked:
+                    break
+                tx = x + target_steps[h, 0]
+                ty = y + target_steps[h, 1]
+                if not (0 <= tx < width and 0 <= ty < height):
+                    break
+                occupied[breed, x, y] -= 1
+                if occupied[breed, x, y] == 0:
+                    _wake(heads, links, asleep, waiting, breed, x * height + y)
+                x = ax
+                y = ay
+                occupied[breed, x, y] += 1
+                remaining -= 1
+            elif move_ok:
+                break
+            if not move_ok:
+                break
+
+        xs[i] = x
+        ys[i] = y
+        headings[i] = heading
+        if dead:
+            alive[i] = False
+            occupied[breed, x, y] -= 1
+            if occupied[breed, x, y] == 0:
+                _wake(heads, links, asleep, waiting, breed, x * height + y)
+
+    for i in range(n):
+        if alive[i]:
+            occupied[breeds[i], xs[i], ys[i]] -= 1
+        if waiting[i] >= 0:
+            heads[breeds[i], waiting[i]] = -1
+    return crossed
+
+
+# The uncompiled kernel, for checking the compiled one and the model's own loop against it
+move_units_interpreted = _move_units
+if numba is not None:
+    _turn_heading = numba.njit(cache=True)(_turn_heading)
+    _wake = numba.njit(cache=True)(_wake)
+    move_units = numba.njit(cache=True)(_move_units)
+else:
+    move_units = _move_units
+
+
+class MovementScratch:
+    """Scratch arrays of the kernel for one world size (left cleared by every call, so a tick never clears them)."""
+
+    def __init__(self, width, height):
+        self.occupied = np.zeros((2, width, height), dtype=np.int32)
+        self.heads = np.full((2, width * height), -1, dtype=np.int64)
+        self.links = np.full(256, -1, dtype=np.int64)
+
+    def links_for(self, n):
+        if len(self.links) < n:
+            self.links = np.full(2 * n, -1, dtype=np.int64)
+        return self.links
+
+
+_SCRATCH = {}
+
+
+def scratch(width, height):
+    """The process's MovementScratch for a world size."""
+    if (width, height) not in _SCRATCH:
+        _SCRATCH[width, height] = MovementScratch(width, height)
+    return _SCRATCH[width, height]
+
+
+def compare_runs(params, seed=0, max_ticks=None, interpreted=False):
+    """Runs one configuration with the model's own movement loop and with the kernel.
+
+    Returns:
+        tuple: (identical results and final agents, seconds with the loop, seconds with the kernel)
+    """
+    from irpin_model import IrpinModel
+
+    outputs = []
+    for compiled in (False, True):
+        model = IrpinModel(params, seed)
+        model.compiled_movement = compiled
+        model.move_kernel = move_units_interpreted if interpreted else move_units
+        start = time.perf_counter()
+        results = model.run(max_ticks=max_ticks)
+        outputs.append((results, model.agents.export(), time.perf_counter() - start))
+    (expected, expected_agents, loop_seconds), (actual, actual_agents, kernel_seconds) = outputs
+    same = expected == actual and all(np.array_equal(expected_agents[name], actual_agents[name])
+                                      for name in expected_agents)
+    return same, loop_seconds, kernel_seconds
+
+
+def main():
+    """Checks the movement kernel against the model's movement loop and times both."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--seeds', type=int, default=3)
+    parser.add_argument('--max-ticks', type=int, default=None)
+    parser.add_argument('--interpreted', action='store_true',
+                        help="Run the kernel uncompiled (what is checked when Numba is not installed)")
+    args = parser.parse_args()
+
+    interpreted = args.interpreted or numba is None
+    scenarios = [
+        {'site-selection-mode': "13 Shortest Bridges", 'spacing-mode': "Uniform"},
+        {'site-selection-mode': "05 Shortest Bridges", 'spacing-mode': "Waves", 'wave-pause': 70,
+         'wave-duration': 200},
+        {'site-selection-mode': "01 Shortest Bridges", 'spacing-mode': "Uniform", 'turn-on-artillery?': False},
+    ]
+    if numba is None:
+        print("Numba is not installed: checking the uncompiled kernel (the model keeps its own loop)")
+    elif not interpreted:
+        # Compile outside the timed runs
+        compare_runs(scenarios[0], 0, args.max_ticks)
+    failures = 0
+    for params in scenarios:
+        for seed in range(args.seeds):
+            same, loop_seconds, kernel_seconds = compare_runs(params, seed, args.max_ticks, interpreted)
+            failures += not same
+            print(f"{params['site-selection-mode']}, {params['spacing-mode']}, seed {seed}: "
+                  f"{'identical' if same else 'DIFFERENT'}, loop {loop_seconds:.2f} s, "
+                  f"kernel {kernel_seconds:.2f} s ({loop_seconds / kernel_seconds:.1f}x)")
+    if failures:
+        raise SystemExit(f"{failures} run(s) differ")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,211 @@
+import os
+import time
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from adaptive import wilson_interval
+from run_cache import RunCache, DEFAULT_CACHE_FILE
+from run_data import standardize_runs
+from sweep import Sweep, PythonBackend, CoarseBackend, make_backend, load_experiments, write_table, SCRIPT_DIR
+
+
+METRICS = ['total_infantry_used', 'total_pontoons_used', 'ticks']
+
+
+class MultiFidelitySweep:
+    """Screens a grid with the coarse model and re-runs only the cells that matter at full resolution.
+
+    Every point gets `coarse_reps` coarse runs. A cell is promoted to
+    `fine_reps` full-resolution runs when it is promising (the upper bound of
+    its win-rate interval reaches the best lower bound, less `margin`) or
+    ambiguous (its interval straddles `threshold`, the win rate the caller
+    wants to decide on). Both fidelities use the same seeds, so the coarse
+    and full runs of a promoted cell share their artillery random streams.
+
+    Args:
+        coarse_sweep: Sweep over a CoarseBackend.
+        fine_sweep: Sweep over a full-resolution backend.
+        points: Parameter dicts of the grid cells.
+    """
+
+    def __init__(self, coarse_sweep, fine_sweep, points, coarse_reps=20, fine_reps=10, confidence=0.95,
+                 threshold=0.5, margin=0.05, max_promoted=None, seed_base=0):
+        self.coarse_sweep = coarse_sweep
+        self.fine_sweep = fine_sweep
+        self.points = list(points)
+        self.coarse_reps = coarse_reps
+        self.fine_reps = fine_reps
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.threshold = threshold
+        self.margin = margin
+        self.max_promoted = max_promoted
+        self.seed_base = seed_base
+        self.tables = {}
+        self.runs = {}
+        self.seconds = {}
+        self.cells = None
+
+    def _run(self, fidelity, sweep, cells, reps):
+        jobs = [sweep.job(self.points[cell], rep, self.seed_base) for cell in cells for rep in range(reps)]
+        start = time.perf_counter()
+        table = sweep.run(jobs)
+        self.seconds[fidelity] = time.perf_counter() - start
+        runs = standardize_runs(table.copy())
+        runs['cell'] = np.repeat(cells, reps)
+        self.tables[fidelity] = table
+        self.runs[fidelity] = runs
+        return runs
+
+    def _summarize(self, runs, prefix):
+        grouped = runs.groupby('cell')
+        summary = pd.DataFrame({prefix + 'runs': grouped.size(), prefix + 'wins': grouped['victory'].sum()})
+        bounds = [wilson_interval(wins, n, self.z)
+                  for wins, n in zip(summary[prefix + 'wins'], summary[prefix + 'runs'])]
+        summary[prefix + 'win_rate'] = summary[prefix + 'wins'] / summary[prefix + 'runs'] * 100
+        summary[prefix + 'win_low'] = [low * 100 for low, _ in bounds]
+        summary[prefix + 'win_high'] = [high * 100 for _, high in bounds]
+        for metric in METRICS:
+            summary[prefix + metric] = grouped[metric].mean()
+        return summary.drop(columns=prefix + 'wins')
+
+    def screen(self):
+        """Runs the coarse screen of every cell and marks the cells to promote.
+
+        Returns:
+            pandas.DataFrame: One row per cell with its point, the coarse
+            estimates, `promising`, `ambiguous` and `promoted`.
+        """
+        runs = self._run('coarse', self.coarse_sweep, np.arange(len(self.points)), self.coarse_reps)
+        cells = pd.DataFrame(self.points)
+        cells = cells.join(self._summarize(runs, 'coarse_'))
+        best_low = cells['coarse_win_low'].max()
+        cells['promising'] = cells['coarse_win_high'] >= best_low - self.margin * 100
+        cells['ambiguous'] = ((cells['coarse_win_low'] < self.threshold * 100)
+                              & (cells['coarse_win_high'] > self.threshold * 100))
+        promoted = cells['promising'] | cells['ambiguous']
+        if self.max_promoted is not None and promoted.sum() > self.max_promoted:
+            # Keep the cells with the best optimistic bound
+            order = cells[promoted].sort_values(['coarse_win_high', 'coarse_win_rate', 'coarse_total_infantry_used'],
+                                                ascending=[False, False, True]).index
+            promoted[:] = cells.index.isin(order[:self.max_promoted])
+        cells['promoted'] = promoted
+        self.cells = cells
+        return cells
+
+    def refine(self):
+        """Runs the full-resolution replicates of the promoted cells and adds their estimates."""
+        if self.cells is None:
+            self.screen()
+        promoted = np.flatnonzero(self.cells['promoted'].to_numpy())
+        if len(promoted):
+            runs = self._run('fine', self.fine_sweep, promoted, self.fine_reps)
+            self.cells = self.cells.drop(columns=[c for c in self.cells.columns if c.startswith('fine_')])
+            self.cells = self.cells.join(self._summarize(runs, 'fine_'))
+        return self.cells
+
+    def run(self):
+        """Screens, refines and returns the cell table."""
+        self.screen()
+        return self.refine()
+
+    def agreement(self):
+        """How well the coarse screen matched the full-resolution runs on the promoted cells.
+
+        Returns:
+            dict: Mean absolute and largest win-rate difference (points),
+            Spearman rank correlation of the win rates, share of cells on the
+            same side of `threshold`, mean relative error of every resource
+            metric, and the share of promoted cells whose full-resolution win
+            rate lies inside the coarse interval.
+        """
+        if self.cells is None or 'fine_win_rate' not in self.cells.columns:
+            raise ValueError("No full-resolution runs to compare with; call run() first")
+        both = self.cells.dropna(subset=['fine_win_rate'])
+        diff = both['coarse_win_rate'] - both['fine_win_rate']
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rank_correlation = both['coarse_win_rate'].rank().corr(both['fine_win_rate'].rank())
+        report = {
+            'cells_compared': len(both),
+            'win_rate_mean_abs_diff': float(diff.abs().mean()),
+            'win_rate_max_abs_diff': float(diff.abs().max()),
+            'win_rate_rank_correlation': float(rank_correlation),
+            'same_side_of_threshold': float(((both['coarse_win_rate'] >= self.threshold * 100)
+                                             == (both['fine_win_rate'] >= self.threshold * 100)).mean()),
+            'fine_inside_coarse_interval': float(both['fine_win_rate'].between(both['coarse_win_low'],
+                                                                                both['coarse_win_high']).mean()),
+        }
+        for metric in METRICS:
+            relative = (both['coarse_' + metric] - both['fine_' + metric]) / both['fine_' + metric].abs().clip(lower=1)
+            report[metric + '_mean_rel_error'] = float(relative.abs().mean())
+        return report
+
+    def cost(self):
+        """Runs and wall-clock seconds spent per fidelity, and the estimated cost of a full-resolution grid."""
+        report = {}
+        for fidelity, runs in self.runs.items():
+            report[fidelity + '_runs'] = len(runs)
+            report[fidelity + '_seconds'] = self.seconds[fidelity]
+        if 'fine' in self.runs and self.runs['fine'].shape[0]:
+            per_run = self.seconds['fine'] / len(self.runs['fine'])
+            report['full_grid_fine_seconds_estimate'] = per_run * len(self.points) * self.fine_reps
+        return report
+
+    def best(self):
+        """Best promoted cell by full-resolution win rate, then fewer infantry and pontoons used."""
+        refined = self.cells.dropna(subset=['fine_win_rate'])
+        if refined.empty:
+            raise ValueError("No promoted cell has full-resolution runs")
+        ranked = refined.sort_values(['fine_win_rate', 'fine_total_infantry_used', 'fine_total_pontoons_used'],
+                                     ascending=[False, True, True])
+        return ranked.iloc[0]
+
+
+def main():
+    """Screens an experiment's grid with the coarse model and re-runs the promising or ambiguous cells in full."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('experiment', nargs='?', default="Vary Site-Selection Artillery Active Waves")
+    parser.add_argument('--coarse-reps', type=int, default=20)
+    parser.add_argument('--fine-reps', type=int, default=10)
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--threshold', type=float, default=0.5,
+                        help="Win rate whose side a cell must be resolved on (ambiguous cells are promoted)")
+    parser.add_argument('--margin', type=float, default=0.05,
+                        help="Promote cells whose upper win-rate bound is within this of the best lower bound")
+    parser.add_argument('--max-promoted', type=int, default=None)
+    parser.add_argument('--seed-base', type=int, default=0)
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--backend', choices=['netlogo', 'python'], default='python',
+                        help="Full-resolution backend")
+    parser.add_argument('--netlogo-home', default=None)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    experiment = load_experiments()[args.experiment]
+    fine_backend = make_backend(args.backend, args.netlogo_home, args.threads)
+    coarse_backend = CoarseBackend(processes=args.threads)
+    with RunCache(args.cache) as cache:
+        driver = MultiFidelitySweep(
+            Sweep(coarse_backend, cache, base_params=PythonBackend().default_params()), Sweep(fine_backend, cache),
+            experiment.points(), coarse_reps=args.coarse_reps, fine_reps=args.fine_reps,
+            confidence=args.confidence, threshold=args.threshold, margin=args.margin,
+            max_promoted=args.max_promoted, seed_base=args.seed_base)
+        cells = driver.run()
+
+    print(f"Promoted {int(cells['promoted'].sum())} of {len(cells)} cells "
+          f"({int(cells['promising'].sum())} promising, {int(cells['ambiguous'].sum())} ambiguous).")
+    for name, value in {**driver.cost(), **driver.agreement()}.items():
+        print(f"  {name}: {value:.4g}")
+    print("\nBest cell:")
+    print(driver.best().to_string())
+
+    base = os.path.join(SCRIPT_DIR, f"IrpinModel {experiment.name} (multi-fidelity)")
+    cells.to_csv(base + "-cells.csv", index=False)
+    for fidelity, table in driver.tables.items():
+        write_table(table, base + f"-{fidelity}-table.csv", experiment.name)
+
+
+if __name__ == '__main__':
+    main()
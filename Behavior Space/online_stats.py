@@ -0,0 +1,333 @@
+import os
+import csv
+import math
+import json
+import time
+import argparse
+
+
+QUANTILES = (('p05', 0.05), ('median', 0.5), ('p95', 0.95))
+
+
+class QuantileSketch:
+    """Mergeable quantile sketch with bounded relative error (DDSketch).
+
+    Values fall into logarithmic buckets whose bounds differ by a factor
+    (1 + accuracy) / (1 - accuracy), so every quantile is returned within
+    `accuracy` of a true value while the sketch holds only a few hundred
+    bucket counts whatever the number of values. Two sketches merge by adding
+    their bucket counts.
+    """
+
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.count = 0
+
+    def add(self, value):
+        if value > 0:
+            key = math.ceil(math.log(value) / self._log_gamma)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif value < 0:
+            key = math.ceil(math.log(-value) / self._log_gamma)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else:
+            self.zero += 1
+        self.count += 1
+
+    def merge(self, other):
+        for mine, theirs in ((self.positive, other.positive), (self.negative, other.negative)):
+            for key, count in theirs.items():
+                mine[key] = mine.get(key, 0) + count
+        self.zero += other.zero
+        self.count += other.count
+
+    def _value(self, key):
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def quantile(self, q):
+        if self.count == 0:
+            return float('nan')
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def state(self):
+        return {'accuracy': self.accuracy, 'zero': self.zero, 'count': self.count,
+                'positive': sorted(self.positive.items()), 'negative': sorted(self.negative.items())}
+
+    @classmethod
+    def from_state(cls, state):
+        sketch = cls(state['accuracy'])
+        sketch.positive = {int(key): count for key, count in state['positive']}
+        sketch.negative = {int(key): count for key, count in state['negative']}
+        sketch.zero = state['zero']
+        sketch.count = state['count']
+        return sketch
+
+
+class MetricStats:
+    """Count, Welford mean and variance, extremes and a QuantileSketch of one metric."""
+
+    def __init__(self, accuracy=0.01):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sketch = QuantileSketch(accuracy)
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        self.sketch.add(value)
+
+    def merge(self, other):
+        """Chan et al.'s parallel update of the moments."""
+        if other.count == 0:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.sketch.merge(other.sketch)
+
+    @property
+    def std(self):
+        """Sample standard deviation, as in BehaviorSpace's stats output."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else float('nan')
+
+    def state(self):
+        return {'count': self.count, 'mean': self.mean, 'm2': self.m2, 'min': self.min, 'max': self.max,
+                'sketch': self.sketch.state()}
+
+    @classmethod
+    def from_state(cls, state):
+        stats = cls()
+        stats.count, stats.mean, stats.m2 = state['count'], state['mean'], state['m2']
+        stats.min, stats.max = state['min'], state['max']
+        stats.sketch = QuantileSketch.from_state(state['sketch'])
+        return stats
+
+
+class StatsAggregator:
+    """Per-configuration accumulators of run results, mergeable across workers.
+
+    Each configuration (the values of `keys`) holds its run count, the count
+    of every battle-outcome and a MetricStats per numeric metric, so its size
+    does not depend on the number of runs. Workers aggregate their own runs
+    and send their state; the host merges the states into the complete table.
+
+    Args:
+        keys: Parameter names identifying a configuration.
+        metrics: Numeric result names to accumulate.
+        outcome: Result name whose values are counted.
+    """
+
+    def __init__(self, keys, metrics, outcome='battle-outcome', accuracy=0.01):
+        self.keys = list(keys)
+        self.metrics = [m for m in metrics if m != outcome]
+        self.outcome = outcome
+        self.accuracy = accuracy
+        self.cells = {}
+
+    def _cell(self, key):
+        cell = self.cells.get(key)
+        if cell is None:
+            cell = self.cells[key] = {'runs': 0, 'outcomes': {},
+                                      'metrics': {m: MetricStats(self.accuracy) for m in self.metrics}}
+        return cell
+
+    def add(self, params, result):
+        cell = self._cell(tuple(params[k] for k in self.keys))
+        cell['runs'] += 1
+        outcome = result.get(self.outcome)
+        if outcome is not None:
+            cell['outcomes'][outcome] = cell['outcomes'].get(outcome, 0) + 1
+        for name, stats in cell['metrics'].items():
+            stats.add(result[name])
+
+    def merge(self, other):
+        for key, theirs in other.cells.items():
+            cell = self._cell(key)
+            cell['runs'] += theirs['runs']
+            for outcome, count in theirs['outcomes'].items():
+                cell['outcomes'][outcome] = cell['outcomes'].get(outcome, 0) + count
+            for name, stats in theirs['metrics'].items():
+                cell['metrics'][name].merge(stats)
+
+    @property
+    def runs(self):
+        return sum(cell['runs'] for cell in self.cells.values())
+
+    def state(self):
+        """JSON-ready state, the unit workers send and checkpoints store."""
+        return {'keys': self.keys, 'metrics': self.metrics, 'outcome': self.outcome, 'accuracy': self.accuracy,
+                'cells': [[list(key), cell['runs'], cell['outcomes'],
+                           {name: stats.state() for name, stats in cell['metrics'].items()}]
+                          for key, cell in self.cells.items()]}
+
+    @classmethod
+    def from_state(cls, state):
+        aggregator = cls(state['keys'], state['metrics'], state['outcome'], state['accuracy'])
+        for key, runs, outcomes, metrics in state['cells']:
+            aggregator.cells[tuple(key)] = {'runs': runs, 'outcomes': dict(outcomes),
+                                            'metrics': {name: MetricStats.from_state(s)
+                                                        for name, s in metrics.items()}}
+        return aggregator
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.state(), f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_state(json.load(f))
+
+    def rows(self):
+        """Header and one row per configuration of the stats table."""
+        outcomes = sorted({outcome for cell in self.cells.values() for outcome in cell['outcomes']})
+        header = self.keys + ['[runs]'] + [f"(count) {self.outcome} = {outcome}" for outcome in outcomes]
+        for name in self.metrics:
+            header += [f"(mean) {name}", f"(std) {name}", f"(min) {name}"]
+            header += [f"({label}) {name}" for label, _ in QUANTILES]
+            header += [f"(max) {name}"]
+        rows = []
+        for key, cell in self.cells.items():
+            row = list(key) + [cell['runs']] + [cell['outcomes'].get(outcome, 0) for outcome in outcomes]
+            for name in self.metrics:
+                stats = cell['metrics'][name]
+                row += [stats.mean, stats.std, stats.min]
+                # The sketch's bucket midpoints can overshoot the observed extremes
+                row += [min(max(stats.sketch.quantile(q), stats.min), stats.max) for _, q in QUANTILES]
+                row += [stats.max]
+            rows.append(row)
+        return header, rows
+
+    def write_stats(self, path, experiment_name, model_name="IrpinModel.nlogo"):
+        """Writes the table in the layout of BehaviorSpace's "Stats version 2.0" files, one row per configuration."""
+        header, rows = self.rows()
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            writer.writerow(["BehaviorSpace results (NetLogo 6.4.0)", "Stats version 2.0"])
+            writer.writerow([model_name])
+            writer.writerow([experiment_name])
+            writer.writerow([time.strftime("%m/%d/%Y %H:%M:%S %z")])
+            writer.writerow(["min-pxcor", "max-pxcor", "min-pycor", "max-pycor"])
+            writer.writerow(["0", "459", "0", "624"])
+            writer.writerow(header)
+            for row in rows:
+                writer.writerow([_cell(v) for v in row])
+
+
+def _cell(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def aggregate_results(keys, metrics, jobs, results, accuracy=0.01):
+    """A StatsAggregator state over (params, seed) jobs and their results."""
+    aggregator = StatsAggregator(keys, metrics, accuracy=accuracy)
+    for (params, _), result in zip(jobs, results):
+        aggregator.add(params, result)
+    return aggregator.state()
+
+
+def point_chunks(points, size):
+    """Splits grid points into chunks of `size` points, keeping a chunk's repetitions together."""
+    points = list(points)
+    return [points[i:i + size] for i in range(0, len(points), size)]
+
+
+def main():
+    """Runs a BehaviorSpace experiment with worker-side aggregation and writes its stats table."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('experiment', help="Experiment name as defined in the model file")
+    parser.add_argument('--backend', choices=['python', 'python-coarse'], default='python')
+    parser.add_argument('--repetitions', type=int, default=None)
+    parser.add_argument('--seed-base', type=int, default=0)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--points-per-chunk', type=int, default=4,
+                        help="Grid points a worker runs (all repetitions) before sending its accumulators")
+    parser.add_argument('--state', default=None,
+                        help="Checkpoint of the merged accumulators, resumed from and rewritten after every chunk")
+    parser.add_argument('--accuracy', type=float, default=0.01, help="Relative error of the quantiles")
+    parser.add_argument('--out', default=None, help="Output stats file")
+    args = parser.parse_args()
+
+    # Imported here: worker_pool imports this module for its worker tasks
+    from sweep import Sweep, PythonBackend, CoarseBackend, NetLogoBackend, load_experiments, SCRIPT_DIR
+    from worker_pool import WorkerPool, aggregate_chunk
+
+    experiment = load_experiments()[args.experiment]
+    reps = experiment.repetitions if args.repetitions is None else args.repetitions
+    coarse = args.backend == 'python-coarse'
+    backend = CoarseBackend() if coarse else PythonBackend()
+    sweep = Sweep(backend, None, base_params=PythonBackend().default_params())
+    keys = list(experiment.values)
+    metrics = [m for m in NetLogoBackend.DEFAULT_METRICS if m != 'battle-outcome']
+
+    merged = StatsAggregator(keys, metrics, accuracy=args.accuracy)
+    done = set()
+    if args.state:
+        try:
+            merged = StatsAggregator.load(args.state)
+            # Chunks are merged whole, so a configuration is either complete or (with other repetitions) redone
+            merged.cells = {key: cell for key, cell in merged.cells.items() if cell['runs'] >= reps}
+            done = set(merged.cells)
+            print(f"Resuming from {args.state}: {len(done)} configuration(s) complete")
+        except FileNotFoundError:
+            pass
+    points = [p for p in experiment.points() if tuple(p[k] for k in keys) not in done]
+    chunks = [sweep.jobs_for(chunk, reps, args.seed_base) for chunk in point_chunks(points, args.points_per_chunk)]
+    tasks = [(coarse, chunk, keys, metrics, args.accuracy) for chunk in chunks]
+
+    start = time.perf_counter()
+    shipped = 0
+    pool = WorkerPool(args.threads, routes=coarse) if args.threads > 1 and len(tasks) > 1 else None
+    try:
+        outputs = pool.map(aggregate_chunk, *zip(*tasks)) if pool else (aggregate_chunk(*task) for task in tasks)
+        for state in outputs:
+            shipped += len(json.dumps(state))
+            merged.merge(StatsAggregator.from_state(state))
+            if args.state:
+                merged.save(args.state)
+    finally:
+        if pool:
+            pool.close()
+    seconds = time.perf_counter() - start
+
+    out = args.out or os.path.join(SCRIPT_DIR, f"IrpinModel {experiment.name}-stats.csv")
+    merged.write_stats(out, experiment.name)
+    runs = sum(len(chunk) for chunk in chunks)
+    print(f"{runs} runs in {seconds:.1f} s, {len(merged.cells)} configurations, "
+          f"{shipped / 1024:.1f} KiB of accumulators shipped ({shipped / max(runs, 1):.0f} B per run)")
+    print(f"Stats saved to {out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+import os
+import math
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from run_cache import RunCache, DEFAULT_CACHE_FILE
+from run_data import load_runs, standardize_runs, summarize_cells, score_cells, best_cell, SCRIPT_DIR
+from surrogate import BattleSurrogate, candidate_settings, encode_settings
+from sweep import Sweep, make_backend, write_table
+
+
+CELL_COLUMNS = ['site_selection_mode', 'wave_pause', 'wave_duration']
+
+
+def expected_improvement(mean, std, best, xi=0.0):
+    """Expected improvement of normally distributed scores over the incumbent `best`."""
+    std = np.maximum(np.asarray(std, dtype=float), 1e-12)
+    gain = np.asarray(mean, dtype=float) - best - xi
+    z = gain / std
+    cdf = 0.5 * (1 + np.array([math.erf(v / math.sqrt(2)) for v in z]))
+    pdf = np.exp(-0.5 * z * z) / math.sqrt(2 * math.pi)
+    return gain * cdf + std * pdf
+
+
+class BayesianOptimizer:
+    """Bayesian optimization of (site-selection mode, wave-pause, wave-duration) for Waves spacing.
+
+    The objective is score_cells: win rate minus `resource_weight` times the
+    relative infantry and pontoon use. Each iteration fits a BattleSurrogate
+    to every run so far, picks a batch of untested grid cells by expected
+    improvement (with local penalization so a batch spreads out) and runs
+    `reps_per_point` repetitions of each through the sweep backend and cache.
+    """
+
+    def __init__(self, sweep, num_sites=range(1, 14), pauses=range(10, 151, 10), durations=range(50, 401, 25),
+                 reps_per_point=10, batch_size=4, resource_weight=0.1, xi=0.0, prior_runs=None,
+                 seed_base=0, seed=0):
+        self.sweep = sweep
+        self.candidates = candidate_settings(num_sites, pauses, durations, include_uniform=False)
+        self.reps_per_point = reps_per_point
+        self.batch_size = batch_size
+        self.resource_weight = resource_weight
+        self.xi = xi
+        self.seed_base = seed_base
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.runs = pd.DataFrame()
+        if prior_runs is not None:
+            prior = prior_runs[prior_runs['spacing_mode'] == 'Waves'].copy()
+            prior['iteration'] = -1
+            self.runs = prior
+        self.tables = []
+        self.history = []
+        self.scales = None
+
+    @staticmethod
+    def _point(setting):
+        return {
+            'site-selection-mode': setting['site_selection_mode'],
+            'spacing-mode': 'Waves',
+            'wave-pause': int(setting['wave_pause']),
+            'wave-duration': int(setting['wave_duration'])
+        }
+
+    def evaluate(self, settings, iteration):
+        """Runs every setting `reps_per_point` times and adds the runs to the data."""
+        jobs = [self.sweep.job(self._point(s), rep, self.seed_base)
+                for _, s in settings.iterrows() for rep in range(self.reps_per_point)]
+        table = self.sweep.run(jobs)
+        self.tables.append(table)
+        runs = standardize_runs(table)
+        runs['iteration'] = iteration
+        self.runs = pd.concat([self.runs, runs], ignore_index=True)
+        if self.scales is None:
+            cells = summarize_cells(self.runs, CELL_COLUMNS)
+            self.scales = (cells['total_infantry_used'].median(), cells['total_pontoons_used'].median())
+
+    def _tested_mask(self):
+        tested = set(map(tuple, self.runs[CELL_COLUMNS].astype({'wave_pause': float, 'wave_duration': float})
+                         .itertuples(index=False)))
+        keys = self.candidates[CELL_COLUMNS].astype({'wave_pause': float, 'wave_duration': float})
+        return np.array([tuple(k) in tested for k in keys.itertuples(index=False)])
+
+    def _min_runs(self, cells):
+        # Warm-started cells may have fewer runs than reps_per_point; then every cell counts
+        return self.reps_per_point if (cells['runs'] >= self.reps_per_point).any() else 1
+
+    def incumbent(self):
+        cells = summarize_cells(self.runs, CELL_COLUMNS)
+        cells = cells[cells['runs'] >= self._min_runs(cells)]
+        if cells.empty:
+            return -np.inf
+        return float(score_cells(cells, self.resource_weight, self.scales).max())
+
+    def propose(self, batch_size=None):
+        """Picks the next batch of untested cells.
+
+        Returns:
+            tuple: (DataFrame of settings, largest expected improvement)
+        """
+        batch_size = batch_size or self.batch_size
+        surrogate = BattleSurrogate(seed=self.seed).fit(self.runs)
+        predicted = surrogate.predict(self.candidates, targets=['win_rate', 'infantry_used', 'pontoons_used'])
+        frame = pd.DataFrame({
+            'win_rate': predicted['win_rate'] * 100,
+            'total_infantry_used': predicted['infantry_used'],
+            'total_pontoons_used': predicted['pontoons_used']
+        })
+        score = score_cells(frame, self.resource_weight, self.scales).to_numpy()
+        ei = expected_improvement(score, predicted['win_rate_std'], self.incumbent(), self.xi)
+        ei[self._tested_mask()] = -np.inf
+        max_ei = float(ei.max())
+
+        # Local penalization: damp the acquisition around every point already in the batch
+        X = surrogate._scale(encode_settings(self.candidates))
+        lengthscale = surrogate.models['win_rate'].lengthscale
+        chosen = []
+        for _ in range(min(batch_size, int(np.isfinite(ei).sum()))):
+            index = int(np.argmax(ei))
+            chosen.append(index)
+            ei = np.where(np.isfinite(ei), ei * (1 - np.exp(-0.5 * ((X - X[index]) ** 2).sum(1) / lengthscale ** 2)), ei)
+            ei[index] = -np.inf
+        return self.candidates.iloc[chosen].reset_index(drop=True), max_ei
+
+    def run(self, iterations=15, n_init=None, tol=1e-4):
+        """Runs the initial design (unless warm-started) and the optimization iterations.
+
+        Returns:
+            pandas.Series: The best cell found (see best).
+        """
+        if self.runs.empty:
+            n_init = n_init or 2 * self.batch_size
+            index = self.rng.choice(len(self.candidates), size=n_init, replace=False)
+            print(f"Initial design: {n_init} random cell(s).")
+            self.evaluate(self.candidates.iloc[index], 0)
+        elif self.scales is None:
+            cells = summarize_cells(self.runs, CELL_COLUMNS)
+            self.scales = (cells['total_infantry_used'].median(), cells['total_pontoons_used'].median())
+
+        for iteration in range(1, iterations + 1):
+            batch, max_ei = self.propose()
+            if batch.empty or max_ei < tol:
+                print(f"Stopping at iteration {iteration}: expected improvement {max_ei:.2e} below {tol:.0e}.")
+                break
+            print(f"Iteration {iteration}: evaluating {len(batch)} cell(s), max expected improvement {max_ei:.4f}")
+            self.evaluate(batch, iteration)
+            best = self.best()
+            self.history.append({'iteration': iteration, 'max_expected_improvement': max_ei,
+                                 'runs': int((self.runs['iteration'] >= 0).sum()),
+                                 'best_score': best['score'], **best[CELL_COLUMNS].to_dict()})
+            print(f"  best so far: {best['site_selection_mode']}, pause={best['wave_pause']:g}, "
+                  f"duration={best['wave_duration']:g} (win rate {best['win_rate']:.1f}%)")
+
+        simulated = int((self.runs['iteration'] >= 0).sum()) if not self.runs.empty else 0
+        full = len(self.candidates) * self.reps_per_point
+        print(f"Simulated {simulated} runs; the full grid at the same replication needs {full}.")
+        return self.best()
+
+    def best(self):
+        """Best cell in the data (not a prediction), ranked by the same score as the objective."""
+        min_runs = self._min_runs(summarize_cells(self.runs, CELL_COLUMNS))
+        return best_cell(self.runs, CELL_COLUMNS, self.resource_weight, min_runs=min_runs)
+
+    def results(self):
+        """Every run simulated by the optimizer as one DataFrame."""
+        if not self.tables:
+            return pd.DataFrame()
+        df = pd.concat(self.tables, ignore_index=True)
+        df['[run number]'] = range(1, len(df) + 1)
+        return df
+
+
+def main():
+    """Searches wave-pause, wave-duration and site-selection mode by Bayesian optimization."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--iterations', type=int, default=15)
+    parser.add_argument('--batch-size', type=int, default=4, help="Cells simulated per iteration")
+    parser.add_argument('--reps', type=int, default=10, help="Repetitions per cell")
+    parser.add_argument('--n-init', type=int, default=None)
+    parser.add_argument('--resource-weight', type=float, default=0.1)
+    parser.add_argument('--warm-start', action='store_true',
+                        help="Start from the existing Waves runs instead of a random design")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--backend', choices=['netlogo', 'python'], default='netlogo')
+    parser.add_argument('--netlogo-home', default=None)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    backend = make_backend(args.backend, args.netlogo_home, args.threads)
+    prior = load_runs() if args.warm_start else None
+    with RunCache(args.cache) as cache:
+        optimizer = BayesianOptimizer(Sweep(backend, cache), reps_per_point=args.reps,
+                                      batch_size=args.batch_size, resource_weight=args.resource_weight,
+                                      prior_runs=prior)
+        best = optimizer.run(args.iterations, args.n_init)
+
+    print("\nBest cell found:")
+    print(best.to_string())
+    base = os.path.join(SCRIPT_DIR, "IrpinModel Waves Optimization")
+    pd.DataFrame(optimizer.history).to_csv(base + "-history.csv", index=False)
+    if optimizer.tables:
+        write_table(optimizer.results(), base + "-table.csv", "Waves Optimization")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+import math
+from statistics import NormalDist
+
+import pandas as pd
+
+
+def paired_differences(df, pair_col, group_col, value_col, baseline, confidence=0.95):
+    """Computes paired differences of a metric between each group and a baseline group.
+
+    Runs are paired by `pair_col` (for example `crn-replicate`, the common
+    random numbers replicate index), so the difference of two groups is taken
+    within each pair before averaging. With common random numbers the paired
+    standard error is much smaller than the unpaired one; the ratio of the two
+    variances is reported as `variance_reduction`.
+
+    Args:
+        df: Run-level data.
+        pair_col: Column (or list of columns) identifying a pair.
+        group_col: Column holding the compared configurations.
+        value_col: Metric to compare.
+        baseline: Group every other group is compared against.
+        confidence: Confidence level of the interval on the mean difference.
+
+    Returns:
+        DataFrame with one row per non-baseline group.
+    """
+    wide = df.pivot_table(index=pair_col, columns=group_col, values=value_col, aggfunc='mean')
+    if baseline not in wide.columns:
+        raise ValueError(f"Baseline '{baseline}' not found in column '{group_col}'")
+
+    z = NormalDist().inv_cdf(0.5 + confidence / 2)
+    rows = []
+    for group in wide.columns:
+        if group == baseline:
+            continue
+        pairs = wide[[group, baseline]].dropna()
+        n = len(pairs)
+        if n < 2:
+            continue
+
+        diff = pairs[group] - pairs[baseline]
+        mean = diff.mean()
+        paired_se = diff.std(ddof=1) / math.sqrt(n)
+        unpaired_se = math.sqrt(pairs[group].var(ddof=1) / n + pairs[baseline].var(ddof=1) / n)
+
+        if paired_se > 0:
+            p_value = 2 * (1 - NormalDist().cdf(abs(mean) / paired_se))
+            variance_reduction = (unpaired_se / paired_se) ** 2
+        else:
+            p_value = 1.0 if mean == 0 else 0.0
+            variance_reduction = float('inf') if unpaired_se > 0 else 1.0
+
+        rows.append({
+            'group': group,
+            'baseline': baseline,
+            'n_pairs': n,
+            'mean_diff': mean,
+            'ci_low': mean - z * paired_se,
+            'ci_high': mean + z * paired_se,
+            'paired_se': paired_se,
+            'unpaired_se': unpaired_se,
+            'variance_reduction': variance_reduction,
+            'p_value': p_value
+        })
+    return pd.DataFrame(rows)
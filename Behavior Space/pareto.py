@@ -0,0 +1,253 @@
+import os
+import time
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+
+from run_data import load_runs, SCRIPT_DIR
+
+
+# Objective -> True when larger is better
+OBJECTIVES = {
+    'win_rate': True,
+    'total_infantry_used': False,
+    'total_pontoons_used': False,
+    'ticks': False,
+}
+CELL_COLUMNS = ['spacing_mode', 'site_selection_mode', 'wave_pause', 'wave_duration']
+
+
+def _as_costs(values, maximize):
+    """Flips maximized objectives so that every column is minimized."""
+    values = np.asarray(values, dtype=float)
+    return np.where(np.asarray(maximize, dtype=bool), -values, values)
+
+
+def pareto_mask(values, maximize):
+    """Non-dominated (skyline) rows of a value matrix.
+
+    A row is dominated when another row is at least as good in every
+    objective and strictly better in one; identical rows do not dominate each
+    other. Rows are culled against one front candidate at a time, visiting
+    candidates in order of their summed rank so that strong points remove most
+    of the matrix early; the cost is O(n * front size) vectorized operations.
+
+    Args:
+        values: (n, k) array, one column per objective.
+        maximize: k booleans, True where larger is better.
+
+    Returns:
+        numpy.ndarray: Boolean mask of the non-dominated rows.
+    """
+    costs = _as_costs(values, maximize)
+    n = len(costs)
+    if n == 0:
+        return np.zeros(0, dtype=bool)
+    order = np.argsort(costs.argsort(axis=0).argsort(axis=0).sum(axis=1), kind='stable')
+    remaining = order
+    points = costs[order]
+    position = 0
+    while position < len(points):
+        current = points[position]
+        keep = (points < current).any(axis=1) | (points == current).all(axis=1)
+        remaining, points = remaining[keep], points[keep]
+        position = int(keep[:position].sum()) + 1
+    mask = np.zeros(n, dtype=bool)
+    mask[remaining] = True
+    return mask
+
+
+def dominated_by(values, others, maximize, chunk_size=4096):
+    """Whether each row of `values` is dominated by some row of `others`.
+
+    Only the skyline of `others` can dominate anything the rest of `others`
+    dominates, so the comparison runs against that front in chunks.
+    """
+    costs = _as_costs(values, maximize)
+    front = _as_costs(others, maximize)
+    front = front[pareto_mask(front, np.zeros(front.shape[1], dtype=bool))] if len(front) else front
+    dominated = np.zeros(len(costs), dtype=bool)
+    if len(front) == 0:
+        return dominated
+    for start in range(0, len(costs), chunk_size):
+        block = costs[start:start + chunk_size, None, :]
+        no_worse = (front[None, :, :] <= block).all(axis=2)
+        better = (front[None, :, :] < block).any(axis=2)
+        dominated[start:start + chunk_size] = (no_worse & better).any(axis=1)
+    return dominated
+
+
+class ParetoFront:
+    """Pareto front of configuration cells over win rate and resource use.
+
+    Keeps per-cell sufficient statistics (runs, wins, sums and sums of
+    squares of the minimized metrics), so new runs can be merged with update
+    without revisiting old ones. Each cell gets a point estimate and a
+    confidence interval per objective (Wilson for win rate, normal for the
+    means). `pareto` marks the non-dominated cells by point estimate;
+    `possibly_pareto` marks the cells whose optimistic bounds are not
+    dominated by any cell's pessimistic bounds, i.e. the cells the data cannot
+    yet rule out.
+    """
+
+    def __init__(self, by=CELL_COLUMNS, objectives=OBJECTIVES, confidence=0.95, outcome_col='battle_outcome'):
+        self.by = list(by)
+        self.objectives = dict(objectives)
+        self.metrics = [name for name in self.objectives if name != 'win_rate']
+        self.maximize = np.array(list(self.objectives.values()))
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.outcome_col = outcome_col
+        self.stats = None
+        self.table = None
+
+    def _cell_stats(self, runs):
+        frame = runs[self.by].copy()
+        frame['n'] = 1.0
+        frame['wins'] = (runs[self.outcome_col] == 'Victory').astype(float)
+        for metric in self.metrics:
+            values = runs[metric].astype(float)
+            frame[metric + '_sum'] = values
+            frame[metric + '_sq'] = values * values
+        return frame.groupby(self.by, dropna=False).sum()
+
+    def update(self, runs):
+        """Merges new runs into the cell statistics and refreshes the front.
+
+        When no cell on the current point-estimate front changed, the new
+        front is the skyline of the old front plus the changed cells, so only
+        those are compared; otherwise the whole front is recomputed.
+
+        Returns:
+            ParetoFront: self
+        """
+        return self._merge(self._cell_stats(runs))
+
+    def update_totals(self, totals):
+        """Like update, from per-cell totals (run_data.cell_totals or ResultsStore.totals) instead of runs.
+
+        Returns:
+            ParetoFront: self
+        """
+        frame = totals[self.by].copy()
+        frame['n'] = totals['runs'].astype(float)
+        frame['wins'] = totals['victories'].astype(float)
+        for metric in self.metrics:
+            frame[metric + '_sum'] = totals[metric].astype(float)
+            frame[metric + '_sq'] = totals[metric + '_sq'].astype(float)
+        return self._merge(frame.groupby(self.by, dropna=False).sum())
+
+    def _merge(self, new):
+        previous = self.table
+        self.stats = new if self.stats is None else self.stats.add(new, fill_value=0)
+        self.table = self._estimates()
+        changed = self.table.index.isin(new.index)
+
+        values = self.table[list(self.objectives)].to_numpy()
+        if previous is not None and not previous['pareto'].reindex(new.index, fill_value=False).any():
+            front = self.table.index.isin(previous.index[previous['pareto']])
+            candidates = np.flatnonzero(front | changed)
+            mask = np.zeros(len(values), dtype=bool)
+            mask[candidates[pareto_mask(values[candidates], self.maximize)]] = True
+        else:
+            mask = pareto_mask(values, self.maximize)
+        self.table['pareto'] = mask
+
+        optimistic = self.table[[self._bound(name, True) for name in self.objectives]].to_numpy()
+        pessimistic = self.table[[self._bound(name, False) for name in self.objectives]].to_numpy()
+        self.table['possibly_pareto'] = ~dominated_by(optimistic, pessimistic, self.maximize)
+        return self
+
+    def _bound(self, name, optimistic):
+        good_is_high = self.objectives[name]
+        return name + ('_high' if good_is_high == optimistic else '_low')
+
+    def _estimates(self):
+        stats = self.stats
+        n = stats['n'].to_numpy()
+        table = pd.DataFrame({'runs': n.astype(int)}, index=stats.index)
+
+        # Wilson score interval on the win proportion, reported in percent
+        p = stats['wins'].to_numpy() / n
+        z2 = self.z * self.z
+        center = (p + z2 / (2 * n)) / (1 + z2 / n)
+        half = self.z * np.sqrt(p * (1 - p) / n + z2 / (4 * n * n)) / (1 + z2 / n)
+        table['win_rate'] = p * 100
+        table['win_rate_low'] = np.clip(center - half, 0, 1) * 100
+        table['win_rate_high'] = np.clip(center + half, 0, 1) * 100
+
+        for metric in self.metrics:
+            mean = stats[metric + '_sum'].to_numpy() / n
+            with np.errstate(invalid='ignore', divide='ignore'):
+                var = np.maximum(stats[metric + '_sq'].to_numpy() - n * mean * mean, 0) / (n - 1)
+                half = np.where(n > 1, self.z * np.sqrt(var / n), np.inf)
+            table[metric] = mean
+            table[metric + '_low'] = mean - half
+            table[metric + '_high'] = mean + half
+        return table
+
+    def front(self, possibly=False):
+        """Cells on the front (or that could still be on it), best win rate first."""
+        column = 'possibly_pareto' if possibly else 'pareto'
+        return self.table[self.table[column]].sort_values('win_rate', ascending=False).reset_index()
+
+
+def plot_front(table, path, x_metrics=('total_infantry_used', 'total_pontoons_used', 'ticks'), title=None):
+    """Scatter of win rate against each resource metric, front cells highlighted with their intervals."""
+    fig, axes = plt.subplots(1, len(x_metrics), figsize=(6 * len(x_metrics), 6), sharey=True)
+    axes = np.atleast_1d(axes)
+    front = table[table['pareto']]
+    possible = table[table['possibly_pareto'] & ~table['pareto']]
+    rest = table[~table['possibly_pareto']]
+    for ax, metric in zip(axes, x_metrics):
+        ax.scatter(rest[metric], rest['win_rate'], s=8, color='#bbbbbb', label='Dominated')
+        ax.scatter(possible[metric], possible['win_rate'], s=14, color='#f39c12', alpha=0.7,
+                   label='Not ruled out (CI)')
+        ax.errorbar(front[metric], front['win_rate'],
+                    xerr=[front[metric] - front[metric + '_low'], front[metric + '_high'] - front[metric]],
+                    yerr=[front['win_rate'] - front['win_rate_low'], front['win_rate_high'] - front['win_rate']],
+                    fmt='o', color='#c0392b', ecolor='#c0392b', elinewidth=0.8, capsize=2, markersize=5,
+                    label='Pareto front')
+        ax.set_xlabel(metric.replace('_', ' ').title(), fontsize=12, fontweight='bold')
+        ax.grid(linestyle='--', alpha=0.7)
+    axes[0].set_ylabel('Success Rate (%)', fontsize=12, fontweight='bold')
+    axes[0].legend(loc='lower right')
+    plt.suptitle(title or 'Pareto Front: Success Rate vs Resource Use', fontsize=16, fontweight='bold')
+    plt.tight_layout()
+    plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close(fig)
+
+
+def main():
+    """Computes the Pareto front of configuration cells over win rate, infantry, pontoons and ticks."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('runs', nargs='*', help="Run tables (defaults to the Waves and Uniform data)")
+    parser.add_argument('--by', nargs='+', default=CELL_COLUMNS, help="Columns identifying a cell")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--out', default=os.path.join(SCRIPT_DIR, "Pareto_Front.csv"))
+    parser.add_argument('--figure', default=os.path.join(SCRIPT_DIR, "Pareto_Front.png"))
+    args = parser.parse_args()
+
+    runs = load_runs(args.runs or None)
+    start = time.perf_counter()
+    pareto = ParetoFront(args.by, confidence=args.confidence).update(runs)
+    elapsed = time.perf_counter() - start
+    table = pareto.table
+    print(f"{len(table)} cells from {len(runs)} runs in {elapsed:.3f}s: {int(table['pareto'].sum())} on the front, "
+          f"{int(table['possibly_pareto'].sum())} not ruled out at {args.confidence:.0%} confidence.")
+
+    columns = args.by + ['runs', 'win_rate', 'win_rate_low', 'win_rate_high'] + pareto.metrics
+    print("\nPareto-optimal cells:")
+    print(pareto.front()[columns].to_string(index=False))
+    table.reset_index().to_csv(args.out, index=False)
+    print(f"Cell table saved to {args.out}")
+    plot_front(table, args.figure)
+    print(f"Pareto front figure saved to {args.figure}")
+
+
+if __name__ == '__main__':
+    main()
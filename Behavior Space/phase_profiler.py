@@ -0,0 +1,167 @@
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from irpin_model import INFANTRY, IrpinModel
+
+
+PHASES = ['move-units', 'update-spawn-availability', 'spawn-units', 'build-pontoon-bridges',
+          'drone-detect-and-artillery-fire']
+
+
+class PhaseProfiler:
+    """Times the procedures of a model's tick loop (attach it as `model.profiler`).
+
+    Every `every`-th tick is sampled: each procedure of go is timed on its
+    own and the agent counts at the start of the tick are recorded. Unsampled
+    ticks run the plain loop, and a model without a profiler pays a single
+    None check per tick.
+
+    Args:
+        every: Sampling interval in ticks (1 times every tick).
+    """
+
+    def __init__(self, every=1):
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        self.every = every
+        self.ticks = []
+        self.counts = []
+        self.seconds = {name: [] for name in PHASES}
+
+    def sampled(self, tick):
+        return tick % self.every == 0
+
+    def record(self, model, phases):
+        """Runs one tick's procedures, timing each of them."""
+        a = model.agents
+        n = a.n
+        infantry = int(np.count_nonzero(a.breed[:n] == INFANTRY))
+        self.ticks.append(model.ticks)
+        self.counts.append((n, infantry, n - infantry, int(np.count_nonzero(a.asleep[:n]))))
+        timed = set()
+        for name, procedure in phases:
+            start = time.perf_counter()
+            procedure()
+            self.seconds[name].append(time.perf_counter() - start)
+            timed.add(name)
+        for name in PHASES:
+            if name not in timed:
+                self.seconds[name].append(0.0)
+
+    def frame(self):
+        """One row per sampled tick: the tick, agent counts and seconds spent in each procedure."""
+        frame = pd.DataFrame(self.counts, columns=['agents', 'infantry', 'trucks', 'parked'])
+        frame.insert(0, 'tick', self.ticks)
+        for name in PHASES:
+            frame[name] = self.seconds[name]
+        frame['tick-total'] = frame[PHASES].sum(axis=1)
+        return frame
+
+    def summary(self, total_ticks=None):
+        """Cumulative and per-tick time of each procedure.
+
+        Args:
+            total_ticks: Ticks of the whole run; when given, `estimated_s`
+                scales the sampled time up to the run.
+
+        Returns:
+            pandas.DataFrame: One row per procedure with the sampled seconds,
+            share of the tick, mean and 95th percentile microseconds per tick.
+        """
+        frame = self.frame()
+        rows = []
+        for name in PHASES:
+            seconds = frame[name]
+            rows.append({'phase': name, 'sampled_s': seconds.sum(),
+                         'share': seconds.sum() / max(frame['tick-total'].sum(), 1e-12),
+                         'mean_us': seconds.mean() * 1e6, 'p95_us': seconds.quantile(0.95) * 1e6})
+        summary = pd.DataFrame(rows).set_index('phase')
+        if total_ticks is not None:
+            summary['estimated_s'] = summary['mean_us'] * 1e-6 * total_ticks
+        return summary
+
+    def by_congestion(self, bins=4):
+        """Mean microseconds per tick of each procedure, with the sampled ticks binned by agent count.
+
+        Shows how the split moves as the roads clog.
+        """
+        frame = self.frame()
+        # Equal-sized bins of the sampled ticks, ordered by agent count
+        order = frame['agents'].rank(method='first')
+        frame['bin'] = pd.qcut(order, min(bins, len(frame)), labels=False) if len(frame) > 1 else 0
+        grouped = frame.groupby('bin')
+        table = grouped[PHASES + ['tick-total']].mean() * 1e6
+        table.insert(0, 'ticks', grouped.size())
+        table.index = [f"{lo}-{hi}" for lo, hi in zip(grouped['agents'].min(), grouped['agents'].max())]
+        table.index.name = 'agents'
+        return table
+
+    def folded(self, bins=4):
+        """Flame-graph input in the folded-stack format (flamegraph.pl, speedscope).
+
+        Each line is `go;<agent-count bin>;<procedure> <microseconds>`, so the graph
+        shows the split of the tick under each level of congestion.
+        """
+        table = self.by_congestion(bins)
+        lines = []
+        for interval, row in table.iterrows():
+            for name in PHASES:
+                total = row[name] * row['ticks']
+                if total >= 1:
+                    lines.append(f"go;{interval} agents;{name} {int(round(total))}")
+        return '\n'.join(lines) + '\n'
+
+
+def profile_run(params=None, seed=0, every=1, max_ticks=None):
+    """Runs one model with a PhaseProfiler attached.
+
+    Returns:
+        tuple: (profiler, metrics, wall-clock seconds of the run)
+    """
+    model = IrpinModel(params, seed)
+    model.profiler = PhaseProfiler(every)
+    start = time.perf_counter()
+    metrics = model.run(max_ticks=max_ticks)
+    return model.profiler, metrics, time.perf_counter() - start
+
+
+def main():
+    """Profiles one run of the Python port and reports where its ticks spend their time."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--site-selection-mode', default="13 Shortest Bridges")
+    parser.add_argument('--spacing-mode', choices=['Uniform', 'Waves'], default="Uniform")
+    parser.add_argument('--wave-pause', type=int, default=None)
+    parser.add_argument('--wave-duration', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=None)
+    parser.add_argument('--every', type=int, default=1, help="Sample one tick in this many")
+    parser.add_argument('--bins', type=int, default=4, help="Agent-count bins of the congestion table")
+    parser.add_argument('--folded', default=None, help="Write folded stacks for a flame graph to this file")
+    parser.add_argument('--ticks-csv', default=None, help="Write the per-tick samples to this CSV")
+    args = parser.parse_args()
+
+    params = {'site-selection-mode': args.site_selection_mode, 'spacing-mode': args.spacing_mode}
+    for name, value in (('wave-pause', args.wave_pause), ('wave-duration', args.wave_duration)):
+        if value is not None:
+            params[name] = value
+    profiler, metrics, seconds = profile_run(params, args.seed, args.every, args.max_ticks)
+
+    print(f"{metrics['[step]']} ticks in {seconds:.2f} s ({metrics['battle-outcome']}), "
+          f"{len(profiler.ticks)} sampled")
+    with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200,
+                           'display.max_columns', None):
+        print(profiler.summary(metrics['[step]']))
+        print("\nMean microseconds per tick by agent count:")
+        print(profiler.by_congestion(args.bins))
+    if args.folded:
+        with open(args.folded, 'w') as f:
+            f.write(profiler.folded(args.bins))
+    if args.ticks_csv:
+        profiler.frame().to_csv(args.ticks_csv, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,461 @@
+import os
+import time
+import sqlite3
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from run_data import (COLUMN_NAME_MAPPING, DEFAULT_RUN_FILES, NO_ARTILLERY_RUN_FILE, SCRIPT_DIR, TOTAL_METRICS,
+                      standardize_runs)
+
+
+DEFAULT_STORE_FILE = os.path.join(SCRIPT_DIR, ".results.sqlite")
+
+# Run parameters with their own (indexed) column: internal name -> SQL type
+PARAMETER_COLUMNS = {
+    'site_selection_mode': 'TEXT',
+    'custom_site_ids': 'TEXT',
+    'spacing_mode': 'TEXT',
+    'wave_pause': 'INTEGER',
+    'wave_duration': 'INTEGER',
+    'artillery': 'INTEGER',
+}
+# Metrics every table reports, with their own column
+METRIC_COLUMNS = {
+    'ticks': 'INTEGER',
+    'battle_outcome': 'TEXT',
+    'total_infantry_used': 'REAL',
+    'total_infantry_crossed': 'REAL',
+    'total_infantry_casualties_10': 'REAL',
+    'total_pontoons_used': 'REAL',
+}
+FILTER_COLUMNS = ('site_selection_mode', 'spacing_mode', 'wave_pause', 'wave_duration', 'artillery')
+# Columns runs() always returns, as standardize_runs needs them
+REQUIRED_COLUMNS = ('site_selection_mode', 'custom_site_ids', 'battle_outcome')
+# Per-run values summarized by quantiles, means and box_stats besides TOTAL_METRICS, as SQL expressions
+RUN_VALUES = {
+    'win': "100.0 * (battle_outcome = 'Victory')",
+    'casualty_pct': "100.0 * total_infantry_casualties_10 / total_infantry_used",
+}
+ARTILLERY_COLUMN = 'turn-on-artillery?'
+
+
+def _read_chunks(path, chunk_rows):
+    """Reads a run table like run_data.read_run_table, `chunk_rows` rows at a time."""
+    with open(path, 'r', encoding='utf-8') as f:
+        first_line = f.readline()
+    skiprows = 6 if first_line.startswith('"BehaviorSpace results') else 0
+    return pd.read_csv(path, skiprows=skiprows, chunksize=chunk_rows)
+
+
+def _flag(values):
+    flags = values.astype(str).str.strip().str.lower().isin(['true', '1', 'on']).astype(float)
+    return flags.where(values.notna())
+
+
+def _sql_value(value):
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _sql_column(values):
+    """A column as a list of Python values for sqlite3, with None for missing values."""
+    if values.dtype == bool:
+        return values.astype(int).tolist()
+    if values.dtype.kind in 'iu' or (values.dtype.kind == 'f' and not values.isna().any()):
+        return values.tolist()
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+class ResultsStore:
+    """Run tables ingested into one indexed SQLite database.
+
+    Every run is a row of `runs`, with the parameters the analyses slice by
+    (site-selection-mode, spacing-mode, wave-pause, wave-duration and
+    turn-on-artillery?) and the standard metrics as indexed columns under the
+    internal names of run_data. Any other parameter or metric of a table goes
+    to the `parameters` or `metrics` table, keyed by run and column name. A
+    table is ingested once per version of its file; re-ingesting a changed
+    file replaces its runs.
+    """
+
+    SCHEMA = f"""
+        CREATE TABLE IF NOT EXISTS tables (
+            id INTEGER PRIMARY KEY,
+            path TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            rows INTEGER NOT NULL,
+            ingested REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            table_id INTEGER NOT NULL REFERENCES tables (id) ON DELETE CASCADE,
+            run_number INTEGER,
+            {', '.join(f'{name} {kind}' for name, kind in {**PARAMETER_COLUMNS, **METRIC_COLUMNS}.items())}
+        );
+        CREATE TABLE IF NOT EXISTS parameters (
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            value,
+            PRIMARY KEY (run_id, name)
+        ) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS metrics (
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            name TEXT NOT NULL,
+            value,
+            PRIMARY KEY (run_id, name)
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS runs_table ON runs (table_id);
+        CREATE INDEX IF NOT EXISTS runs_site_selection_mode ON runs (site_selection_mode);
+        CREATE INDEX IF NOT EXISTS runs_spacing_mode ON runs (spacing_mode);
+        CREATE INDEX IF NOT EXISTS runs_artillery ON runs (artillery);
+        CREATE INDEX IF NOT EXISTS runs_wave_duration ON runs (wave_duration);
+        CREATE INDEX IF NOT EXISTS runs_cell ON runs (wave_pause, wave_duration, site_selection_mode);
+    """
+
+    def __init__(self, path=DEFAULT_STORE_FILE):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA foreign_keys = ON")
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.executescript(self.SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def ingest(self, path, replace=False, chunk_rows=200_000):
+        """Loads a BehaviorSpace table (or a plain CSV of runs) into the store.
+
+        Columns left of `[step]` are parameters and the rest metrics; tables
+        without `[step]` count their non-numeric columns (other than the
+        outcome) as parameters.
+
+        Returns:
+            int: Runs ingested, 0 when the file was already ingested unchanged.
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = self._conn.execute("SELECT id, size, mtime FROM tables WHERE path = ?", (path,)).fetchone()
+        if row is not None:
+            if not replace and row[1] == stat.st_size and row[2] == stat.st_mtime:
+                return 0
+            with self._conn:
+                self._conn.execute("DELETE FROM tables WHERE id = ?", (row[0],))
+
+        core = ['run_number'] + list(PARAMETER_COLUMNS) + list(METRIC_COLUMNS)
+        insert_runs = f"INSERT INTO runs (id, table_id, {', '.join(core)}) VALUES ({', '.join('?' * (len(core) + 2))})"
+        count = 0
+        with self._conn:
+            table_id = self._conn.execute(
+                "INSERT INTO tables (path, size, mtime, rows, ingested) VALUES (?, ?, ?, 0, ?)",
+                (path, stat.st_size, stat.st_mtime, time.time())).lastrowid
+            next_id = self._conn.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM runs").fetchone()[0]
+            extra_parameters = extra_metrics = None
+            for chunk in _read_chunks(path, chunk_rows):
+                if extra_parameters is None:
+                    extra_parameters, extra_metrics = self._split_columns(chunk)
+                frame = self._core_frame(chunk)
+                ids = np.arange(next_id, next_id + len(chunk))
+                frame.insert(0, 'table_id', table_id)
+                frame.insert(0, 'id', ids)
+                self._conn.executemany(insert_runs, self._records(frame))
+                for table, columns in (('parameters', extra_parameters), ('metrics', extra_metrics)):
+                    for column in columns:
+                        self._conn.executemany(f"INSERT INTO {table} (run_id, name, value) VALUES (?, ?, ?)",
+                                               zip(ids.tolist(), [column] * len(chunk), _sql_column(chunk[column])))
+                next_id += len(chunk)
+                count += len(chunk)
+            self._conn.execute("UPDATE tables SET rows = ? WHERE id = ?", (count, table_id))
+        self._conn.execute("ANALYZE")
+        return count
+
+    @staticmethod
+    def _split_columns(chunk):
+        """Columns of a table kept in the `parameters` and `metrics` tables (by their original names)."""
+        core = set(PARAMETER_COLUMNS) | set(METRIC_COLUMNS) | {'[run number]', '[step]', ARTILLERY_COLUMN}
+        columns = list(chunk.columns)
+        if '[step]' in columns:
+            parameters = set(columns[:columns.index('[step]')])
+        else:
+            parameters = {c for c in columns if not pd.api.types.is_numeric_dtype(chunk[c])} - {'battle-outcome'}
+        extra = [c for c in columns if c not in core and COLUMN_NAME_MAPPING.get(c) not in core]
+        return [c for c in extra if c in parameters], [c for c in extra if c not in parameters]
+
+    @staticmethod
+    def _core_frame(chunk):
+        df = chunk.rename(columns={k: v for k, v in COLUMN_NAME_MAPPING.items() if k in chunk.columns})
+        frame = pd.DataFrame(index=df.index)
+        frame['run_number'] = df['[run number]'] if '[run number]' in df.columns else None
+        for name in list(PARAMETER_COLUMNS) + list(METRIC_COLUMNS):
+            if name in df.columns:
+                frame[name] = df[name]
+            elif name == 'ticks' and '[step]' in df.columns:
+                frame[name] = df['[step]']
+            elif name == 'artillery' and ARTILLERY_COLUMN in df.columns:
+                frame[name] = _flag(df[ARTILLERY_COLUMN])
+            elif name == 'spacing_mode':
+                # As in run_data.standardize_runs: tables without wave parameters ran Uniform
+                frame[name] = 'Uniform'
+            else:
+                frame[name] = None
+        return frame
+
+    @staticmethod
+    def _records(frame):
+        return zip(*(_sql_column(frame[column]) for column in frame.columns))
+
+    def _where(self, table, filters):
+        clauses, values = [], []
+        if table is not None:
+            clauses.append("table_id = (SELECT id FROM tables WHERE path = ?)")
+            values.append(os.path.abspath(table))
+        for name, value in filters.items():
+            if name not in FILTER_COLUMNS:
+                raise ValueError(f"Cannot filter on {name!r}; indexed columns are {', '.join(FILTER_COLUMNS)}")
+            if value is None:
+                continue
+            if isinstance(value, (list, tuple, set, np.ndarray, pd.Index)):
+                value = [_sql_value(v) for v in value]
+                clauses.append(f"{name} IN ({', '.join('?' * len(value))})")
+                values.extend(value)
+            else:
+                clauses.append(f"{name} = ?")
+                values.append(_sql_value(value))
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), values
+
+    def runs(self, table=None, extra=False, columns=None, **filters):
+        """Runs matching the filters, standardized like run_data.load_runs.
+
+        Args:
+            table: Only runs ingested from this file.
+            extra: Also return the table-specific parameters and metrics (as
+                columns under their original names): True for all of them,
+                or a list of the names wanted.
+            columns: Only these parameter and metric columns (REQUIRED_COLUMNS
+                are always returned).
+            **filters: Values (or lists of values) of the indexed columns
+                site_selection_mode, spacing_mode, wave_pause, wave_duration
+                and artillery.
+        """
+        where, values = self._where(table, filters)
+        if columns is None:
+            columns = ['run_number'] + list(PARAMETER_COLUMNS) + list(METRIC_COLUMNS)
+        else:
+            unknown = [name for name in columns if name not in PARAMETER_COLUMNS and name not in METRIC_COLUMNS]
+            if unknown:
+                raise ValueError(f"Unknown run columns {', '.join(unknown)}")
+            columns = list(REQUIRED_COLUMNS) + [name for name in columns if name not in REQUIRED_COLUMNS]
+        columns = ['id'] + columns
+        cursor = self._conn.execute(f"SELECT {', '.join(columns)} FROM runs{where} ORDER BY id", values)
+        df = pd.DataFrame.from_records(cursor.fetchall(), columns=columns)
+        if extra is not False and len(df):
+            names, name_values = "", []
+            if extra is not True:
+                names = f" AND name IN ({', '.join('?' * len(extra))})"
+                name_values = list(extra)
+            for kind in ('parameters', 'metrics'):
+                long = pd.read_sql_query(f"SELECT run_id, name, value FROM {kind} "
+                                         f"WHERE run_id IN (SELECT id FROM runs{where}){names}", self._conn,
+                                         params=values + name_values)
+                if len(long):
+                    wide = long.pivot(index='run_id', columns='name', values='value')
+                    df = df.join(wide.infer_objects(), on='id')
+        if 'artillery' in df.columns:
+            df['artillery'] = df['artillery'].astype('boolean')
+        return standardize_runs(df.drop(columns='id'))
+
+    def extra_columns(self, table):
+        """Names of the table-specific parameters and metrics of an ingested table (see runs)."""
+        first = "(SELECT MIN(id) FROM runs WHERE table_id = (SELECT id FROM tables WHERE path = ?))"
+        rows = self._conn.execute(f"SELECT name FROM parameters WHERE run_id = {first} "
+                                  f"UNION ALL SELECT name FROM metrics WHERE run_id = {first}",
+                                  [os.path.abspath(table)] * 2).fetchall()
+        return [name for name, in rows]
+
+    def cells(self, by, table=None, **filters):
+        """Per-cell summary computed in SQL, with the columns of run_data.summarize_cells.
+
+        Also reports the cell's mean casualties and crossings, so casualty and
+        crossing rates of a cell can be formed without fetching its runs.
+        """
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = [name for name in by if name not in PARAMETER_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot group by {', '.join(unknown)}")
+        where, values = self._where(table, filters)
+        means = ['total_infantry_used', 'total_pontoons_used', 'ticks', 'total_infantry_casualties_10',
+                 'total_infantry_crossed']
+        query = (f"SELECT {', '.join(by)}, COUNT(*), 100.0 * AVG(battle_outcome = 'Victory'), "
+                 f"{', '.join(f'AVG({m})' for m in means)} FROM runs{where} "
+                 f"GROUP BY {', '.join(by)} ORDER BY {', '.join(by)}")
+        rows = self._conn.execute(query, values).fetchall()
+        return pd.DataFrame.from_records(rows, columns=by + ['runs', 'win_rate'] + means)
+
+    @staticmethod
+    def _group_columns(by):
+        by = [by] if isinstance(by, str) else list(by)
+        unknown = [name for name in by if name not in PARAMETER_COLUMNS and name not in METRIC_COLUMNS]
+        if unknown:
+            raise ValueError(f"Cannot group by {', '.join(unknown)}")
+        return by
+
+    @staticmethod
+    def _value(name):
+        if name in RUN_VALUES:
+            return RUN_VALUES[name]
+        if name in TOTAL_METRICS:
+            return name
+        raise ValueError(f"Unknown run value {name!r}; use one of {', '.join(TOTAL_METRICS + list(RUN_VALUES))}")
+
+    def totals(self, by, table=None, **filters):
+        """Per-cell sufficient statistics computed in SQL, the table run_data.cell_totals computes from runs.
+
+        Cells come in order of their first stored run.
+        """
+        by = self._group_columns(by)
+        metrics = [m for m in TOTAL_METRICS if m not in by]
+        where, values = self._where(table, filters)
+        sums = ', '.join(f"SUM({m}), SUM({m} * {m})" for m in metrics)
+        query = (f"SELECT {', '.join(by)}, COUNT(*), SUM(battle_outcome = 'Victory'), {sums} FROM runs{where} "
+                 f"GROUP BY {', '.join(by)} ORDER BY MIN(id)")
+        columns = by + ['runs', 'victories'] + [column for m in metrics for column in (m, m + '_sq')]
+        return pd.DataFrame.from_records(self._conn.execute(query, values).fetchall(), columns=columns)
+
+    def means(self, names, by, table=None, **filters):
+        """Per-group means of metrics or RUN_VALUES entries, missing values skipped as pandas skips them.
+
+        Groups come in order of their first stored run.
+        """
+        by = self._group_columns(by)
+        where, values = self._where(table, filters)
+        query = (f"SELECT {', '.join(by)}, {', '.join(f'AVG({self._value(name)})' for name in names)} "
+                 f"FROM runs{where} GROUP BY {', '.join(by)} ORDER BY MIN(id)")
+        return pd.DataFrame.from_records(self._conn.execute(query, values).fetchall(), columns=by + list(names))
+
+    def quantiles(self, name, by, qs, table=None, **filters):
+        """Per-group quantiles of a metric or RUN_VALUES entry, interpolated linearly as pandas does.
+
+        SQLite ranks the values within each group, and only the values on
+        either side of each quantile are fetched.
+
+        Returns:
+            pandas.DataFrame: The `by` columns and one column per quantile,
+            groups in order of their first stored run.
+        """
+        by = self._group_columns(by)
+        where, values = self._where(table, filters)
+        value = self._value(name)
+        where += f"{' AND' if where else ' WHERE'} ({value}) IS NOT NULL"
+        groups = ', '.join(by)
+        ranked = (f"SELECT {groups}, x, ROW_NUMBER() OVER (PARTITION BY {groups} ORDER BY x) - 1 AS i, "
+                  f"COUNT(*) OVER (PARTITION BY {groups}) AS n, MIN(id) OVER (PARTITION BY {groups}) AS first "
+                  f"FROM (SELECT id, {groups}, {value} AS x FROM runs{where})")
+        near = " OR ".join("i - CAST(? * (n - 1) AS INTEGER) IN (0, 1)" for _ in qs)
+        rows = self._conn.execute(f"SELECT {groups}, i, n, x FROM ({ranked}) WHERE {near} ORDER BY first, i",
+                                  values + [float(q) for q in qs]).fetchall()
+        frame = pd.DataFrame.from_records(rows, columns=by + ['i', 'n', 'x'])
+        records = []
+        for key, group in frame.groupby(by, sort=False, dropna=False):
+            at = dict(zip(group['i'], group['x']))
+            n = int(group['n'].iloc[0])
+            record = dict(zip(by, key))
+            for q in qs:
+                position = q * (n - 1)
+                low = int(position)
+                fraction = position - low
+                record[q] = at[low] if fraction == 0 else at[low] + (at[low + 1] - at[low]) * fraction
+            records.append(record)
+        return pd.DataFrame.from_records(records, columns=by + list(qs))
+
+    def box_stats(self, name, by, whis=1.5, table=None, **filters):
+        """Per-group box plot statistics, as matplotlib.cbook.boxplot_stats computes them, for Axes.bxp.
+
+        The quartiles come from quantiles and the whiskers from one min/max
+        query per group. Only the distinct values beyond the whiskers are
+        fetched as fliers, which draw the same as every flier.
+
+        Returns:
+            list: One dict per group (label, mean, med, q1, q3, iqr, whislo,
+            whishi, fliers), in order of their first stored run.
+        """
+        by = self._group_columns(by)
+        quartiles = self.quantiles(name, by, [0.25, 0.5, 0.75], table, **filters)
+        means = self.means([name], by, table, **filters).set_index(by)[name]
+        where, values = self._where(table, filters)
+        value = self._value(name)
+        in_group = ' AND '.join(f"{column} IS ?" for column in by)
+        where += f"{' AND' if where else ' WHERE'} {in_group} AND ({value}) IS NOT NULL"
+        stats = []
+        for row in quartiles.itertuples(index=False):
+            key = tuple(row[:len(by)])
+            q1, med, q3 = row[len(by):]
+            iqr = q3 - q1
+            group_values = values + [_sql_value(v) for v in key]
+            low, high = self._conn.execute(
+                f"SELECT MIN(CASE WHEN x >= ? THEN x END), MAX(CASE WHEN x <= ? THEN x END) "
+                f"FROM (SELECT {value} AS x FROM runs{where})",
+                [q1 - whis * iqr, q3 + whis * iqr] + group_values).fetchone()
+            whislo = q1 if low is None or low > q1 else low
+            whishi = q3 if high is None or high < q3 else high
+            fliers = self._conn.execute(f"SELECT DISTINCT x FROM (SELECT {value} AS x FROM runs{where}) "
+                                        f"WHERE x < ? OR x > ? ORDER BY x", group_values + [whislo, whishi]).fetchall()
+            stats.append({'label': key[0] if len(by) == 1 else key, 'mean': means.loc[key[0] if len(by) == 1 else key],
+                          'med': med, 'q1': q1, 'q3': q3, 'iqr': iqr, 'whislo': whislo, 'whishi': whishi,
+                          'fliers': np.array([x for x, in fliers])})
+        return stats
+
+    def count(self, table=None, **filters):
+        where, values = self._where(table, filters)
+        return self._conn.execute(f"SELECT COUNT(*) FROM runs{where}", values).fetchone()[0]
+
+    def tables(self):
+        """Ingested tables with their run counts."""
+        return pd.read_sql_query("SELECT path, rows, ingested FROM tables ORDER BY id", self._conn)
+
+
+def main():
+    """Ingests run tables into the results store and slices runs or cells out of it."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('tables', nargs='*',
+                        help="Run tables to ingest (defaults to the Waves, Uniform and No Artillery data)")
+    parser.add_argument('--store', default=DEFAULT_STORE_FILE)
+    parser.add_argument('--replace', action='store_true', help="Re-ingest tables even when unchanged")
+    parser.add_argument('--site-selection-mode', nargs='+', default=None)
+    parser.add_argument('--spacing-mode', nargs='+', default=None)
+    parser.add_argument('--wave-pause', type=int, nargs='+', default=None)
+    parser.add_argument('--wave-duration', type=int, nargs='+', default=None)
+    parser.add_argument('--artillery', choices=['on', 'off'], default=None)
+    parser.add_argument('--by', nargs='+', default=None, help="Summarize cells of these columns instead of "
+                                                              "listing runs")
+    args = parser.parse_args()
+
+    with ResultsStore(args.store) as store:
+        for path in args.tables or DEFAULT_RUN_FILES + [NO_ARTILLERY_RUN_FILE]:
+            start = time.perf_counter()
+            count = store.ingest(path, replace=args.replace)
+            if count:
+                print(f"Ingested {count} runs of {path} in {time.perf_counter() - start:.2f} s")
+        filters = {'site_selection_mode': args.site_selection_mode, 'spacing_mode': args.spacing_mode,
+                   'wave_pause': args.wave_pause, 'wave_duration': args.wave_duration,
+                   'artillery': None if args.artillery is None else args.artillery == 'on'}
+        start = time.perf_counter()
+        result = store.cells(args.by, **filters) if args.by else store.runs(**filters)
+        seconds = time.perf_counter() - start
+        with pd.option_context('display.width', 200, 'display.max_columns', None):
+            print(result)
+        print(f"{len(result)} rows of {store.count()} stored runs in {seconds * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
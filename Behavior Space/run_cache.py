@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+
+
+DEFAULT_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".run_cache.sqlite")
+
+
+def model_file_hash(model_file):
+    """Returns the SHA-256 digest of a model file.
+
+    The digest is part of every cache key, so editing IrpinModel.nlogo
+    automatically stops older results from being served.
+    """
+    digest = hashlib.sha256()
+    with open(model_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RunCache:
+    """Persistent cache of simulation results.
+
+    Each entry is keyed by (model version, full parameter set, seed) and
+    stores the metrics of one run, tagged with the kind of backend that
+    produced it so that invalidating one backend's stale versions leaves
+    the others' runs alone. Entries are evicted least-recently-used first
+    once the cache grows past `max_bytes`.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            key TEXT PRIMARY KEY,
+            model_hash TEXT NOT NULL,
+            params TEXT NOT NULL,
+            seed INTEGER NOT NULL,
+            result TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created REAL NOT NULL,
+            last_access REAL NOT NULL,
+            backend TEXT
+        );
+        CREATE INDEX IF NOT EXISTS runs_model_hash ON runs (model_hash);
+        CREATE INDEX IF NOT EXISTS runs_last_access ON runs (last_access);
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_FILE, max_bytes=512 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(self.SCHEMA)
+        # Caches written before entries were tagged: their untagged runs are only removed by invalidate(None)
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(runs)")]
+        if 'backend' not in columns:
+            self._conn.execute("ALTER TABLE runs ADD COLUMN backend TEXT")
+            self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def canonical_params(params):
+        """Serializes a parameter dictionary independently of key order."""
+        return json.dumps(params, sort_keys=True, separators=(',', ':'))
+
+    @classmethod
+    def make_key(cls, model_hash, params, seed):
+        payload = f"{model_hash}|{cls.canonical_params(params)}|{int(seed)}"
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, model_hash, params, seed):
+        """Returns the cached metrics of one run, or None on a miss."""
+        return self.get_many(model_hash, [(params, seed)])[0]
+
+    def get_many(self, model_hash, jobs):
+        """Looks up several (params, seed) jobs at once.
+
+        Returns:
+            A list aligned with `jobs` holding metric dictionaries or None.
+        """
+        keys = [self.make_key(model_hash, params, seed) for params, seed in jobs]
+        found = {}
+        # SQLite limits the number of bound variables per statement
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            marks = ','.join('?' * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT key, result FROM runs WHERE key IN ({marks})", chunk).fetchall()
+            found.update((key, json.loads(result)) for key, result in rows)
+
+        if found:
+            now = time.time()
+            self._conn.executemany("UPDATE runs SET last_access = ? WHERE key = ?",
+                                   [(now, key) for key in found])
+            self._conn.commit()
+
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return [found.get(key) for key in keys]
+
+    def put(self, model_hash, params, seed, result, backend=None):
+        self.put_many(model_hash, [(params, seed, result)], backend)
+
+    def put_many(self, model_hash, entries, backend=None):
+        """Stores (params, seed, result) entries of one backend kind and evicts if over budget."""
+        now = time.time()
+        rows = []
+        for params, seed, result in entries:
+            params_text = self.canonical_params(params)
+            result_text = json.dumps(result, sort_keys=True)
+            rows.append((self.make_key(model_hash, params, seed), model_hash, params_text,
+                         int(seed), result_text, len(params_text) + len(result_text), now, now, backend))
+        self._conn.executemany("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        self._conn.commit()
+        self.evict()
+
+    def total_bytes(self):
+        return self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM runs").fetchone()[0]
+
+    def evict(self, max_bytes=None):
+        """Drops least-recently-used entries until the cache fits in `max_bytes`.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        limit = self.max_bytes if max_bytes is None else max_bytes
+        excess = self.total_bytes() - limit
+        if excess <= 0:
+            return 0
+
+        removed = []
+        freed = 0
+        for key, size in self._conn.execute("SELECT key, size FROM runs ORDER BY last_access"):
+            removed.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        self._conn.executemany("DELETE FROM runs WHERE key = ?", removed)
+        self._conn.commit()
+        return len(removed)
+
+    def invalidate(self, current_model_hash=None, backend=None):
+        """Removes entries produced by other model versions.
+
+        Args:
+            current_model_hash: Hash of the model file that is still valid.
+                When None, every entry is removed.
+            backend: Only remove the stale entries of this backend kind
+                (see put_many); the other backends' entries are kept.
+
+        Returns:
+            int: Number of entries removed.
+        """
+        if current_model_hash is None:
+            cursor = self._conn.execute("DELETE FROM runs")
+        elif backend is not None:
+            cursor = self._conn.execute("DELETE FROM runs WHERE backend = ? AND model_hash != ?",
+                                        (backend, current_model_hash))
+        else:
+            cursor = self._conn.execute("DELETE FROM runs WHERE model_hash != ?", (current_model_hash,))
+        self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self):
+        """Returns entry count, byte size and hit/miss counters of this session."""
+        count, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM runs").fetchone()
+        versions = self._conn.execute("SELECT COUNT(DISTINCT model_hash) FROM runs").fetchone()[0]
+        return {
+            'entries': count,
+            'bytes': size,
+            'model_versions': versions,
+            'hits': self.hits,
+            'misses': self.misses
+        }
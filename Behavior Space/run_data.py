@@ -0,0 +1,228 @@
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+WAVES_RUN_FILE = os.path.join(SCRIPT_DIR, "Waves - with Artillery", "Waves_Data_Combined_Final.csv")
+UNIFORM_RUN_FILE = os.path.join(SCRIPT_DIR, "Uniform - with Artillery",
+                                "IrpinModel Vary Site-Selection Artillery Active-table.csv")
+NO_ARTILLERY_RUN_FILE = os.path.join(SCRIPT_DIR, "No Artillery",
+                                     "IrpinModel Varying Site-Selection With No Artillery Active-table.csv")
+DEFAULT_RUN_FILES = [WAVES_RUN_FILE, UNIFORM_RUN_FILE]
+
+# Every spelling of the run columns found in the tables -> internal snake_case name
+COLUMN_NAME_MAPPING = {
+    'site-selection-mode': 'site_selection_mode',
+    'custom-site-ids': 'custom_site_ids',
+    'spacing-mode': 'spacing_mode',
+    'wave-pause': 'wave_pause',
+    'wave-duration': 'wave_duration',
+    'battle-outcome': 'battle_outcome',
+    'infantry-casualties': 'total_infantry_casualties_10',
+    'infantry-crossed': 'total_infantry_crossed',
+    'infantry-used': 'total_infantry_used',
+    'pontoons-used': 'total_pontoons_used',
+    'total-infantry-casualties / 10': 'total_infantry_casualties_10',
+    'total-infantry-crossed': 'total_infantry_crossed',
+    'total-infantry-used': 'total_infantry_used',
+    'total-pontoons-used': 'total_pontoons_used',
+}
+# Run metrics summed per cell by cell_totals (and ResultsStore.totals)
+TOTAL_METRICS = ['total_infantry_used', 'total_infantry_crossed', 'total_infantry_casualties_10', 'total_pontoons_used',
+                 'ticks']
+# Per-site outcome columns of the Python backends, e.g. site-strikes-3
+SITE_COLUMN_PATTERN = re.compile(r"^site-(.+)-(\d+)$")
+
+
+def read_run_table(path):
+    """Reads a BehaviorSpace table (skipping its 6-line preamble) or a plain CSV of runs."""
+    with open(path, 'r', encoding='utf-8') as f:
+        first_line = f.readline()
+    skiprows = 6 if first_line.startswith('"BehaviorSpace results') else 0
+    return pd.read_csv(path, skiprows=skiprows)
+
+
+def standardize_runs(df):
+    """Renames run columns to the internal names and adds derived columns.
+
+    Adds `ticks` (from `[step]` when missing), `spacing_mode` (Uniform for
+    tables without wave parameters), `num_sites` (counting `custom_site_ids`
+    for "Custom Sites" runs) and `victory`.
+    """
+    df = df.rename(columns={k: v for k, v in COLUMN_NAME_MAPPING.items() if k in df.columns})
+    if 'ticks' not in df.columns and '[step]' in df.columns:
+        df['ticks'] = df['[step]']
+    if 'spacing_mode' not in df.columns:
+        df['spacing_mode'] = 'Uniform'
+    for column in ('wave_pause', 'wave_duration'):
+        if column not in df.columns:
+            df[column] = float('nan')
+    mode = df['site_selection_mode'].astype(str)
+    custom = mode == 'Custom Sites'
+    num_sites = pd.Series(0, index=df.index)
+    num_sites[~custom] = mode[~custom].str[:2].astype(int)
+    if custom.any():
+        num_sites[custom] = df.loc[custom, 'custom_site_ids'].astype(str).str.split().str.len()
+    df['num_sites'] = num_sites
+    df['victory'] = df['battle_outcome'] == 'Victory'
+    return df
+
+
+def load_runs(paths=None):
+    """Loads and standardizes one or more run tables into a single DataFrame."""
+    paths = DEFAULT_RUN_FILES if paths is None else paths
+    frames = []
+    for path in paths:
+        if not os.path.exists(path):
+            print(f"Run table not found, skipping: {path}")
+            continue
+        frames.append(standardize_runs(read_run_table(path)))
+    if not frames:
+        raise ValueError("No run tables could be loaded")
+    return pd.concat(frames, ignore_index=True)
+
+
+def site_outcomes(runs):
+    """Reshapes the per-site outcome columns of runs into one row per run and site.
+
+    Runs of a Python backend with `site_metrics` carry one column per site
+    metric and site id (see irpin_model.SITE_METRICS), so per-site questions
+    need no re-simulation.
+
+    Returns:
+        pandas.DataFrame: The runs' other columns, `site`, `chosen` (whether
+        the run's site selection includes the site, when it is known) and one
+        column per site metric. `first_bridge_tick` is NaN for sites never bridged.
+    """
+    metrics = {}
+    for column in runs.columns:
+        match = SITE_COLUMN_PATTERN.match(column)
+        if match:
+            metrics.setdefault(match.group(1).replace('-', '_'), {})[int(match.group(2))] = column
+    if not metrics:
+        raise ValueError("The runs have no per-site outcome columns")
+    sites = sorted(next(iter(metrics.values())))
+    run_columns = [column for column in runs.columns if not SITE_COLUMN_PATTERN.match(column)]
+    long = runs.loc[runs.index.repeat(len(sites)), run_columns].reset_index(drop=True)
+    long['site'] = np.tile(sites, len(runs))
+    for name, columns in metrics.items():
+        long[name] = runs[[columns[site] for site in sites]].to_numpy().ravel()
+    if 'first_bridge_tick' in long.columns:
+        long['first_bridge_tick'] = long['first_bridge_tick'].where(long['first_bridge_tick'] >= 0)
+    if 'site_selection_mode' in long.columns:
+        from irpin_model import select_sites
+        custom = long['custom_site_ids'] if 'custom_site_ids' in long.columns else pd.Series("", index=long.index)
+        selections = {key: set(select_sites(*key)) for key in set(zip(long['site_selection_mode'], custom.astype(str)))}
+        long['chosen'] = [site in selections[key] for key, site in
+                          zip(zip(long['site_selection_mode'], custom.astype(str)), long['site'])]
+    return long
+
+
+def summarize_sites(runs, by):
+    """Mean per-site outcomes of the chosen sites of every cell.
+
+    Args:
+        runs: Runs with per-site outcome columns (or site_outcomes output).
+        by: Column (or list of columns) identifying a cell.
+    """
+    long = runs if 'site' in runs.columns else site_outcomes(runs)
+    if 'chosen' in long.columns:
+        long = long[long['chosen']]
+    by = [by] if isinstance(by, str) else list(by)
+    metrics = [name for name in ('first_bridge_tick', 'strikes', 'pontoons_delivered', 'pontoons_built',
+                                 'infantry_crossed') if name in long.columns]
+    grouped = long.groupby(by + ['site'])
+    summary = grouped[metrics].mean()
+    if 'first_bridge_tick' in long.columns:
+        summary.insert(0, 'bridged_share', grouped['first_bridge_tick'].apply(lambda t: t.notna().mean()))
+    summary.insert(0, 'runs', grouped.size())
+    return summary.reset_index()
+
+
+def summarize_cells(runs, by, outcome_col='battle_outcome'):
+    """Per-cell run count, win rate (%) and mean resource use and duration.
+
+    Args:
+        runs: Run-level data with internal column names for the metrics.
+        by: Column (or list of columns) identifying a cell.
+    """
+    grouped = runs.groupby(by)
+    summary = grouped.size().rename('runs').to_frame()
+    summary['win_rate'] = grouped[outcome_col].apply(lambda x: (x == 'Victory').mean() * 100)
+    for column in ('total_infantry_used', 'total_pontoons_used', 'ticks'):
+        if column in runs.columns:
+            summary[column] = grouped[column].mean()
+    return summary.reset_index()
+
+
+def cell_totals(runs, by, outcome_col='battle_outcome'):
+    """Per-cell run and victory counts with the sum and sum of squares of every metric.
+
+    Cells come in order of first appearance. ResultsStore.totals computes
+    the same table in SQL, so charts drawn from totals need no runs.
+
+    Returns:
+        pandas.DataFrame: The `by` columns, runs, victories, then for every
+        column of TOTAL_METRICS in the runs its sum (under its own name) and
+        its sum of squares (`<metric>_sq`).
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    frame = runs[by].copy()
+    frame['runs'] = 1
+    frame['victories'] = (runs[outcome_col] == 'Victory').astype(int)
+    for metric in TOTAL_METRICS:
+        if metric in runs.columns and metric not in by:
+            values = runs[metric].astype(float)
+            frame[metric] = values
+            frame[metric + '_sq'] = values * values
+    return frame.groupby(by, sort=False, dropna=False).sum().reset_index()
+
+
+def summarize_totals(totals, by):
+    """summarize_cells of the runs behind per-cell totals (see cell_totals), cells pooled over the other columns."""
+    means = [column for column in ('total_infantry_used', 'total_pontoons_used', 'ticks') if column in totals.columns]
+    grouped = totals.groupby(by)[['runs', 'victories'] + means].sum()
+    summary = grouped[['runs']].copy()
+    summary['win_rate'] = 100 * grouped['victories'] / grouped['runs']
+    for column in means:
+        summary[column] = grouped[column] / grouped['runs']
+    return summary.reset_index()
+
+
+def score_cells(summary, resource_weight=0.0, scales=None):
+    """Win rate (as a fraction) minus a penalty on infantry and pontoons used.
+
+    Resource use is measured relative to `scales` (infantry, pontoons), by
+    default the median over the given cells, so with a weight of 0.1 using
+    10% more of both resources than the median costs one point of win rate.
+    """
+    if scales is None:
+        scales = (summary['total_infantry_used'].median(), summary['total_pontoons_used'].median())
+    resources = (summary['total_infantry_used'] / scales[0] + summary['total_pontoons_used'] / scales[1]) / 2
+    return summary['win_rate'] / 100 - resource_weight * resources
+
+
+def best_cell(runs, by, resource_weight=0.0, min_runs=1):
+    """Best configuration cell observed in the data.
+
+    Cells are ranked by score_cells; ties go to the cell using fewer
+    infantry, then fewer pontoons.
+
+    Returns:
+        pandas.Series: The summary row of the best cell.
+    """
+    return best_summary_cell(summarize_cells(runs, by), resource_weight, min_runs)
+
+
+def best_summary_cell(summary, resource_weight=0.0, min_runs=1):
+    """best_cell of a cell summary (see summarize_cells and summarize_totals)."""
+    summary = summary[summary['runs'] >= min_runs].copy()
+    if summary.empty:
+        raise ValueError(f"No cell has at least {min_runs} run(s)")
+    summary['score'] = score_cells(summary, resource_weight)
+    ranked = summary.sort_values(['score', 'total_infantry_used', 'total_pontoons_used'],
+                                 ascending=[False, True, True])
+    return ranked.iloc[0]
@@ -0,0 +1,272 @@
+import os
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+from scipy.stats import qmc
+
+from adaptive import OUTCOME_METRIC, CASUALTY_METRIC
+from run_cache import RunCache, DEFAULT_CACHE_FILE
+from sweep import Sweep, make_backend, write_table, SCRIPT_DIR
+
+
+# Constants of initialize-params: name -> (low, high, step). A step of 0 leaves
+# the factor continuous, otherwise values are rounded to low + a multiple of step.
+FACTORS = {
+    'artillery-alpha': (0.02, 0.10, 0),
+    'artillery-beta': (0.01, 0.10, 0),
+    'activity-cooldown-time': (10, 60, 1),
+    # Multiples of coarse_model.COARSE_STEP, so the coarse model can run every point
+    'time-between-drone-checks': (10, 40, 10),
+    'pontoon-module-setup-time': (0.5, 3.0, 0),
+    'num-required-builders-per-site': (9, 36, 1),
+}
+
+# Output name -> how it is read from a sweep table
+OUTPUTS = {
+    'win_rate': lambda table: (table[OUTCOME_METRIC] == 'Victory').astype(float),
+    'casualties': lambda table: table[CASUALTY_METRIC].astype(float),
+    'infantry_crossed': lambda table: table['total-infantry-crossed'].astype(float),
+    'ticks': lambda table: table['[step]'].astype(float),
+}
+
+
+def scale_design(unit, names):
+    """Maps a design in the unit cube to parameter values (see FACTORS).
+
+    Returns:
+        pandas.DataFrame: One row per design point, one column per factor.
+    """
+    columns = {}
+    for j, name in enumerate(names):
+        low, high, step = FACTORS[name]
+        values = low + unit[:, j] * (high - low)
+        if step:
+            values = low + np.round((values - low) / step) * step
+            if float(step).is_integer() and float(low).is_integer():
+                values = values.astype(int)
+        columns[name] = values
+    return pd.DataFrame(columns)
+
+
+def saltelli_design(k, n, seed=0):
+    """Saltelli's design for first-order and total Sobol indices of k factors.
+
+    Rows are the blocks A, B and AB_1..AB_k of n rows each, AB_i being A
+    with column i taken from B. A and B come from one scrambled Sobol
+    sequence, so the design with 2n base samples starts with the one with n.
+
+    Returns:
+        numpy.ndarray: (n * (k + 2), k) points in the unit cube.
+    """
+    if n < 2 or n & (n - 1):
+        raise ValueError(f"The number of base samples must be a power of two, got {n}")
+    base = qmc.Sobol(2 * k, scramble=True, seed=seed).random(n)
+    a, b = base[:, :k], base[:, k:]
+    blocks = [a, b]
+    for i in range(k):
+        ab = a.copy()
+        ab[:, i] = b[:, i]
+        blocks.append(ab)
+    return np.vstack(blocks)
+
+
+def sobol_indices(y, k, resamples=1000, confidence=0.95, seed=0):
+    """First-order (Saltelli 2010) and total (Jansen) indices with bootstrap percentile intervals.
+
+    Args:
+        y: Output of every row of a saltelli_design, in order.
+
+    Returns:
+        pandas.DataFrame: S1, ST and their bounds per factor (rows in factor order).
+    """
+    y = np.asarray(y, dtype=float)
+    n = len(y) // (k + 2)
+    if len(y) != n * (k + 2):
+        raise ValueError(f"Expected a multiple of {k + 2} outputs, got {len(y)}")
+
+    def estimate(rows):
+        fa, fb = y[:n][rows], y[n:2 * n][rows]
+        fab = y[2 * n:].reshape(k, n)[:, rows]
+        variance = np.var(np.concatenate([fa, fb], axis=-1), axis=-1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            first = np.mean(fb * (fab - fa), axis=-1) / variance
+            total = 0.5 * np.mean((fa - fab) ** 2, axis=-1) / variance
+        return first, total
+
+    first, total = estimate(np.arange(n))
+    rows = np.random.default_rng(seed).integers(0, n, size=(resamples, n))
+    boot_first, boot_total = estimate(rows)
+    tail = 100 * (1 - confidence) / 2
+    table = pd.DataFrame({'S1': first, 'ST': total})
+    for name, boot in (('S1', boot_first), ('ST', boot_total)):
+        with warnings.catch_warnings():
+            # A constant output has no variance to split: its indices stay NaN
+            warnings.simplefilter('ignore', RuntimeWarning)
+            low, high = np.nanpercentile(boot, [tail, 100 - tail], axis=1)
+        table[f'{name}_low'], table[f'{name}_high'] = low, high
+    return table[['S1', 'S1_low', 'S1_high', 'ST', 'ST_low', 'ST_high']]
+
+
+def morris_design(k, trajectories, levels=4, seed=0):
+    """Morris one-at-a-time trajectories on a `levels`-level grid.
+
+    Each trajectory starts on the grid and moves every factor once, in a
+    random order, by +-delta with delta = levels / (2 (levels - 1)).
+
+    Returns:
+        tuple: (points of shape (trajectories * (k + 1), k), factor moved at
+        each step (trajectories, k), signed move of each step (trajectories, k))
+    """
+    if levels < 2 or levels % 2:
+        raise ValueError(f"The number of levels must be even, got {levels}")
+    rng = np.random.default_rng(seed)
+    delta = levels / (2 * (levels - 1))
+    grid = np.arange(levels // 2) / (levels - 1)   # starting levels x with x + delta <= 1
+    points = np.empty((trajectories, k + 1, k))
+    moved = np.empty((trajectories, k), dtype=int)
+    steps = np.empty((trajectories, k))
+    for t in range(trajectories):
+        signs = rng.choice([-1.0, 1.0], size=k)
+        x = rng.choice(grid, size=k) + np.where(signs < 0, delta, 0.0)
+        points[t, 0] = x
+        order = rng.permutation(k)
+        for s, j in enumerate(order):
+            x = x.copy()
+            x[j] += signs[j] * delta
+            points[t, s + 1] = x
+        moved[t] = order
+        steps[t] = signs[order] * delta
+    return points.reshape(-1, k), moved, steps
+
+
+def morris_indices(y, moved, steps, resamples=1000, confidence=0.95, seed=0):
+    """Elementary-effect statistics mu, mu* and sigma, with a bootstrap interval on mu*.
+
+    Effects are per unit of the factor's range (the design is in the unit cube).
+
+    Returns:
+        pandas.DataFrame: One row per factor.
+    """
+    trajectories, k = moved.shape
+    y = np.asarray(y, dtype=float).reshape(trajectories, k + 1)
+    effects = np.empty((trajectories, k))
+    np.put_along_axis(effects, moved, np.diff(y, axis=1) / steps, axis=1)
+
+    rows = np.random.default_rng(seed).integers(0, trajectories, size=(resamples, trajectories))
+    boot = np.abs(effects)[rows].mean(axis=1)
+    tail = 100 * (1 - confidence) / 2
+    low, high = np.percentile(boot, [tail, 100 - tail], axis=0)
+    return pd.DataFrame({
+        'mu': effects.mean(axis=0),
+        'mu_star': np.abs(effects).mean(axis=0),
+        'mu_star_low': low,
+        'mu_star_high': high,
+        'sigma': effects.std(axis=0, ddof=1) if trajectories > 1 else np.nan,
+    })
+
+
+def evaluate_design(sweep, design, reps=1, seed_base=0, batch_size=500, point=None):
+    """Runs every design point `reps` times through a sweep, batch by batch.
+
+    Every batch is stored in the sweep's run cache as soon as it finishes,
+    so an interrupted analysis resumes where it stopped when it is started
+    again with the same design (the points and seeds are regenerated
+    identically and only the missing runs are simulated). Points that appear
+    more than once (factors rounded onto the same step) are run once.
+
+    Args:
+        design: DataFrame of factor values (see scale_design).
+        point: Fixed parameters of every run (e.g. site-selection-mode).
+
+    Returns:
+        tuple: (mean of every OUTPUTS column per design row, table of the runs)
+    """
+    points = [dict(point or {}, **row) for row in design.to_dict('records')]
+    keys = [RunCache.canonical_params(p) for p in points]
+    first = {}
+    for i, key in enumerate(keys):
+        first.setdefault(key, i)
+    jobs = [sweep.job(points[i], rep, seed_base) for i in first.values() for rep in range(reps)]
+
+    tables = []
+    batches = max(1, -(-len(jobs) // batch_size))
+    for b in range(batches):
+        print(f"Batch {b + 1}/{batches}:", end=" ")
+        tables.append(sweep.run(jobs[b * batch_size:(b + 1) * batch_size]))
+    table = pd.concat(tables, ignore_index=True)
+    table['[run number]'] = range(1, len(table) + 1)
+
+    means = pd.DataFrame({name: read(table) for name, read in OUTPUTS.items()})
+    means = means.groupby(np.repeat(np.arange(len(first)), reps)).mean()
+    row_of = {key: u for u, key in enumerate(first)}
+    return means.iloc[[row_of[key] for key in keys]].reset_index(drop=True), table
+
+
+def main():
+    """Sobol (Saltelli) or Morris sensitivity analysis of the artillery and logistics constants."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('method', choices=['sobol', 'morris'])
+    parser.add_argument('--factors', nargs='+', choices=list(FACTORS), default=list(FACTORS))
+    parser.add_argument('--base-samples', type=int, default=64, help="Sobol base samples (a power of two)")
+    parser.add_argument('--trajectories', type=int, default=20, help="Morris trajectories")
+    parser.add_argument('--levels', type=int, default=4, help="Morris grid levels")
+    parser.add_argument('--reps', type=int, default=5, help="Repetitions per design point")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the design and the bootstrap")
+    parser.add_argument('--seed-base', type=int, default=0)
+    parser.add_argument('--resamples', type=int, default=1000, help="Bootstrap resamples")
+    parser.add_argument('--confidence', type=float, default=0.95)
+    parser.add_argument('--site-selection-mode', default=None)
+    parser.add_argument('--spacing-mode', choices=['Uniform', 'Waves'], default=None)
+    parser.add_argument('--wave-pause', type=int, default=None)
+    parser.add_argument('--wave-duration', type=int, default=None)
+    parser.add_argument('--batch-size', type=int, default=500, help="Runs per batch (and per cache write)")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    # initialize-params overwrites these constants in NetLogo, so only the Python models can vary them
+    parser.add_argument('--backend', choices=['python', 'python-coarse'], default='python')
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    point = {}
+    for name, value in (('site-selection-mode', args.site_selection_mode), ('spacing-mode', args.spacing_mode),
+                        ('wave-pause', args.wave_pause), ('wave-duration', args.wave_duration)):
+        if value is not None:
+            point[name] = value
+    k = len(args.factors)
+    if args.method == 'sobol':
+        unit = saltelli_design(k, args.base_samples, args.seed)
+    else:
+        unit, moved, steps = morris_design(k, args.trajectories, args.levels, args.seed)
+    design = scale_design(unit, args.factors)
+    print(f"{args.method} design: {len(design)} points x {args.reps} repetitions of {k} factors")
+
+    backend = make_backend(args.backend, threads=args.threads)
+    with RunCache(args.cache) as cache:
+        outputs, table = evaluate_design(Sweep(backend, cache), design, args.reps, args.seed_base,
+                                         args.batch_size, point)
+
+    frames = []
+    for name in OUTPUTS:
+        if args.method == 'sobol':
+            indices = sobol_indices(outputs[name], k, args.resamples, args.confidence, args.seed)
+        else:
+            indices = morris_indices(outputs[name], moved, steps, args.resamples, args.confidence, args.seed)
+        indices.insert(0, 'factor', args.factors)
+        indices.insert(0, 'output', name)
+        frames.append(indices)
+    indices = pd.concat(frames, ignore_index=True)
+    with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200):
+        for name, group in indices.groupby('output', sort=False):
+            print(f"\n{name}:")
+            print(group.drop(columns='output').to_string(index=False))
+
+    base = os.path.join(SCRIPT_DIR, f"IrpinModel Sensitivity ({args.method})")
+    indices.to_csv(base + "-indices.csv", index=False)
+    design.join(outputs).to_csv(base + "-design.csv", index=False)
+    write_table(table, base + "-table.csv", f"Sensitivity ({args.method})")
+    print(f"Indices saved to {base}-indices.csv")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,368 @@
+import os
+import argparse
+import itertools
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from irpin_model import NUM_SITES, CUSTOM_SITES, select_sites, format_site_ids, parse_site_ids
+from run_cache import RunCache, DEFAULT_CACHE_FILE
+from run_data import standardize_runs, SCRIPT_DIR
+from sweep import Sweep, make_backend, write_table
+
+
+# Objective -> (run column, True when larger is better)
+OBJECTIVES = {
+    'win_rate': ('victory', True),
+    'infantry_used': ('total_infantry_used', False),
+    'pontoons_used': ('total_pontoons_used', False),
+}
+PAIRS = list(itertools.combinations(range(NUM_SITES), 2))
+ALL_MASKS = np.arange(1, 1 << NUM_SITES, dtype=np.int64)
+
+
+def subset_mask(site_ids):
+    """Bit mask (bit i set for site i) of a collection of site ids."""
+    mask = 0
+    for site in site_ids:
+        mask |= 1 << int(site)
+    return mask
+
+
+def mask_sites(mask):
+    return [site for site in range(NUM_SITES) if mask >> site & 1]
+
+
+def prefix_masks():
+    """Masks of the 13 "NN Shortest Bridges" selections."""
+    return [subset_mask(select_sites(f"{n:02d} Shortest Bridges")) for n in range(1, NUM_SITES + 1)]
+
+
+def subset_features(masks):
+    """Design matrix of subsets: intercept, one indicator per site and one per pair of sites."""
+    masks = np.asarray(masks, dtype=np.int64)
+    x = ((masks[:, None] >> np.arange(NUM_SITES)) & 1).astype(float)
+    pairs = np.array(PAIRS)
+    return np.column_stack([np.ones(len(masks)), x, x[:, pairs[:, 0]] * x[:, pairs[:, 1]]])
+
+
+class SubsetModel:
+    """Bayesian ridge regression of one objective on site and site-pair indicators.
+
+    Every subset's mean is weighted by its precision. Site effects get a
+    prior standard deviation of `prior_std` times the spread of the observed
+    means and pair effects `pair_prior_std` times it, so interactions are
+    only picked up when the data insist. A misfit variance estimated from
+    the residuals is added to the sampling noise so the intervals also cover
+    what the pairwise model cannot express.
+    """
+
+    def __init__(self, prior_std=1.0, pair_prior_std=0.25):
+        self.prior_std = prior_std
+        self.pair_prior_std = pair_prior_std
+
+    def fit(self, masks, means, noise):
+        X = subset_features(masks)
+        y = np.asarray(means, dtype=float)
+        noise = np.asarray(noise, dtype=float)
+        self.offset = float(np.average(y, weights=1 / noise))
+        spread = max(float(np.std(y)), 1e-3)
+        prior_std = np.r_[self.prior_std, np.full(NUM_SITES, self.prior_std),
+                          np.full(len(PAIRS), self.pair_prior_std)] * spread
+        misfit = 0.0
+        for _ in range(2):
+            precision = 1 / (noise + misfit)
+            A = X.T @ (X * precision[:, None]) + np.diag(1 / prior_std ** 2)
+            self.cov = np.linalg.inv(A)
+            self.weights = self.cov @ (X.T @ (precision * (y - self.offset)))
+            residual = y - self.offset - X @ self.weights
+            misfit = max(0.0, float(np.mean(residual ** 2 - noise)))
+        self.misfit = misfit
+        self.weights[0] += self.offset
+        return self
+
+    def predict(self, masks):
+        """Returns (mean, standard deviation) of the expected objective of each subset."""
+        X = subset_features(masks)
+        return X @ self.weights, np.sqrt(np.maximum(((X @ self.cov) * X).sum(axis=1), 0))
+
+
+def subset_sizes(masks):
+    return ((np.asarray(masks, dtype=np.int64)[:, None] >> np.arange(NUM_SITES)) & 1).sum(axis=1)
+
+
+def top_subsets(score, count, threshold=-np.inf, exclude=(), min_sites=1, max_sites=NUM_SITES):
+    """The `count` subsets with the largest finite score of at least `threshold`.
+
+    All 8191 subsets are scored in one vectorized call, which is exact and
+    takes milliseconds (pruning with bounds on the model's uncertainty term
+    is too loose to skip much of so small a space).
+
+    Args:
+        score: Function mapping an array of masks to their scores.
+        exclude: Masks that are not returned (already evaluated).
+
+    Returns:
+        tuple: (list of (score, mask) best first, number of subsets reaching `threshold`)
+    """
+    sizes = subset_sizes(ALL_MASKS)
+    masks = ALL_MASKS[(sizes >= min_sites) & (sizes <= max_sites) & ~np.isin(ALL_MASKS, list(exclude))]
+    scores = np.asarray(score(masks), dtype=float)
+    reaching = np.isfinite(scores) & (scores >= threshold)
+    masks, scores = masks[reaching], scores[reaching]
+    order = np.lexsort((masks, -scores))[:count]
+    return [(float(scores[i]), int(masks[i])) for i in order], len(masks)
+
+
+class SiteSubsetSearch:
+    """Search over arbitrary crossing-site subsets ("Custom Sites") with pruning.
+
+    1. Screening: every single site, every "NN Shortest Bridges" prefix and
+       random subsets are run `screen_reps` times.
+    2. Each round fits a SubsetModel per objective, scores every unscreened
+       subset by its upper confidence bound (top_subsets) and screens the
+       best ones whose bound reaches the lower bound of the best screened
+       subset. Their runs go through the sweep backend as one batch, so
+       they execute in parallel. The search stops when no unscreened subset
+       can beat the incumbent or the round budget ends.
+    3. Racing: screened subsets whose upper bound still reaches the best
+       lower bound get more repetitions (doubling up to `max_reps`) and are
+       dropped as soon as their bound falls behind. Racing also ends once
+       the remaining contenders are within `tolerance` of each other (a
+       fraction of win rate, or of the median resource use).
+
+    For the resource objectives only subsets with a win rate of at least
+    `min_win_rate` count, since the cheapest subsets usually lose.
+    """
+
+    def __init__(self, sweep, base_point=None, screen_reps=4, max_reps=64, batch_size=8, n_random=16,
+                 confidence=0.95, tolerance=0.05, min_win_rate=0.5, min_sites=1, max_sites=NUM_SITES,
+                 seed_base=0, seed=0):
+        self.sweep = sweep
+        self.base_point = dict(base_point or {})
+        self.screen_reps = screen_reps
+        self.max_reps = max_reps
+        self.batch_size = batch_size
+        self.n_random = n_random
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.tolerance = tolerance
+        self.min_win_rate = min_win_rate
+        self.min_sites = min_sites
+        self.max_sites = max_sites
+        self.seed_base = seed_base
+        self.rng = np.random.default_rng(seed)
+        self.runs = pd.DataFrame()
+        self.tables = []
+        self.log = []
+
+    def _point(self, mask):
+        point = dict(self.base_point)
+        point['site-selection-mode'] = CUSTOM_SITES
+        point['custom-site-ids'] = format_site_ids(mask_sites(mask))
+        return point
+
+    def evaluate(self, masks, reps):
+        """Brings every subset up to `reps` repetitions (earlier ones come from the data or the cache)."""
+        have = self.cells()['runs'].to_dict() if not self.runs.empty else {}
+        jobs = [self.sweep.job(self._point(mask), rep, self.seed_base)
+                for mask in masks for rep in range(int(have.get(mask, 0)), reps)]
+        if not jobs:
+            return
+        table = self.sweep.run(jobs)
+        self.tables.append(table)
+        runs = standardize_runs(table)
+        runs['mask'] = [subset_mask(parse_site_ids(ids)) for ids in runs['custom_site_ids']]
+        self.runs = pd.concat([self.runs, runs], ignore_index=True)
+
+    def cells(self):
+        """Per-subset run count, mean and variance of every objective column."""
+        columns = [column for column, _ in OBJECTIVES.values()]
+        grouped = self.runs[columns].astype(float).groupby(self.runs['mask'])
+        cells = grouped.size().rename('runs').to_frame()
+        for name, (column, _) in OBJECTIVES.items():
+            cells[name] = grouped[column].mean()
+            cells[name + '_var'] = grouped[column].var(ddof=1)
+        return cells
+
+    def _signed(self, cells, name):
+        """Objective oriented so that larger is better, with the sampling variance of its mean."""
+        sign = 1.0 if OBJECTIVES[name][1] else -1.0
+        n = cells['runs'].to_numpy(dtype=float)
+        mean = sign * cells[name].to_numpy(dtype=float)
+        if name == 'win_rate':
+            smoothed = (cells[name].to_numpy() * n + 1) / (n + 2)
+            var = smoothed * (1 - smoothed)
+        else:
+            var = cells[name + '_var'].to_numpy(dtype=float)
+            var = np.where(np.isfinite(var), var, np.nanmedian(var) if np.isfinite(var).any() else 1.0)
+        return mean, np.maximum(var, 1e-9) / n
+
+    def _bounds(self, cells, name):
+        mean, noise = self._signed(cells, name)
+        half = self.z * np.sqrt(noise)
+        if name == 'win_rate':
+            return np.clip(mean - half, 0, 1), np.clip(mean + half, 0, 1)
+        return mean - half, mean + half
+
+    def _eligible(self, cells, name):
+        if name == 'win_rate':
+            return np.ones(len(cells), dtype=bool)
+        return cells['win_rate'].to_numpy() >= self.min_win_rate
+
+    def _model(self, cells, name):
+        mean, noise = self._signed(cells, name)
+        return SubsetModel().fit(cells.index.to_numpy(), mean, noise)
+
+    def search(self, objective='win_rate', rounds=10):
+        """Runs screening, model-guided rounds and racing for one objective.
+
+        Returns:
+            pandas.Series: Summary row of the best subset found.
+        """
+        if self.runs.empty:
+            masks = set(1 << s for s in range(NUM_SITES)) | set(prefix_masks())
+            target = len(masks) + self.n_random
+            while len(masks) < target:
+                size = int(self.rng.integers(self.min_sites, self.max_sites + 1))
+                masks.add(subset_mask(self.rng.choice(NUM_SITES, size=size, replace=False)))
+            masks = [m for m in masks if self.min_sites <= bin(m).count('1') <= self.max_sites]
+            print(f"Screening {len(masks)} subsets x {self.screen_reps} reps.")
+            self.evaluate(sorted(masks), self.screen_reps)
+
+        for round_number in range(1, rounds + 1):
+            cells = self.cells()
+            lower, _ = self._bounds(cells, objective)
+            eligible = self._eligible(cells, objective)
+            incumbent = float(lower[eligible].max()) if eligible.any() else -np.inf
+            model = self._model(cells, objective)
+            win_model = self._model(cells, 'win_rate') if not eligible.all() or objective != 'win_rate' else None
+
+            def ucb(masks):
+                m, s = model.predict(masks)
+                score = m + self.z * s
+                if win_model is not None:
+                    # Subsets that cannot plausibly reach min_win_rate are not proposed
+                    win, win_std = win_model.predict(masks)
+                    score = np.where(win + self.z * win_std >= self.min_win_rate, score, -np.inf)
+                return score
+
+            found, candidates = top_subsets(ucb, self.batch_size, incumbent, cells.index,
+                                            self.min_sites, self.max_sites)
+            self.log.append({'objective': objective, 'round': round_number, 'screened': len(cells),
+                             'incumbent_lower_bound': incumbent, 'candidates': candidates,
+                             'proposed': len(found)})
+            if not found:
+                print(f"Round {round_number}: no unscreened subset can beat the incumbent; stopping.")
+                break
+            print(f"Round {round_number}: {candidates} unscreened subsets can beat the incumbent, "
+                  f"screening {len(found)} (best upper bound {found[0][0]:.3f}, "
+                  f"incumbent lower bound {incumbent:.3f}).")
+            self.evaluate([mask for _, mask in found], self.screen_reps)
+
+        reps = self.screen_reps
+        while reps < self.max_reps:
+            cells = self.cells()
+            lower, upper = self._bounds(cells, objective)
+            eligible = self._eligible(cells, objective)
+            if not eligible.any():
+                break
+            best_lower = lower[eligible].max()
+            contending = eligible & (upper >= best_lower)
+            scale = 1.0 if objective == 'win_rate' else float(np.median(np.abs(cells[objective])))
+            contenders = cells.index[contending].tolist()
+            if len(contenders) <= 1 or upper[contending].max() - best_lower <= self.tolerance * scale:
+                break
+            reps = min(2 * reps, self.max_reps)
+            print(f"Racing {len(contenders)} subsets at {reps} reps.")
+            self.evaluate(contenders, reps)
+        return self.best(objective)
+
+    def summary(self):
+        """Every evaluated subset with its means and confidence bounds."""
+        cells = self.cells()
+        table = pd.DataFrame({'sites': [format_site_ids(mask_sites(m)) for m in cells.index],
+                              'num_sites': [bin(m).count('1') for m in cells.index],
+                              'runs': cells['runs'].to_numpy()}, index=cells.index)
+        for name, (_, larger_is_better) in OBJECTIVES.items():
+            lower, upper = self._bounds(cells, name)
+            table[name] = cells[name]
+            table[name + '_low'] = lower if larger_is_better else -upper
+            table[name + '_high'] = upper if larger_is_better else -lower
+        return table.reset_index()
+
+    def best(self, objective='win_rate', min_runs=None):
+        """Best evaluated subset for an objective, ranked by its lower confidence bound.
+
+        Returns:
+            pandas.Series: Summary row of the subset, or None when no subset qualifies.
+        """
+        min_runs = self.screen_reps if min_runs is None else min_runs
+        cells = self.cells()
+        keep = (cells['runs'].to_numpy() >= min_runs) & self._eligible(cells, objective)
+        if not keep.any():
+            return None
+        lower, _ = self._bounds(cells[keep], objective)
+        return self.summary()[keep].iloc[int(np.argmax(lower))]
+
+    def results(self):
+        """Every run simulated by the search as one DataFrame."""
+        if not self.tables:
+            return pd.DataFrame()
+        df = pd.concat(self.tables, ignore_index=True)
+        df['[run number]'] = range(1, len(df) + 1)
+        return df
+
+
+def main():
+    """Searches arbitrary crossing-site subsets for the best win rate, infantry use and pontoon use."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--objectives', nargs='+', choices=list(OBJECTIVES), default=list(OBJECTIVES))
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--batch-size', type=int, default=8, help="Subsets screened per round")
+    parser.add_argument('--screen-reps', type=int, default=4)
+    parser.add_argument('--max-reps', type=int, default=64)
+    parser.add_argument('--min-win-rate', type=float, default=0.5,
+                        help="Win rate a subset needs to count for the resource objectives")
+    parser.add_argument('--min-sites', type=int, default=1)
+    parser.add_argument('--max-sites', type=int, default=NUM_SITES)
+    parser.add_argument('--spacing-mode', choices=['Uniform', 'Waves'], default=None)
+    parser.add_argument('--wave-pause', type=int, default=None)
+    parser.add_argument('--wave-duration', type=int, default=None)
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--backend', choices=['netlogo', 'python'], default='netlogo')
+    parser.add_argument('--netlogo-home', default=None)
+    parser.add_argument('--threads', type=int, default=1)
+    args = parser.parse_args()
+
+    base_point = {name: value for name, value in (('spacing-mode', args.spacing_mode),
+                                                  ('wave-pause', args.wave_pause),
+                                                  ('wave-duration', args.wave_duration)) if value is not None}
+    backend = make_backend(args.backend, args.netlogo_home, args.threads)
+    best = {}
+    with RunCache(args.cache) as cache:
+        search = SiteSubsetSearch(Sweep(backend, cache), base_point, args.screen_reps, args.max_reps,
+                                  args.batch_size, min_win_rate=args.min_win_rate, min_sites=args.min_sites,
+                                  max_sites=args.max_sites)
+        for objective in args.objectives:
+            print(f"\nSearching for the best subset by {objective}.")
+            best[objective] = search.search(objective, args.rounds)
+
+    total = len(search.results())
+    print(f"\nSimulated {total} runs over {len(search.cells())} of {2 ** NUM_SITES - 1} subsets.")
+    for objective, row in best.items():
+        if row is None:
+            print(f"Best by {objective}: no subset reached a win rate of {args.min_win_rate:.0%}.")
+            continue
+        print(f"Best by {objective}: sites [{row['sites']}] ({int(row['runs'])} runs, "
+              f"{row[objective]:.3f} in [{row[objective + '_low']:.3f}, {row[objective + '_high']:.3f}])")
+
+    base = os.path.join(SCRIPT_DIR, "IrpinModel Site Subset Search")
+    search.summary().drop(columns='mask').to_csv(base + "-subsets.csv", index=False)
+    pd.DataFrame(search.log).to_csv(base + "-log.csv", index=False)
+    if search.tables:
+        write_table(search.results(), base + "-table.csv", "Site Subset Search")
+
+
+if __name__ == '__main__':
+    main()
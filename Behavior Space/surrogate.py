@@ -0,0 +1,343 @@
+import os
+import time
+import argparse
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from irpin_model import CUSTOM_SITES
+from run_data import load_runs, standardize_runs, SCRIPT_DIR
+
+
+FEATURES = ('num_sites', 'wave_pause', 'wave_duration')
+# Uniform spacing behaves like Waves with no pause, whatever the duration; the
+# duration of Uniform settings is pinned to this value
+UNIFORM_WAVE_DURATION = 200
+
+# Predicted metric -> (run column, transform). Counts are modelled on a log scale.
+TARGETS = {
+    'win_rate': ('victory', 'proportion'),
+    'casualties': ('total_infantry_casualties_10', 'log'),
+    'infantry_used': ('total_infantry_used', 'log'),
+    'pontoons_used': ('total_pontoons_used', 'log'),
+    'ticks': ('ticks', 'log'),
+}
+
+
+def site_selection_mode_name(num_sites):
+    return f"{int(num_sites):02d} Shortest Bridges"
+
+
+def encode_settings(settings):
+    """Feature matrix (num_sites, wave_pause, wave_duration) of a table of settings.
+
+    Settings need `site_selection_mode` (or `num_sites`) and, for Waves,
+    `wave_pause` and `wave_duration`; `spacing_mode` defaults to Waves.
+    Only the "NN Shortest Bridges" modes are encoded: a site count does not
+    identify a "Custom Sites" subset, so those settings raise ValueError
+    (see shortest_bridges_runs).
+    """
+    df = pd.DataFrame(settings).reset_index(drop=True)
+    if 'site_selection_mode' in df.columns and (df['site_selection_mode'] == CUSTOM_SITES).any():
+        raise ValueError(f"The surrogate does not model \"{CUSTOM_SITES}\" settings; "
+                         "drop them first (see shortest_bridges_runs)")
+    if 'num_sites' in df.columns:
+        num_sites = df['num_sites'].astype(float)
+    else:
+        num_sites = df['site_selection_mode'].astype(str).str[:2].astype(float)
+    if 'spacing_mode' in df.columns:
+        uniform = (df['spacing_mode'] == 'Uniform').to_numpy()
+    else:
+        uniform = np.zeros(len(df), dtype=bool)
+    pause = np.where(uniform, 0.0, df.get('wave_pause', pd.Series(np.nan, index=df.index)).astype(float))
+    duration = np.where(uniform, float(UNIFORM_WAVE_DURATION),
+                        df.get('wave_duration', pd.Series(np.nan, index=df.index)).astype(float))
+    return np.column_stack([num_sites.to_numpy(), pause, duration])
+
+
+def shortest_bridges_runs(runs):
+    """The runs of the "NN Shortest Bridges" modes, the ones the surrogate models (drops "Custom Sites" runs)."""
+    if 'site_selection_mode' not in runs.columns:
+        return runs
+    return runs[runs['site_selection_mode'] != CUSTOM_SITES]
+
+
+def aggregate_cells(runs):
+    """Groups standardized runs into configuration cells.
+
+    Returns:
+        DataFrame: One row per cell with the features, the run count `n` and,
+        for every target column, its mean and variance.
+    """
+    features = pd.DataFrame(encode_settings(runs), columns=FEATURES)
+    columns = sorted({column for column, _ in TARGETS.values()})
+    values = runs[columns].astype(float).reset_index(drop=True)
+    table = pd.concat([features, values], axis=1)
+    grouped = table.groupby(list(FEATURES))
+    cells = grouped.size().rename('n').to_frame()
+    for column in columns:
+        cells[column + '_mean'] = grouped[column].mean()
+        cells[column + '_var'] = grouped[column].var(ddof=1)
+    return cells.reset_index()
+
+
+def _sq_distances(A, B):
+    d = (A * A).sum(1)[:, None] + (B * B).sum(1)[None, :] - 2 * A @ B.T
+    return np.maximum(d, 0.0)
+
+
+def _farthest_points(X, count, rng):
+    chosen = [int(rng.integers(len(X)))]
+    distance = ((X - X[chosen[0]]) ** 2).sum(1)
+    while len(chosen) < count:
+        index = int(np.argmax(distance))
+        chosen.append(index)
+        distance = np.minimum(distance, ((X - X[index]) ** 2).sum(1))
+    return X[chosen]
+
+
+class SparseGaussianProcess:
+    """Gaussian-process regression with inducing points (DTC approximation).
+
+    Each training point carries its own noise variance (the variance of a
+    cell mean). The squared-exponential length scale and signal variance are
+    chosen from a grid by marginal likelihood. After fitting, the predictive mean costs O(M) and the
+    variance O(M^2) per point for M inducing points.
+    """
+
+    SIGNAL_SCALES = (0.5, 1.0, 2.0, 4.0)
+
+    def __init__(self, lengthscales=(0.1, 0.2, 0.4, 0.8), max_inducing=400, min_signal=1e-6, seed=0):
+        self.lengthscale_grid = lengthscales
+        self.max_inducing = max_inducing
+        self.min_signal = min_signal
+        self.seed = seed
+
+    def _kernel(self, A, B):
+        return self.signal * np.exp(-0.5 * _sq_distances(A, B) / self.lengthscale ** 2)
+
+    def _solve(self, X, y, noise):
+        # Whitened form: B = I + V V^T with V = L_m^-1 Kmn Lambda^-1/2 stays well conditioned
+        Kmm = self._kernel(self.Z, self.Z) + 1e-6 * self.signal * np.eye(len(self.Z))
+        L_m = np.linalg.cholesky(Kmm)
+        V = np.linalg.solve(L_m, self._kernel(self.Z, X)) / np.sqrt(noise)
+        L_b = np.linalg.cholesky(np.eye(len(self.Z)) + V @ V.T)
+        c = np.linalg.solve(L_b, V @ (y / np.sqrt(noise)))
+        quad = float(y @ (y / noise) - c @ c)
+        logdet = 2 * np.log(np.diag(L_b)).sum() + np.log(noise).sum()
+        log_likelihood = -0.5 * (quad + logdet + len(y) * np.log(2 * np.pi))
+        return log_likelihood, L_m, L_b, c
+
+    def fit(self, X, y, noise):
+        rng = np.random.default_rng(self.seed)
+        self.offset = float(np.mean(y))
+        y = y - self.offset
+        base_signal = max(float(np.var(y)), self.min_signal)
+        noise = np.maximum(noise, 1e-6 * base_signal)
+        self.Z = X if len(X) <= self.max_inducing else _farthest_points(X, self.max_inducing, rng)
+
+        best = None
+        for lengthscale in self.lengthscale_grid:
+            for scale in self.SIGNAL_SCALES:
+                self.lengthscale, self.signal = lengthscale, base_signal * scale
+                solution = self._solve(X, y, noise)
+                if best is None or solution[0] > best[2][0]:
+                    best = (self.lengthscale, self.signal, solution)
+        self.lengthscale, self.signal, (self.log_likelihood, L_m, L_b, c) = best
+
+        # Predictive weights and the matrix P = Kmm^-1 - (Kmm + Kmn Lambda^-1 Knm)^-1 used for variances
+        self.weights = np.linalg.solve(L_m.T, np.linalg.solve(L_b.T, c))
+        L_m_inv = np.linalg.solve(L_m, np.eye(len(self.Z)))
+        W = np.linalg.solve(L_b, L_m_inv)
+        self.P = L_m_inv.T @ L_m_inv - W.T @ W
+        return self
+
+    def predict(self, X):
+        """Returns (mean, variance) of the latent function at X."""
+        Ksm = self._kernel(X, self.Z)
+        mean = Ksm @ self.weights + self.offset
+        variance = self.signal - ((Ksm @ self.P) * Ksm).sum(axis=1)
+        return mean, np.maximum(variance, 1e-12)
+
+
+class BattleSurrogate:
+    """Emulator of the battle metrics over (site-selection mode, spacing, wave-pause, wave-duration).
+
+    Trains one sparse Gaussian process per metric on the cell means of
+    BehaviorSpace or sweep runs, weighting every cell by the precision of its
+    mean, and predicts win rate, casualties, infantry used, pontoons used and
+    ticks with confidence bounds for arbitrary settings.
+    """
+
+    def __init__(self, max_inducing=400, lengthscales=(0.1, 0.2, 0.4, 0.8), confidence=0.95, seed=0):
+        self.max_inducing = max_inducing
+        self.lengthscales = lengthscales
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.seed = seed
+        self.runs = None
+        self.cells = None
+        self.models = {}
+
+    def fit(self, runs):
+        """Trains on standardized runs (see run_data.load_runs), leaving out "Custom Sites" runs.
+
+        Returns:
+            BattleSurrogate: self
+        """
+        self.runs = shortest_bridges_runs(runs).reset_index(drop=True)
+        self.cells = aggregate_cells(self.runs)
+        X = self.cells[list(FEATURES)].to_numpy(dtype=float)
+        self.lower = X.min(axis=0)
+        self.span = np.where(X.max(axis=0) > self.lower, X.max(axis=0) - self.lower, 1.0)
+        X = self._scale(X)
+        n = self.cells['n'].to_numpy(dtype=float)
+
+        for target, (column, transform) in TARGETS.items():
+            mean = self.cells[column + '_mean'].to_numpy(dtype=float)
+            run_var = self.cells[column + '_var'].to_numpy(dtype=float)
+            if transform == 'proportion':
+                # Smoothed proportion keeps the noise positive for 0% and 100% cells
+                smoothed = (mean * n + 1) / (n + 2)
+                y = mean
+                noise = smoothed * (1 - smoothed) / n
+            else:
+                pooled = np.nanmedian(run_var) if np.isfinite(run_var).any() else 1.0
+                run_var = np.where(np.isfinite(run_var), run_var, pooled)
+                y = np.log1p(mean)
+                noise = np.maximum(run_var, 1e-6) / (n * (1 + mean) ** 2)
+            # A win-rate prior standard deviation of at least ~0.2 keeps sparse designs exploratory
+            min_signal = 0.04 if transform == 'proportion' else 1e-6
+            model = SparseGaussianProcess(self.lengthscales, self.max_inducing, min_signal, self.seed)
+            self.models[target] = model.fit(X, y, noise)
+        return self
+
+    def update(self, runs):
+        """Adds newly finished runs (any table layout) and refits."""
+        runs = standardize_runs(runs) if 'victory' not in runs.columns else runs
+        return self.fit(pd.concat([self.runs, runs], ignore_index=True))
+
+    def _scale(self, X):
+        return (X - self.lower) / self.span
+
+    def predict(self, settings, targets=None):
+        """Predicts the metrics of each setting.
+
+        Returns:
+            DataFrame: The settings plus `<target>`, `<target>_low`,
+            `<target>_high` and `<target>_std` (standard deviation on the
+            model scale: proportion for win_rate, log1p for the counts) columns.
+        """
+        settings = pd.DataFrame(settings).reset_index(drop=True)
+        X = self._scale(encode_settings(settings))
+        out = settings.copy()
+        for target in targets or TARGETS:
+            mean, variance = self.models[target].predict(X)
+            std = np.sqrt(variance)
+            low, high = mean - self.z * std, mean + self.z * std
+            if TARGETS[target][1] == 'proportion':
+                mean, low, high = (np.clip(v, 0, 1) for v in (mean, low, high))
+            else:
+                mean, low, high = (np.expm1(v) for v in (mean, low, high))
+            out[target] = mean
+            out[target + '_low'] = low
+            out[target + '_high'] = high
+            out[target + '_std'] = std
+        return out
+
+
+def cross_validate(runs, folds=5, seed=0, **kwargs):
+    """K-fold cross-validation over configuration cells.
+
+    Returns:
+        DataFrame: Per target, the RMSE of the held-out cell means and the
+        fraction of held-out cell means inside the predicted interval
+        (widened by each cell's own sampling noise).
+    """
+    runs = shortest_bridges_runs(runs).reset_index(drop=True)
+    keys = pd.DataFrame(encode_settings(runs), columns=FEATURES).astype(str).agg('|'.join, axis=1)
+    cell_ids = pd.factorize(keys)[0]
+    fold_of_cell = np.random.default_rng(seed).integers(folds, size=cell_ids.max() + 1)
+    fold = fold_of_cell[cell_ids]
+
+    errors = {t: [] for t in TARGETS}
+    covered = {t: [] for t in TARGETS}
+    for k in range(folds):
+        train, test = runs[fold != k], runs[fold == k]
+        if train.empty or test.empty:
+            continue
+        surrogate = BattleSurrogate(seed=seed, **kwargs).fit(train)
+        truth = aggregate_cells(test)
+        settings = truth[list(FEATURES)]
+        predicted = surrogate.predict(settings)
+        n = truth['n'].to_numpy(dtype=float)
+        for target, (column, transform) in TARGETS.items():
+            actual = truth[column + '_mean'].to_numpy(dtype=float)
+            run_var = truth[column + '_var'].fillna(0).to_numpy(dtype=float)
+            errors[target].extend(predicted[target].to_numpy() - actual)
+            # A held-out cell mean is itself noisy, so its own sampling variance widens the interval
+            if transform == 'proportion':
+                residual = actual - predicted[target].to_numpy()
+                sampling_var = actual * (1 - actual) / n
+            else:
+                residual = np.log1p(actual) - np.log1p(predicted[target].to_numpy())
+                sampling_var = run_var / (n * (1 + actual) ** 2)
+            std = np.sqrt(predicted[target + '_std'].to_numpy() ** 2 + sampling_var)
+            covered[target].extend(np.abs(residual) <= surrogate.z * std)
+
+    return pd.DataFrame([{
+        'target': target,
+        'rmse': float(np.sqrt(np.mean(np.square(errors[target])))),
+        'interval_coverage': float(np.mean(covered[target]))
+    } for target in TARGETS])
+
+
+def candidate_settings(num_sites=range(1, 14), pauses=range(0, 151, 5), durations=range(50, 401, 10),
+                       include_uniform=True):
+    """Grid of settings to screen: every Waves combination plus Uniform per mode."""
+    rows = [{'site_selection_mode': site_selection_mode_name(n), 'spacing_mode': 'Waves',
+             'wave_pause': p, 'wave_duration': d}
+            for n in num_sites for p in pauses for d in durations]
+    if include_uniform:
+        rows += [{'site_selection_mode': site_selection_mode_name(n), 'spacing_mode': 'Uniform',
+                  'wave_pause': np.nan, 'wave_duration': np.nan} for n in num_sites]
+    return pd.DataFrame(rows)
+
+
+def main():
+    """Trains the battle-outcome surrogate on existing runs and screens a grid of candidate settings."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('runs', nargs='*', help="Run tables (defaults to the Waves and Uniform data)")
+    parser.add_argument('--folds', type=int, default=5, help="Cross-validation folds (0 to skip)")
+    parser.add_argument('--top', type=int, default=15)
+    parser.add_argument('--out', default=os.path.join(SCRIPT_DIR, "Surrogate_Predictions.csv"))
+    args = parser.parse_args()
+
+    runs = load_runs(args.runs or None)
+    print(f"Loaded {len(runs)} runs.")
+    if args.folds:
+        print("\nCross-validation over held-out cells:")
+        print(cross_validate(runs, args.folds).to_string(index=False))
+
+    start = time.perf_counter()
+    surrogate = BattleSurrogate().fit(runs)
+    print(f"\nTrained on {len(surrogate.cells)} cells in {time.perf_counter() - start:.2f}s.")
+
+    candidates = candidate_settings()
+    start = time.perf_counter()
+    predictions = surrogate.predict(candidates)
+    elapsed = time.perf_counter() - start
+    print(f"Predicted {len(candidates)} settings in {elapsed:.3f}s "
+          f"({1e6 * elapsed / len(candidates):.1f} microseconds per setting).")
+
+    ranked = predictions.sort_values(['win_rate', 'casualties'], ascending=[False, True])
+    columns = ['site_selection_mode', 'spacing_mode', 'wave_pause', 'wave_duration',
+               'win_rate', 'win_rate_low', 'win_rate_high', 'casualties', 'ticks']
+    print(f"\nTop {args.top} predicted settings:")
+    print(ranked[columns].head(args.top).to_string(index=False))
+    predictions.to_csv(args.out, index=False)
+    print(f"Predictions saved to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,514 @@
+import os
+import re
+import csv
+import shutil
+import hashlib
+import argparse
+import itertools
+import subprocess
+import tempfile
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from xml.sax.saxutils import quoteattr, escape
+
+import pandas as pd
+
+import irpin_model
+import coarse_model
+import movement_kernel
+from run_cache import RunCache, DEFAULT_CACHE_FILE, model_file_hash
+from worker_pool import WorkerPool, python_groups, run_python_group, run_coarse
+
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+MODEL_FILE = os.path.join(os.path.dirname(SCRIPT_DIR), "IrpinModel.nlogo")
+SECTION_SEPARATOR = "@#$#@#$#@"
+
+
+def parse_netlogo_value(text):
+    """Converts a NetLogo literal (as written in the model file) to a Python value."""
+    text = text.strip()
+    if len(text) >= 2 and text[0] == '"' and text[-1] == '"':
+        return text[1:-1]
+    if text == 'true':
+        return True
+    if text == 'false':
+        return False
+    try:
+        return int(text)
+    except ValueError:
+        pass
+    try:
+        value = float(text)
+        return int(value) if value.is_integer() else value
+    except ValueError:
+        return text
+
+
+def format_netlogo_value(value):
+    """Converts a Python value to a NetLogo literal."""
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, str):
+        return '"' + value.replace('"', '\\"') + '"'
+    return repr(value)
+
+
+def _model_sections(model_file):
+    with open(model_file, 'r', encoding='utf-8') as f:
+        return f.read().split(SECTION_SEPARATOR)
+
+
+def load_interface_defaults(model_file=MODEL_FILE):
+    """Reads the default value of every interface global (switches, choosers, inputs, sliders).
+
+    Returns:
+        dict: NetLogo variable name -> Python value.
+    """
+    lines = _model_sections(model_file)[1].strip('\n').split('\n')
+    defaults = {}
+    i = 0
+    while i < len(lines):
+        kind = lines[i].strip()
+        if kind == 'SWITCH':
+            # In the file format 0 means the switch is on
+            defaults[lines[i + 6]] = lines[i + 7].strip() == '0'
+        elif kind == 'CHOOSER':
+            choices = [parse_netlogo_value(c) for c in re.findall(r'"[^"]*"|\S+', lines[i + 7])]
+            defaults[lines[i + 6]] = choices[int(lines[i + 8])]
+        elif kind == 'INPUTBOX':
+            value = lines[i + 6]
+            defaults[lines[i + 5]] = parse_netlogo_value(value) if lines[i + 9].strip() == 'Number' else value
+        elif kind == 'SLIDER':
+            defaults[lines[i + 6]] = parse_netlogo_value(lines[i + 9])
+        i += 1
+    return defaults
+
+
+class Experiment:
+    """A BehaviorSpace experiment definition."""
+
+    def __init__(self, name, repetitions=1, metrics=None, values=None, setup='setup', go='go'):
+        self.name = name
+        self.repetitions = repetitions
+        self.metrics = list(metrics or [])
+        self.values = dict(values or {})  # variable -> list of values
+        self.setup = setup
+        self.go = go
+
+    def __repr__(self):
+        return f"Experiment({self.name!r}, {self.num_points()} points x {self.repetitions} reps)"
+
+    def num_points(self):
+        total = 1
+        for values in self.values.values():
+            total *= len(values)
+        return total
+
+    def points(self):
+        """Yields every parameter combination of the experiment as a dictionary."""
+        names = list(self.values.keys())
+        for combo in itertools.product(*(self.values[n] for n in names)):
+            yield dict(zip(names, combo))
+
+
+def load_experiments(model_file=MODEL_FILE):
+    """Parses the BehaviorSpace experiments stored in the model file.
+
+    Returns:
+        dict: Experiment name -> Experiment.
+    """
+    text = next((s for s in _model_sections(model_file) if '<experiments>' in s), None)
+    if text is None:
+        return {}
+
+    experiments = {}
+    for node in ET.fromstring(text.strip()).findall('experiment'):
+        values = {}
+        for value_set in node:
+            variable = value_set.get('variable')
+            if value_set.tag == 'enumeratedValueSet':
+                values[variable] = [parse_netlogo_value(v.get('value')) for v in value_set.findall('value')]
+            elif value_set.tag == 'steppedValueSet':
+                first, step, last = (float(value_set.get(k)) for k in ('first', 'step', 'last'))
+                count = int(round((last - first) / step)) + 1
+                values[variable] = [parse_netlogo_value(repr(first + k * step)) for k in range(count)]
+
+        experiments[node.get('name')] = Experiment(
+            name=node.get('name'),
+            repetitions=int(node.get('repetitions', '1')),
+            metrics=[m.text for m in node.findall('metric')],
+            values=values,
+            setup=(node.findtext('setup') or 'setup').strip(),
+            go=(node.findtext('go') or 'go').strip()
+        )
+    return experiments
+
+
+class NetLogoBackend:
+    """Runs IrpinModel.nlogo through NetLogo's headless BehaviorSpace runner.
+
+    Every group of runs sharing a parameter set becomes one temporary
+    experiment whose setup seeds the RNG from the job's seed, so each
+    (params, seed) pair is reproducible and cacheable.
+    """
+
+    name = "netlogo"
+    DEFAULT_METRICS = [
+        'battle-outcome',
+        'total-infantry-crossed',
+        'total-infantry-casualties / 10',
+        'total-infantry-used',
+        'total-pontoons-used',
+        'ticks'
+    ]
+
+    def __init__(self, model_file=MODEL_FILE, netlogo_home=None, metrics=None, threads=1):
+        self.model_file = model_file
+        self.netlogo_home = netlogo_home or os.environ.get('NETLOGO_HOME')
+        self.metrics = list(metrics or self.DEFAULT_METRICS)
+        self.threads = threads
+        self._version = None
+
+    @property
+    def version(self):
+        if self._version is None:
+            self._version = model_file_hash(self.model_file)
+        return self._version
+
+    @property
+    def cache_kind(self):
+        """Tag of this backend's run cache entries (see RunCache.invalidate)."""
+        return self.name
+
+    def default_params(self):
+        return load_interface_defaults(self.model_file)
+
+    def _headless_command(self):
+        candidates = []
+        if self.netlogo_home:
+            candidates += [os.path.join(self.netlogo_home, 'netlogo-headless.sh'),
+                           os.path.join(self.netlogo_home, 'netlogo-headless.bat')]
+        candidates.append(shutil.which('netlogo-headless.sh'))
+        for candidate in candidates:
+            if candidate and os.path.exists(candidate):
+                return candidate
+        raise FileNotFoundError("NetLogo headless launcher not found; set NETLOGO_HOME or pass netlogo_home.")
+
+    def _experiment_xml(self, name, params, seeds):
+        seed_list = ' '.join(str(int(s)) for s in seeds)
+        lines = [
+            '<experiments>',
+            f'  <experiment name={quoteattr(name)} repetitions="{len(seeds)}" runMetricsEveryStep="false">',
+            f'    <setup>random-seed (item (behaviorspace-run-number - 1) [{seed_list}])\nsetup</setup>',
+            '    <go>go</go>'
+        ]
+        lines += [f'    <metric>{escape(m)}</metric>' for m in self.metrics]
+        for variable, value in params.items():
+            lines.append(f'    <enumeratedValueSet variable={quoteattr(variable)}>')
+            lines.append(f'      <value value={quoteattr(format_netlogo_value(value))}/>')
+            lines.append('    </enumeratedValueSet>')
+        lines += ['  </experiment>', '</experiments>']
+        return '\n'.join(lines)
+
+    def run_many(self, jobs):
+        """Executes (params, seed) jobs and returns their metric dictionaries in order."""
+        command = self._headless_command()
+        groups = {}
+        for index, (params, seed) in enumerate(jobs):
+            groups.setdefault(RunCache.canonical_params(params), []).append(index)
+
+        results = [None] * len(jobs)
+        with tempfile.TemporaryDirectory() as tmp:
+            for group_id, indices in enumerate(groups.values()):
+                params = jobs[indices[0]][0]
+                seeds = [jobs[i][1] for i in indices]
+                name = f"cached-sweep-{group_id}"
+                setup_file = os.path.join(tmp, f"{name}.xml")
+                table_file = os.path.join(tmp, f"{name}-table.csv")
+                with open(setup_file, 'w', encoding='utf-8') as f:
+                    f.write(self._experiment_xml(name, params, seeds))
+
+                print(f"Running {len(seeds)} NetLogo run(s) for {name}...")
+                subprocess.run([command, '--model', self.model_file, '--setup-file', setup_file,
+                                '--experiment', name, '--table', table_file,
+                                '--threads', str(self.threads)], check=True)
+
+                table = pd.read_csv(table_file, skiprows=6)
+                for _, row in table.iterrows():
+                    run_index = int(row['[run number]']) - 1
+                    metrics = {m: _to_python(row[m]) for m in self.metrics}
+                    metrics['[step]'] = _to_python(row['[step]'])
+                    results[indices[run_index]] = metrics
+        return results
+
+    def run(self, params, seed):
+        return self.run_many([(params, seed)])[0]
+
+
+def _to_python(value):
+    return value.item() if hasattr(value, 'item') else value
+
+
+class PythonBackend:
+    """Runs the Python port of the model (irpin_model.py) in-process.
+
+    Waves jobs that differ only in `wave-pause` are run as one prefix-sharing
+    grid: the ticks before the first pause ends are simulated once and forked
+    into one branch per pause. Branches reproduce from-scratch runs exactly,
+    so their results are cached like any other run. With `processes` > 1 the
+    groups are spread over a WorkerPool, whose workers share the host's map.
+    With `site_metrics` every run also reports the per-site outcome columns
+    (irpin_model.SITE_COLUMNS); those runs are cached apart from the others.
+    """
+
+    name = "python"
+
+    def __init__(self, metrics=None, max_ticks=None, processes=1, site_metrics=False):
+        self.metrics = list(metrics or NetLogoBackend.DEFAULT_METRICS)
+        if site_metrics:
+            self.metrics += irpin_model.SITE_COLUMNS
+        self.site_metrics = site_metrics
+        self.max_ticks = max_ticks
+        self.processes = processes
+        self._version = None
+
+    @property
+    def version(self):
+        if self._version is None:
+            digests = [model_file_hash(irpin_model.__file__), model_file_hash(movement_kernel.__file__),
+                       model_file_hash(irpin_model.MAP_FILE)]
+            if self.site_metrics:
+                digests.append('site-metrics')
+            self._version = hashlib.sha256(''.join(digests).encode('utf-8')).hexdigest()
+        return self._version
+
+    @property
+    def cache_kind(self):
+        """Tag of this backend's run cache entries (see RunCache.invalidate)."""
+        return self.name + ('+site-metrics' if self.site_metrics else '')
+
+    def default_params(self):
+        return dict(irpin_model.DEFAULT_PARAMS)
+
+    def _metrics(self, result):
+        metrics = {m: result[m] for m in self.metrics}
+        metrics['[step]'] = result['[step]']
+        return metrics
+
+    def run_many(self, jobs):
+        """Executes (params, seed) jobs and returns their metric dictionaries in order."""
+        groups = python_groups(jobs, self.max_ticks)
+        tasks = [task for _, task in groups]
+        if self.processes > 1 and len(tasks) > 1:
+            with WorkerPool(min(self.processes, len(tasks))) as pool:
+                outputs = list(pool.map(run_python_group, *zip(*tasks)))
+        else:
+            outputs = [run_python_group(*task) for task in tasks]
+
+        results = [None] * len(jobs)
+        for (indices, _), output in zip(groups, outputs):
+            for i in indices:
+                results[i] = self._metrics(output[jobs[i][0].get('wave-pause')])
+        return results
+
+    def run(self, params, seed):
+        return self.run_many([(params, seed)])[0]
+
+
+class CoarseBackend(PythonBackend):
+    """Runs the coarse-fidelity model (coarse_model.py) in-process.
+
+    About two orders of magnitude faster than PythonBackend and meant for
+    screening (see multifidelity.py). The version covers the coarse model,
+    the full model it borrows its rules from and the calibration, so coarse
+    and full-resolution runs never share cache entries.
+    """
+
+    name = "python-coarse"
+
+    def __init__(self, metrics=None, max_ticks=None, processes=1, calibration=None, site_metrics=False):
+        super().__init__(metrics, max_ticks, processes, site_metrics)
+        self.calibration = dict(coarse_model.CALIBRATION)
+        self.calibration.update(calibration or {})
+
+    @property
+    def version(self):
+        if self._version is None:
+            digests = [model_file_hash(coarse_model.__file__), model_file_hash(irpin_model.__file__),
+                       model_file_hash(movement_kernel.__file__),
+                       model_file_hash(irpin_model.MAP_FILE), RunCache.canonical_params(self.calibration)]
+            if self.site_metrics:
+                digests.append('site-metrics')
+            self._version = hashlib.sha256(''.join(digests).encode('utf-8')).hexdigest()
+        return self._version
+
+    def run_many(self, jobs):
+        """Executes (params, seed) jobs and returns their metric dictionaries in order."""
+        tasks = [(params, seed, self.max_ticks, self.calibration) for params, seed in jobs]
+        if self.processes > 1 and len(tasks) > 1:
+            with WorkerPool(min(self.processes, len(tasks)), routes=True) as pool:
+                outputs = list(pool.map(run_coarse, *zip(*tasks), chunksize=64))
+        else:
+            outputs = [run_coarse(*task) for task in tasks]
+        return [self._metrics(output) for output in outputs]
+
+
+def make_backend(name, netlogo_home=None, threads=1, site_metrics=False):
+    """Builds the backend selected on a command line ("netlogo", "python" or "python-coarse")."""
+    if name == 'python':
+        return PythonBackend(processes=threads, site_metrics=site_metrics)
+    if name == 'python-coarse':
+        return CoarseBackend(processes=threads, site_metrics=site_metrics)
+    if site_metrics:
+        raise ValueError("Per-site metrics are only reported by the Python backends")
+    return NetLogoBackend(netlogo_home=netlogo_home, threads=threads)
+
+
+class Sweep:
+    """Runs parameter sweeps through a backend, serving repeated runs from a RunCache.
+
+    Seeds are derived from the repetition index only, so widening a sweep
+    (more values for a variable, more repetitions) reuses every run that
+    was already executed and only the new cells are simulated.
+    """
+
+    def __init__(self, backend, cache=None, base_params=None):
+        self.backend = backend
+        self.cache = cache
+        if base_params is None:
+            base_params = backend.default_params() if hasattr(backend, 'default_params') else {}
+        self.base_params = dict(base_params)
+        self.last_run_info = {}
+
+    def full_params(self, point):
+        params = dict(self.base_params)
+        params.update(point)
+        return params
+
+    def job(self, point, rep, seed_base=0):
+        """Builds the (params, seed) job of one repetition of a point.
+
+        In CRN mode the repetition index also selects `crn-replicate`, so the
+        same repetition of different points shares its random streams.
+        """
+        params = self.full_params(point)
+        if params.get('crn-mode?') and 'crn-replicate' not in point:
+            params['crn-replicate'] = rep + 1
+        return params, seed_base + rep
+
+    def jobs_for(self, points, repetitions=1, seed_base=0):
+        """Builds (params, seed) jobs for every point and repetition."""
+        return [self.job(point, rep, seed_base) for point in points for rep in range(repetitions)]
+
+    def run(self, jobs):
+        """Runs the given jobs, executing only those missing from the cache.
+
+        Returns:
+            DataFrame with one row per job: parameters, seed and metrics.
+        """
+        jobs = [(self.full_params(params), seed) for params, seed in jobs]
+        version = self.backend.version
+
+        if self.cache is not None:
+            results = self.cache.get_many(version, jobs)
+        else:
+            results = [None] * len(jobs)
+
+        missing = [i for i, result in enumerate(results) if result is None]
+        print(f"Sweep: {len(jobs) - len(missing)} cached run(s), {len(missing)} to execute.")
+
+        if missing:
+            executed = self.backend.run_many([jobs[i] for i in missing])
+            for i, result in zip(missing, executed):
+                results[i] = result
+            if self.cache is not None:
+                self.cache.put_many(version, [(jobs[i][0], jobs[i][1], results[i]) for i in missing],
+                                    self.backend.cache_kind)
+
+        self.last_run_info = {'total': len(jobs), 'cached': len(jobs) - len(missing), 'executed': len(missing)}
+
+        rows = []
+        for run_number, ((params, seed), result) in enumerate(zip(jobs, results), 1):
+            row = {'[run number]': run_number}
+            row.update(params)
+            row['seed'] = seed
+            row.update(result)
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def run_experiment(self, experiment, repetitions=None, seed_base=0):
+        """Runs a BehaviorSpace experiment definition."""
+        reps = experiment.repetitions if repetitions is None else repetitions
+        return self.run(self.jobs_for(experiment.points(), reps, seed_base))
+
+
+def write_table_preamble(writer, experiment_name, model_name="IrpinModel.nlogo"):
+    """Writes the six preamble lines of a BehaviorSpace "Table version 2.0" file to a csv writer."""
+    writer.writerow(["BehaviorSpace results (NetLogo 6.4.0)", "Table version 2.0"])
+    writer.writerow([model_name])
+    writer.writerow([experiment_name])
+    now = datetime.now().astimezone()
+    writer.writerow([now.strftime("%m/%d/%Y %H:%M:%S:") + f"{now.microsecond // 1000:03d}" + now.strftime(" %z")])
+    writer.writerow(["min-pxcor", "max-pxcor", "min-pycor", "max-pycor"])
+    writer.writerow(["0", "459", "0", "624"])
+
+
+def write_table(df, path, experiment_name, model_name="IrpinModel.nlogo"):
+    """Writes a sweep result in BehaviorSpace "Table version 2.0" layout."""
+    def cell(value):
+        if isinstance(value, bool):
+            return 'true' if value else 'false'
+        return str(value)
+
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+        write_table_preamble(writer, experiment_name, model_name)
+        writer.writerow(list(df.columns))
+        for row in df.itertuples(index=False):
+            writer.writerow([cell(v) for v in row])
+    print(f"Table saved to {path}")
+
+
+def main():
+    """Runs a BehaviorSpace experiment from IrpinModel.nlogo through the run cache."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('experiment', nargs='?', help="Experiment name as defined in the model file")
+    parser.add_argument('--list', action='store_true', help="List the experiments and exit")
+    parser.add_argument('--repetitions', type=int, default=None)
+    parser.add_argument('--seed-base', type=int, default=0)
+    parser.add_argument('--out', default=None, help="Output table file")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE)
+    parser.add_argument('--max-cache-mb', type=float, default=512)
+    parser.add_argument('--invalidate', action='store_true',
+                        help="Drop this backend's cached runs from previous versions of its model")
+    parser.add_argument('--backend', choices=['netlogo', 'python', 'python-coarse'], default='netlogo')
+    parser.add_argument('--netlogo-home', default=None)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--site-metrics', action='store_true',
+                        help="Add the per-site outcome columns to the table (Python backends)")
+    args = parser.parse_args()
+
+    experiments = load_experiments()
+    if args.list or args.experiment is None:
+        for experiment in experiments.values():
+            print(experiment)
+        return
+    if args.experiment not in experiments:
+        print(f"Unknown experiment '{args.experiment}'. Available: {list(experiments)}")
+        return
+
+    backend = make_backend(args.backend, args.netlogo_home, args.threads, args.site_metrics)
+    with RunCache(args.cache, max_bytes=int(args.max_cache_mb * 1024 * 1024)) as cache:
+        if args.invalidate:
+            print(f"Removed {cache.invalidate(backend.version, backend.cache_kind)} stale cached run(s).")
+        experiment = experiments[args.experiment]
+        df = Sweep(backend, cache).run_experiment(experiment, args.repetitions, args.seed_base)
+        print(f"Cache: {cache.stats()}")
+
+    out = args.out or os.path.join(SCRIPT_DIR, f"IrpinModel {experiment.name}-table.csv")
+    write_table(df, out, experiment.name)
+
+
+if __name__ == '__main__':
+    main()
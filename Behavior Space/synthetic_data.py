@@ -0,0 +1,183 @@
+import csv
+import math
+import argparse
+import itertools
+
+import numpy as np
+import pandas as pd
+
+from run_data import load_runs
+from sweep import load_experiments, parse_netlogo_value, write_table_preamble
+
+
+# Reporter -> run column it is resampled from
+REPORTER_COLUMNS = {
+    'battle-outcome': 'battle_outcome',
+    'total-infantry-crossed': 'total_infantry_crossed',
+    'total-infantry-casualties / 10': 'total_infantry_casualties_10',
+    'total-infantry-used': 'total_infantry_used',
+    'total-pontoons-used': 'total_pontoons_used',
+    'ticks': 'ticks',
+}
+# Run columns a grid point is matched on, most specific first
+MATCH_COLUMNS = [('site-selection-mode', 'site_selection_mode'), ('spacing-mode', 'spacing_mode'),
+                 ('wave-pause', 'wave_pause'), ('wave-duration', 'wave_duration')]
+# Reporters whose recorded values are all multiples of 10
+ROUNDED_TO_TEN = ['total-infantry-crossed', 'total-infantry-casualties / 10', 'total-infantry-used',
+                  'total-pontoons-used']
+
+
+class SyntheticRuns:
+    """Generates BehaviorSpace runs with the distributions of the recorded tables.
+
+    A grid point is matched to the most specific cell of the reference runs
+    (site-selection mode, spacing mode, wave pause, wave duration) holding at
+    least `min_cell_runs` runs, dropping the least significant column until
+    one does. Its synthetic runs are drawn with replacement from that cell,
+    each keeping the outcome and metrics of one recorded run together, so
+    win rates, the bimodal outcome-dependent casualties and ticks, and the
+    correlations between metrics carry over. `jitter` adds multiplicative
+    noise to the numeric metrics to avoid exact duplicates.
+
+    Args:
+        reference: Standardized runs (run_data.load_runs()); the recorded
+            Waves and Uniform tables by default.
+    """
+
+    def __init__(self, reference=None, seed=0, jitter=0.0, min_cell_runs=5):
+        self.reference = load_runs() if reference is None else reference
+        self.rng = np.random.default_rng(seed)
+        self.jitter = jitter
+        self.min_cell_runs = min_cell_runs
+        self.values = {reporter: self.reference[column].to_numpy() if column in self.reference.columns
+                       else np.zeros(len(self.reference))
+                       for reporter, column in REPORTER_COLUMNS.items()}
+        # Reference run indices of every cell, per number of matched columns
+        self._cells = [{(): np.arange(len(self.reference))}]
+        for depth in range(1, len(MATCH_COLUMNS) + 1):
+            columns = [column for _, column in MATCH_COLUMNS[:depth]]
+            groups = self.reference.groupby(columns).indices
+            self._cells.append({key if isinstance(key, tuple) else (key,): rows for key, rows in groups.items()})
+
+    def _cell_rows(self, point):
+        """Indices of the reference runs a grid point is drawn from."""
+        spacing = point.get('spacing-mode', 'Uniform')
+        key = (point.get('site-selection-mode'), spacing)
+        if spacing == 'Waves':
+            key += (point.get('wave-pause'), point.get('wave-duration'))
+        for depth in range(len(key), -1, -1):
+            rows = self._cells[depth].get(key[:depth])
+            if rows is not None and len(rows) >= self.min_cell_runs:
+                return rows
+        return self._cells[0][()]
+
+    def sample(self, point, reps):
+        """Reporter values of `reps` synthetic runs of one grid point, as a dict of arrays."""
+        rows = self._cell_rows(point)
+        picked = rows[self.rng.integers(len(rows), size=reps)]
+        sample = {reporter: values[picked] for reporter, values in self.values.items()}
+        if self.jitter > 0:
+            for reporter in REPORTER_COLUMNS:
+                if reporter == 'battle-outcome':
+                    continue
+                noisy = sample[reporter] * self.rng.lognormal(0, self.jitter, reps)
+                step = 10 if reporter in ROUNDED_TO_TEN else 1
+                sample[reporter] = np.maximum(np.round(noisy / step) * step, 0)
+        return sample
+
+    def write_table(self, path, experiment, rows, values=None, chunk_rows=1_000_000):
+        """Writes a "Table version 2.0" file of about `rows` runs over an experiment's grid.
+
+        Args:
+            experiment: sweep.Experiment whose variables and name the table
+                takes; every table carries the six standard reporters.
+            rows: Number of runs; every grid point gets ceil(rows / points)
+                repetitions, trimmed to exactly `rows`.
+            values: Variable -> values overriding the experiment's grid, to
+                change its shape.
+            chunk_rows: Runs formatted and written at a time, which bounds
+                memory for very large files.
+
+        Returns:
+            int: Number of runs written.
+        """
+        grid = dict(experiment.values)
+        grid.update(values or {})
+        names = list(grid)
+        points = [dict(zip(names, combo)) for combo in itertools.product(*(grid[n] for n in names))]
+        reps = math.ceil(rows / len(points))
+        columns = ['[run number]'] + names + ['[step]'] + list(REPORTER_COLUMNS)
+
+        written = 0
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f, quoting=csv.QUOTE_ALL)
+            write_table_preamble(writer, experiment.name)
+            writer.writerow(columns)
+            point_values = {name: np.array([_cell(point[name]) for point in points], dtype=object)
+                            for name in names}
+            chunk, pending = [], 0
+            for index, point in enumerate(points):
+                count = min(reps, rows - written - pending)
+                if count <= 0:
+                    break
+                chunk.append((index, count, self.sample(point, count)))
+                pending += count
+                if pending >= chunk_rows:
+                    written += self._write_chunk(f, chunk, point_values, written)
+                    chunk, pending = [], 0
+            if chunk:
+                written += self._write_chunk(f, chunk, point_values, written)
+        return written
+
+    @staticmethod
+    def _write_chunk(f, chunk, point_values, first_run):
+        point_ids = np.concatenate([np.full(count, index) for index, count, _ in chunk])
+        frame = pd.DataFrame({'[run number]': np.arange(first_run + 1, first_run + len(point_ids) + 1)})
+        for name, values in point_values.items():
+            frame[name] = values[point_ids]
+        frame['[step]'] = np.concatenate([sample['ticks'] for _, _, sample in chunk]).astype(np.int64)
+        for reporter in REPORTER_COLUMNS:
+            column = np.concatenate([sample[reporter] for _, _, sample in chunk])
+            frame[reporter] = column if reporter == 'battle-outcome' else column.astype(np.int64)
+        frame.to_csv(f, header=False, index=False, quoting=csv.QUOTE_ALL, lineterminator='\n')
+        return len(frame)
+
+
+def _cell(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return value
+
+
+def parse_values(items):
+    """Parses VAR=V1,V2,... overrides of an experiment's grid."""
+    values = {}
+    for item in items or []:
+        name, _, text = item.partition('=')
+        if not text:
+            raise ValueError(f"Expected VAR=V1,V2,... but got {item!r}")
+        values[name] = [parse_netlogo_value(v) for v in text.split(',')]
+    return values
+
+
+def main():
+    """Writes a synthetic BehaviorSpace table of any size, resampling the recorded runs cell by cell."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('experiment', nargs='?', default="Vary Site-Selection Artillery Active Waves")
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--out', required=True, help="Output table file")
+    parser.add_argument('--values', nargs='+', default=None, metavar='VAR=V1,V2,...',
+                        help="Replace the values of an experiment variable (changes the grid shape)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Log-normal sigma of the multiplicative noise on the numeric metrics")
+    args = parser.parse_args()
+
+    experiment = load_experiments()[args.experiment]
+    generator = SyntheticRuns(seed=args.seed, jitter=args.jitter)
+    written = generator.write_table(args.out, experiment, args.rows, parse_values(args.values))
+    print(f"Wrote {written} runs to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
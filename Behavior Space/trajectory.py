@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from irpin_model import DEFAULT_PARAMS, ENTRIES, NUM_SITES, SCRIPT_DIR, SITE_ENTRY, IrpinModel
+
+
+SITE_ENTRIES = np.array([SITE_ENTRY[site] for site in range(NUM_SITES)])
+
+
+def _crossed(model):
+    return model.total_infantry_crossed
+
+
+def _casualties(model):
+    return model.total_infantry_casualties
+
+
+def _active_sites(model):
+    return np.count_nonzero(model.site_table.chosen[model.row] & (model.pontoon_built_count > 0))
+
+
+def _pontoons_built(model):
+    return model.pontoon_built_count
+
+
+def _queues(model):
+    # Parked units of each entry's sites: the stopped columns backing up towards the entries
+    a = model.agents
+    n = a.n
+    return np.bincount(SITE_ENTRIES[a.site[:n][a.asleep[:n]]], minlength=len(ENTRIES))
+
+
+# Series -> (column names, buffer dtype, extractor)
+SERIES = {
+    'crossed': (['crossed'], np.int32, _crossed),
+    'casualties': (['casualties'], np.int32, _casualties),
+    'active_sites': (['active_sites'], np.int8, _active_sites),
+    'pontoons_built': ([f"pontoons_built_{site}" for site in range(NUM_SITES)], np.float32, _pontoons_built),
+    'queues': ([f"queue_{entry[0]}" for entry in ENTRIES], np.int32, _queues),
+}
+
+
+class TrajectoryRecorder:
+    """Records per-tick series of a run into preallocated typed buffers (attach it as `model.recorder`).
+
+    Every `every`-th tick the selected SERIES are written, after the tick's
+    procedures, into one (capacity, width) array per series, so recording
+    allocates nothing while the model runs. When the buffers fill up they
+    either keep the latest `capacity` samples as a ring (`on_full='ring'`)
+    or drop every second sample and double `every` (`on_full='decimate'`),
+    which keeps the whole trajectory at a coarser resolution.
+
+    Args:
+        every: Sampling interval in ticks.
+        series: Names of SERIES to record (all by default).
+        capacity: Samples held; by default enough for a run lasting the
+            loss-battle-duration-threshold at the initial interval.
+    """
+
+    def __init__(self, every=10, series=None, capacity=None, on_full='decimate'):
+        if every < 1:
+            raise ValueError("every must be at least 1")
+        if on_full not in ('ring', 'decimate'):
+            raise ValueError(f"on_full must be 'ring' or 'decimate', not {on_full!r}")
+        self.every = every
+        self.series = list(series or SERIES)
+        unknown = [name for name in self.series if name not in SERIES]
+        if unknown:
+            raise ValueError(f"Unknown series: {', '.join(unknown)}")
+        if capacity is None:
+            capacity = DEFAULT_PARAMS['loss-battle-duration-threshold'] // every + 2
+        self.capacity = capacity
+        self.on_full = on_full
+        self.ticks = np.zeros(capacity, dtype=np.int32)
+        self.buffers = {name: np.zeros((capacity, len(SERIES[name][0])), dtype=SERIES[name][1])
+                        for name in self.series}
+        self._extractors = [(self.buffers[name], SERIES[name][2]) for name in self.series]
+        self.count = 0
+
+    def record(self, model, tick=None):
+        """Writes the current values of the series, labelled with `tick` (the model's tick by default)."""
+        if self.count == self.capacity:
+            if self.on_full == 'decimate':
+                self._decimate()
+        i = self.count % self.capacity
+        self.ticks[i] = model.ticks if tick is None else tick
+        for buffer, extract in self._extractors:
+            buffer[i] = extract(model)
+        self.count += 1
+
+    def finish(self, model):
+        """Records the final state of a run unless its last tick was already sampled."""
+        tick = model.ticks if model.done else model.ticks - 1
+        if tick >= 0 and (self.count == 0 or self._last_tick() != tick):
+            self.record(model, tick)
+
+    def _last_tick(self):
+        return self.ticks[(self.count - 1) % self.capacity]
+
+    def _decimate(self):
+        kept = self.capacity // 2 + self.capacity % 2
+        self.ticks[:kept] = self.ticks[::2]
+        for buffer in self.buffers.values():
+            buffer[:kept] = buffer[::2]
+        self.count = kept
+        self.every *= 2
+
+    def _order(self):
+        """Buffer indices of the held samples, oldest first."""
+        if self.count <= self.capacity:
+            return np.arange(self.count)
+        return np.roll(np.arange(self.capacity), -(self.count % self.capacity))
+
+    def columns(self):
+        """Held samples as a dict of column name -> array, oldest first."""
+        order = self._order()
+        columns = {'tick': self.ticks[order]}
+        for name in self.series:
+            values = self.buffers[name][order]
+            for j, column in enumerate(SERIES[name][0]):
+                columns[column] = values[:, j]
+        return columns
+
+    def frame(self):
+        """One row per sample: the tick and every recorded column."""
+        return pd.DataFrame(self.columns())
+
+    def encode(self):
+        """Delta-encoded series: the ticks and each series' rows as their first value followed by their differences.
+
+        Integer-valued series are stored in the smallest integer type holding
+        their deltas, which for the slowly changing counters is mostly zeros
+        and ones, so they compress to almost nothing.
+        """
+        order = self._order()
+        encoded = {}
+        for name, values in [('tick', self.ticks[order])] + [(name, self.buffers[name][order]) for name in self.series]:
+            deltas = np.diff(values, axis=0, prepend=np.zeros_like(values[:1]))
+            if values.dtype.kind == 'f' and np.array_equal(values, np.round(values)):
+                deltas = deltas.astype(np.int64)
+            if deltas.dtype.kind in 'iu':
+                low, high = (int(deltas.min()), int(deltas.max())) if deltas.size else (0, 0)
+                deltas = deltas.astype(np.promote_types(np.min_scalar_type(low), np.min_scalar_type(high)))
+            encoded[name] = deltas
+        return encoded
+
+    def save(self, path):
+        """Writes the delta-encoded series to a compressed .npz file. Returns its size in bytes."""
+        meta = {'every': self.every, 'series': {name: [SERIES[name][0], np.dtype(SERIES[name][1]).str]
+                                                for name in self.series}}
+        np.savez_compressed(path, _meta=np.frombuffer(json.dumps(meta).encode(), dtype=np.uint8), **self.encode())
+        return os.path.getsize(path if path.endswith('.npz') else path + '.npz')
+
+
+def load_trajectory(path):
+    """Reads a file written by TrajectoryRecorder.save back into a DataFrame like TrajectoryRecorder.frame."""
+    with np.load(path) as data:
+        meta = json.loads(data['_meta'].tobytes().decode())
+        columns = {'tick': np.cumsum(data['tick'], dtype=np.int64).astype(np.int32)}
+        for name, (names, dtype) in meta['series'].items():
+            deltas = data[name]
+            values = np.cumsum(deltas, axis=0, dtype=np.float64 if deltas.dtype.kind == 'f' else np.int64)
+            for j, column in enumerate(names):
+                columns[column] = values[:, j].astype(dtype)
+    return pd.DataFrame(columns)
+
+
+def record_run(params=None, seed=0, every=10, series=None, max_ticks=None):
+    """Runs one model with a TrajectoryRecorder attached.
+
+    Returns:
+        tuple: (recorder, metrics, wall-clock seconds of the run)
+    """
+    model = IrpinModel(params, seed)
+    model.recorder = TrajectoryRecorder(every, series)
+    start = time.perf_counter()
+    metrics = model.run(max_ticks=max_ticks)
+    return model.recorder, metrics, time.perf_counter() - start
+
+
+def main():
+    """Records the trajectory of one run of the Python port and reports its recording overhead and size."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--site-selection-mode', default="13 Shortest Bridges")
+    parser.add_argument('--spacing-mode', choices=['Uniform', 'Waves'], default="Uniform")
+    parser.add_argument('--wave-pause', type=int, default=None)
+    parser.add_argument('--wave-duration', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--max-ticks', type=int, default=None)
+    parser.add_argument('--every', type=int, default=10, help="Record one tick in this many")
+    parser.add_argument('--series', nargs='+', choices=list(SERIES), default=None)
+    parser.add_argument('--out', default=None, help="Write the encoded trajectory to this .npz file")
+    parser.add_argument('--csv', default=None, help="Also write the decoded trajectory to this CSV")
+    args = parser.parse_args()
+
+    params = {'site-selection-mode': args.site_selection_mode, 'spacing-mode': args.spacing_mode}
+    for name, value in (('wave-pause', args.wave_pause), ('wave-duration', args.wave_duration)):
+        if value is not None:
+            params[name] = value
+    # Warm-up, so the timed run does not pay for loading the map
+    IrpinModel(params, args.seed).run(max_ticks=50)
+    start = time.perf_counter()
+    IrpinModel(params, args.seed).run(max_ticks=args.max_ticks)
+    plain = time.perf_counter() - start
+    recorder, metrics, seconds = record_run(params, args.seed, args.every, args.series, args.max_ticks)
+
+    out = args.out or os.path.join(SCRIPT_DIR, "trajectory.npz")
+    size = recorder.save(out)
+    print(f"{metrics['[step]']} ticks ({metrics['battle-outcome']}), {min(recorder.count, recorder.capacity)} samples "
+          f"every {recorder.every} ticks, {size / 1024:.1f} KiB in {out}")
+    print(f"Run {plain:.2f} s without recording, {seconds:.2f} s with it ({seconds / plain - 1:+.1%})")
+    if args.csv:
+        load_trajectory(out).to_csv(args.csv, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+import os
+import sys
+import time
+import resource
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+
+import irpin_model
+import coarse_model
+import online_stats
+from run_cache import RunCache
+
+
+class SharedMap:
+    """Host side of a classified map placed in shared memory.
+
+    The terrain is copied once into a shared memory block; `handle` is the
+    small picklable description (block name, shape, dtype and the bridge
+    extents) a worker needs to attach to it.
+    """
+
+    def __init__(self, map_data):
+        terrain = map_data.terrain
+        self._memory = shared_memory.SharedMemory(create=True, size=terrain.nbytes)
+        np.ndarray(terrain.shape, terrain.dtype, buffer=self._memory.buf)[:] = terrain
+        self.handle = (self._memory.name, terrain.shape, terrain.dtype.str,
+                       list(map_data.bridge_start_x), list(map_data.bridge_end_x))
+
+    def close(self):
+        self._memory.close()
+        self._memory.unlink()
+
+
+def peak_rss_mib():
+    """Peak resident memory of this process in MiB (ru_maxrss is in bytes on macOS, KiB elsewhere)."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2 ** 20 if sys.platform == 'darwin' else peak / 1024
+
+
+# Ticks each worker_stats task simulates
+STATS_TICKS = 30
+
+_attached = []
+_started = None
+
+
+def _mark_started():
+    global _started
+    _started = time.perf_counter()
+
+
+def attach_worker(handle, map_file, routes=None):
+    """Worker initializer: installs a zero-copy view of the host's map (and the coarse routes, if given)."""
+    _mark_started()
+    name, shape, dtype, bridge_start_x, bridge_end_x = handle
+    memory = shared_memory.SharedMemory(name=name)
+    _attached.append(memory)   # the view is valid while the block stays mapped
+    terrain = np.ndarray(shape, np.dtype(dtype), buffer=memory.buf)
+    irpin_model.install_map(irpin_model.MapData(terrain, bridge_start_x, bridge_end_x), map_file)
+    if routes is not None:
+        coarse_model.install_routes(routes, map_file)
+
+
+class WorkerPool:
+    """Process pool whose workers share the host's read-only model tables instead of rebuilding them.
+
+    The host decodes and classifies the map (and, for coarse runs, measures
+    the free-flow routes) once. Workers attach to the terrain in shared memory
+    and receive the bridge extents and routes at startup, so neither their
+    memory nor their startup time grows with the pool size. Worker tasks live
+    in this module, which keeps workers started with "spawn" free of pandas.
+
+    Args:
+        processes: Number of worker processes.
+        map_file: Map the models load.
+        routes: Also share coarse_model.free_flow_routes with the workers.
+        start_method: multiprocessing start method (the platform default if None).
+    """
+
+    def __init__(self, processes, map_file=irpin_model.MAP_FILE, routes=False, start_method=None):
+        self.shared = SharedMap(irpin_model.load_map(map_file))
+        initargs = (self.shared.handle, map_file, coarse_model.free_flow_routes(map_file) if routes else None)
+        context = get_context(start_method) if start_method else None
+        self.executor = ProcessPoolExecutor(processes, mp_context=context, initializer=attach_worker,
+                                            initargs=initargs)
+
+    def map(self, fn, *iterables, chunksize=1):
+        return self.executor.map(fn, *iterables, chunksize=chunksize)
+
+    def submit(self, fn, *args):
+        return self.executor.submit(fn, *args)
+
+    def close(self):
+        self.executor.shutdown()
+        self.shared.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_python_group(params, seed, pauses, max_ticks):
+    """Runs the jobs of one Waves prefix group (or a single job) with the full model."""
+    if len(set(pauses)) > 1:
+        return irpin_model.run_wave_pause_grid(params, pauses, seed, max_ticks)
+    return {pauses[0]: irpin_model.IrpinModel(params, seed).run(max_ticks=max_ticks)}
+
+
+def run_coarse(params, seed, max_ticks, calibration):
+    """Runs one job with the coarse model."""
+    return coarse_model.CoarseIrpinModel(params, seed, calibration=calibration).run(max_ticks=max_ticks)
+
+
+def python_groups(jobs, max_ticks=None):
+    """Groups (params, seed) jobs into run_python_group tasks; Waves jobs differing only in wave-pause share one.
+
+    Returns:
+        list: (indices of the group's jobs, run_python_group arguments) pairs.
+    """
+    groups = {}
+    for index, (params, seed) in enumerate(jobs):
+        if params.get('spacing-mode') == "Waves":
+            shared = {k: v for k, v in params.items() if k != 'wave-pause'}
+            key = (RunCache.canonical_params(shared), seed)
+        else:
+            key = (index,)
+        groups.setdefault(key, []).append(index)
+    return [(indices, (jobs[indices[0]][0], jobs[indices[0]][1], [jobs[i][0].get('wave-pause') for i in indices],
+                       max_ticks))
+            for indices in groups.values()]
+
+
+def aggregate_chunk(coarse, jobs, keys, metrics, accuracy=0.01, max_ticks=None, calibration=None):
+    """Runs a chunk of jobs and returns only the online_stats.StatsAggregator state of their results."""
+    if coarse:
+        results = [run_coarse(params, seed, max_ticks, calibration) for params, seed in jobs]
+    else:
+        results = [None] * len(jobs)
+        for indices, task in python_groups(jobs, max_ticks):
+            output = run_python_group(*task)
+            for i in indices:
+                results[i] = output[jobs[i][0].get('wave-pause')]
+    return online_stats.aggregate_results(keys, metrics, jobs, results, accuracy)
+
+
+def worker_stats(_):
+    """Process id, seconds from initialization to a ready model and peak resident memory (MiB) of a worker.
+
+    The model then runs a few ticks, so the memory includes what the movement loop touches.
+    """
+    model = irpin_model.IrpinModel({}, 0)
+    seconds = time.perf_counter() - _started
+    model.run(max_ticks=STATS_TICKS)
+    return os.getpid(), seconds, peak_rss_mib()
+
+
+def main():
+    """Reports worker startup time and memory for several pool sizes, with and without the shared tables."""
+    parser = argparse.ArgumentParser(description=main.__doc__)
+    parser.add_argument('--workers', type=int, nargs='+', default=[4, 16, 64])
+    parser.add_argument('--start-method', default='spawn', choices=['spawn', 'forkserver', 'fork'])
+    args = parser.parse_args()
+
+    for processes in args.workers:
+        for shared in (False, True):
+            start = time.perf_counter()
+            if shared:
+                pool = WorkerPool(processes, start_method=args.start_method)
+            else:
+                # Forked workers would otherwise inherit the map the host already loaded
+                irpin_model._MAPS.clear()
+                pool = ProcessPoolExecutor(processes, mp_context=get_context(args.start_method),
+                                           initializer=_mark_started)
+            with pool:
+                # Several tasks per worker, so every worker reports
+                stats = {pid: (seconds, rss) for pid, seconds, rss in pool.map(worker_stats, range(processes * 4))}
+            seconds = [s for s, _ in stats.values()]
+            rss = [r for _, r in stats.values()]
+            print(f"{processes:3d} workers, {'shared' if shared else 'private'} tables: "
+                  f"pool ready in {time.perf_counter() - start:.2f} s, "
+                  f"worker startup {np.mean(seconds):.2f} s (max {max(seconds):.2f}), "
+                  f"peak memory {np.mean(rss):.0f} MiB per worker")
+
+
+if __name__ == '__main__':
+    main()